@@ -0,0 +1,192 @@
+import os
+import math
+import time
+import asyncio
+import threading
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+
+from ocr import OCR_WORKERS
+from metrics import registry
+
+# Límite por usuario (token bucket): imágenes por minuto y ráfaga máxima; 0 = sin límite
+OCR_RATE_PER_MINUTE = float(os.getenv("OCR_RATE_PER_MINUTE", "60"))
+OCR_RATE_BURST = int(os.getenv("OCR_RATE_BURST", "20"))
+# Límite global de OCR en curso y espera acotada para el resto
+OCR_MAX_IN_FLIGHT = int(os.getenv("OCR_MAX_IN_FLIGHT", "0")) or OCR_WORKERS * 2
+OCR_ADMISSION_QUEUE = int(os.getenv("OCR_ADMISSION_QUEUE", str(OCR_WORKERS * 4)))
+OCR_ADMISSION_WAIT_SECONDS = float(os.getenv("OCR_ADMISSION_WAIT_SECONDS", "10"))
+# Usuarios con bucket en memoria (se descartan los menos recientes)
+OCR_RATE_MAX_USERS = 10000
+
+class AdmissionRejected(Exception):
+    """Request rechazada antes de procesarse; el cliente puede reintentar en `retry_after` segundos."""
+
+    status_code = 503
+
+    def __init__(self, detail: str, retry_after: int):
+        super().__init__(detail)
+        self.detail = detail
+        self.retry_after = retry_after
+
+class RateLimited(AdmissionRejected):
+    """El usuario superó su cuota de OCR (429)."""
+
+    status_code = 429
+
+class Overloaded(AdmissionRejected):
+    """Hay demasiado OCR en curso y en espera (503)."""
+
+    status_code = 503
+
+class TokenBucket:
+    """
+    Token buckets por clave: `rate` tokens por segundo hasta `burst`.
+
+    Un costo mayor que `burst` se cobra entero: la clave queda en deuda
+    y espera a recuperarla antes de la próxima petición.
+
+    Guarda a lo sumo `max_keys` buckets; una clave descartada vuelve con
+    el bucket lleno, lo que solo puede favorecer al usuario.
+    """
+
+    def __init__(self, rate: float, burst: int, max_keys: int = OCR_RATE_MAX_USERS):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets: OrderedDict = OrderedDict()   # clave -> (tokens, última recarga)
+        self._lock = threading.Lock()
+
+    def take(self, key: str, cost: float = 1, now: float | None = None) -> float:
+        """
+        Consume `cost` tokens de la clave.
+
+        Returns:
+            0 si se consumieron, o los segundos que faltan para tenerlos
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            tokens, last = self._buckets.pop(key, (float(self.burst), now))
+            tokens = min(float(self.burst), tokens + (now - last) * self.rate)
+            # Una petición más grande que la ráfaga nunca cabría: se admite con
+            # el bucket lleno y se cobra completa, dejando los tokens en negativo
+            needed = min(cost, self.burst)
+            if tokens >= needed:
+                tokens -= cost
+                wait = 0.0
+            else:
+                wait = (needed - tokens) / self.rate
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return wait
+
+class AdmissionController:
+    """
+    Control de admisión del OCR: cuota por usuario y cupo global.
+
+    - `check_rate(user_id)` aplica el token bucket del usuario y lanza
+      `RateLimited` (429) si no le quedan tokens.
+    - `slot()` ocupa uno de los `max_in_flight` cupos de OCR. Si no hay
+      cupo espera en una cola de a lo sumo `max_waiting` requests, hasta
+      `wait_timeout` segundos; si la cola está llena o se agota la espera
+      lanza `Overloaded` (503) de inmediato.
+
+    Ambas excepciones traen `retry_after`: para la cuota, lo que falta
+    para el próximo token; para el cupo, una estimación a partir de la
+    duración media reciente del OCR.
+    """
+
+    def __init__(
+        self,
+        rate_per_minute: float = OCR_RATE_PER_MINUTE,
+        burst: int = OCR_RATE_BURST,
+        max_in_flight: int = OCR_MAX_IN_FLIGHT,
+        max_waiting: int = OCR_ADMISSION_QUEUE,
+        wait_timeout: float = OCR_ADMISSION_WAIT_SECONDS
+    ):
+        self.buckets = TokenBucket(rate_per_minute / 60, burst) if rate_per_minute > 0 else None
+        self.max_in_flight = max_in_flight
+        self.max_waiting = max_waiting
+        self.wait_timeout = wait_timeout
+        self._in_flight = 0
+        self._waiters: deque = deque()
+        self._avg_seconds = 1.0     # media móvil de la duración de un cupo
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    def retry_after(self) -> int:
+        """Segundos estimados hasta que la cola actual se vacíe."""
+        rounds = (len(self._waiters) + 1) / max(self.max_in_flight, 1)
+        return max(1, math.ceil(self._avg_seconds * rounds))
+
+    def check_rate(self, user_id: str, cost: int = 1):
+        """
+        Raises:
+            RateLimited: Si el usuario no tiene `cost` tokens disponibles
+        """
+        if self.buckets is None:
+            return
+        wait = self.buckets.take(user_id, cost)
+        if wait > 0:
+            ADMISSION_REJECTED.inc(reason="rate")
+            raise RateLimited("Demasiadas solicitudes de OCR, intente más tarde", max(1, math.ceil(wait)))
+
+    async def _acquire(self):
+        if self._in_flight < self.max_in_flight and not self._waiters:
+            self._in_flight += 1
+            return
+        if len(self._waiters) >= self.max_waiting:
+            ADMISSION_REJECTED.inc(reason="queue_full")
+            raise Overloaded("Servicio de OCR saturado, intente más tarde", self.retry_after())
+
+        # El cupo se entrega directamente al primero de la cola (ver _release)
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        try:
+            await asyncio.wait_for(future, self.wait_timeout)
+        except BaseException as e:
+            if future in self._waiters:
+                self._waiters.remove(future)
+            elif future.done() and not future.cancelled():
+                # El cupo llegó justo cuando se cancelaba la espera: devolverlo
+                self._release()
+            if isinstance(e, asyncio.TimeoutError):
+                ADMISSION_REJECTED.inc(reason="timeout")
+                raise Overloaded("Servicio de OCR saturado, intente más tarde", self.retry_after()) from None
+            raise
+
+    def _release(self):
+        while self._waiters:
+            future = self._waiters.popleft()
+            if not future.done():
+                future.set_result(None)
+                return
+        self._in_flight -= 1
+
+    @asynccontextmanager
+    async def slot(self):
+        """Ocupa un cupo de OCR durante el bloque `async with`."""
+        await self._acquire()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._avg_seconds = 0.8 * self._avg_seconds + 0.2 * (time.perf_counter() - start)
+            self._release()
+
+ADMISSION_REJECTED = registry.counter(
+    "ocr_admission_rejected_total", "Requests de OCR rechazadas por control de admisión", ("reason",)
+)
+
+# Control de admisión compartido por los endpoints de OCR
+ocr_admission = AdmissionController()
+
+registry.gauge("ocr_admission_in_flight", "Requests de OCR con cupo", fn=lambda: ocr_admission.in_flight)
+registry.gauge("ocr_admission_waiting", "Requests de OCR esperando cupo", fn=lambda: ocr_admission.waiting)
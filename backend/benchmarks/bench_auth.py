@@ -0,0 +1,56 @@
+"""
+Mide el costo de autenticación por request de `deps.get_current_user`,
+verificando el JWT en cada llamada (sin cache) y con el cache de tokens.
+
+Uso (desde backend/):
+    python benchmarks/bench_auth.py [--requests 20000]
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+os.environ.setdefault("SUPABASE_JWT_SECRET", "benchmark-secret")
+
+from jose import jwt
+
+import deps
+from deps import get_current_user, token_cache
+
+async def _run(authorization: str, requests: int, cached: bool) -> float:
+    """Segundos totales de `requests` llamadas a `get_current_user`."""
+    token_cache.clear()
+    token_cache.hits = token_cache.misses = 0
+    start = time.perf_counter()
+    for _ in range(requests):
+        if not cached:
+            token_cache.clear()
+        await get_current_user(authorization)
+    return time.perf_counter() - start
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark de autenticación por request")
+    parser.add_argument("--requests", type=int, default=20000)
+    args = parser.parse_args(argv)
+
+    token = jwt.encode(
+        {"sub": "benchmark-user", "exp": int(time.time()) + 3600, "role": "authenticated"},
+        deps.SUPABASE_JWT_SECRET,
+        algorithm="HS256"
+    )
+    authorization = f"Bearer {token}"
+
+    uncached = asyncio.run(_run(authorization, args.requests, cached=False))
+    cached = asyncio.run(_run(authorization, args.requests, cached=True))
+    per_request = lambda secs: secs / args.requests * 1e6
+    print(f"requests: {args.requests}")
+    print(f"sin cache: {per_request(uncached):.1f} µs/request")
+    print(f"con cache: {per_request(cached):.1f} µs/request (hits={token_cache.hits}, misses={token_cache.misses})")
+    print(f"speedup:   {uncached / cached:.1f}x")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,56 @@
+"""
+Compara el parser original con `receipt_parser.parse_boleta_text` sobre el
+corpus de regresión: verifica salidas idénticas y mide el tiempo de cada uno.
+
+Uso (desde backend/):
+    python benchmarks/bench_parser.py [--repeat 20]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+
+from legacy_parser import parse_boleta_text as legacy_parse
+from receipt_parser import parse_boleta_text
+from parser_corpus import CORPUS_PATH, encode_result
+
+def _time(parse, texts: list[str], repeat: int) -> float:
+    """Mejor tiempo (segundos) de `repeat` pasadas sobre todo el corpus."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for text in texts:
+            parse(text)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark de parse_boleta_text")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    with open(CORPUS_PATH, "r", encoding="utf-8") as f:
+        cases = json.load(f)
+    texts = [case["text"] for case in cases]
+
+    mismatches = [case for case in cases if encode_result(parse_boleta_text(case["text"])) != case["expected"]]
+    if mismatches:
+        print(f"{len(mismatches)} casos con salida distinta al parser original")
+        return 1
+
+    legacy = _time(legacy_parse, texts, args.repeat)
+    current = _time(parse_boleta_text, texts, args.repeat)
+    per_text = lambda secs: secs / len(texts) * 1e6
+    print(f"casos: {len(texts)} (salidas idénticas)")
+    print(f"original:   {legacy * 1000:.2f} ms ({per_text(legacy):.1f} µs/recibo)")
+    print(f"una pasada: {current * 1000:.2f} ms ({per_text(current):.1f} µs/recibo)")
+    print(f"speedup:    {legacy / current:.2f}x")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,123 @@
+"""
+Copia congelada del `parse_boleta_text` original (antes del parser de una pasada).
+
+Solo se usa para generar el corpus de regresión y comparar rendimiento;
+no debe modificarse.
+"""
+import re
+import logging
+from datetime import date
+
+logger = logging.getLogger(__name__)
+
+def parse_boleta_text(text: str) -> dict:
+    """
+    Parsea el texto extraído por OCR para obtener información estructurada.
+    
+    Args:
+        text: Texto extraído por OCR
+        
+    Returns:
+        Diccionario con información parseada
+    """
+    try:
+        # Buscar comercio (líneas que no contengan números)
+        lines = text.split('\n')
+        merchant = None
+        for line in lines[:8]:  # Buscar en las primeras 8 líneas
+            line_clean = line.strip()
+            if line_clean and not re.search(r'\d', line_clean) and len(line_clean) > 3:
+                merchant = line_clean
+                break
+
+        # Buscar total SOLO en la línea que contiene 'TOTAL'
+        total_amount = None
+        for line in lines:
+            if 'TOTAL' in line.upper():
+                match = re.search(r'TOTAL\s*[:]?[\$]?\s*(\d{1,3}(?:[.,]\d{3})*(?:[.,]\d{2,3})?)', line, re.IGNORECASE)
+                if match:
+                    total_str = match.group(1).replace('.', '').replace(',', '.')
+                    try:
+                        total_amount = float(total_str)
+                        break
+                    except ValueError:
+                        continue
+        # Buscar descripción (líneas entre encabezado y TOTAL)
+        description_lines = []
+        start_desc = False
+        for line in lines:
+            if re.search(r'DESCRIPCION|DESCRIPCIÓN|DESCRIPTION', line, re.IGNORECASE):
+                start_desc = True
+                continue
+            if 'TOTAL' in line.upper():
+                break
+            if start_desc and line.strip():
+                description_lines.append(line.strip())
+        description = ' '.join(description_lines) if description_lines else None
+
+        # Buscar fecha (varios formatos)
+        detected_date = None
+        date_patterns = [
+            r'(\d{1,2})[/-](\d{1,2})[/-](\d{2,4})',
+            r'(\d{4})[/-](\d{1,2})[/-](\d{1,2})'
+        ]
+        for pat in date_patterns:
+            for line in lines:
+                match = re.search(pat, line)
+                if match:
+                    try:
+                        if len(match.groups()) == 3:
+                            if pat.startswith(r'(\d{4})'):
+                                year, month, day = match.groups()
+                            else:
+                                day, month, year = match.groups()
+                            if len(year) == 2:
+                                year = '20' + year
+                            detected_date = date(int(year), int(month), int(day))
+                            break
+                    except ValueError:
+                        continue
+            if detected_date:
+                break
+
+        # Si no se detectó total, intentar buscar en toda la línea con variantes
+        if not total_amount:
+            for line in lines:
+                match = re.search(r'(TOTAL|Total|Importe|Monto|Amount|Sum)\s*[:]?[\$]?\s*(\d{1,3}(?:[.,]\d{3})*(?:[.,]\d{2,3})?)', line, re.IGNORECASE)
+                if match:
+                    total_str = match.group(2).replace('.', '').replace(',', '.')
+                    try:
+                        total_amount = float(total_str)
+                        break
+                    except ValueError:
+                        continue
+
+        # Si no se detectó fecha, intentar buscar con variantes
+        if not detected_date:
+            for line in lines:
+                match = re.search(r'(\d{2,4})[/-](\d{1,2})[/-](\d{1,2})', line)
+                if match:
+                    try:
+                        year, month, day = match.groups()
+                        if len(year) == 2:
+                            year = '20' + year
+                        detected_date = date(int(year), int(month), int(day))
+                        break
+                    except ValueError:
+                        continue
+
+        return {
+            "merchant": merchant,
+            "total_amount": total_amount,
+            "date": detected_date,
+            "description": description,
+            "confidence": 0.85  # Valor por defecto
+        }
+    except Exception as e:
+        logger.error(f"Error parseando texto OCR: {e}")
+        return {
+            "merchant": None,
+            "total_amount": None,
+            "date": None,
+            "confidence": 0.0
+        }
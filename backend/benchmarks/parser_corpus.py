@@ -0,0 +1,136 @@
+"""
+Corpus de regresión para `parse_boleta_text`.
+
+Reúne los textos de `boletas/boletas.json` y un conjunto determinista de
+recibos sintéticos (formatos de fecha, variantes de total, encabezados de
+descripción, fechas inválidas...) y guarda en `parser_corpus.json` la salida
+del parser original (`legacy_parser.py`) para cada uno.
+
+Uso (desde backend/):
+    python benchmarks/parser_corpus.py
+"""
+import os
+import sys
+import json
+import random
+from datetime import date
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BACKEND = os.path.dirname(HERE)
+CORPUS_PATH = os.path.join(HERE, "parser_corpus.json")
+BOLETAS_PATH = os.path.join(BACKEND, "boletas", "boletas.json")
+
+SEED = 20250806
+SYNTHETIC_RECEIPTS = 240
+
+_MERCHANTS = [
+    "Mercado Central", "SUPERMERCADO LIDER", "Farmacia Ahumada", "Café Haití",
+    "Shop", "Ferretería Imperial", "jumbo", "Restaurant El Parrón", "Copec"
+]
+_ITEMS = ["Pan", "Leche", "T-shirt", "Jeans", "Sneakers", "Café", "Tornillos", "Bencina 93"]
+_HEADERS = ["DESCRIPCION CANT PRECIO", "Descripción Cant Valor", "Description Qty Amount", "descripcion"]
+_TOTAL_LABELS = ["TOTAL", "Total", "TOTAL:", "Total: $", "TOTAL $", "total", "SUBTOTAL"]
+_FALLBACK_LABELS = ["Importe", "Monto:", "Amount $", "Sum", "IMPORTE TOTAL"]
+
+def _amount(rng: random.Random) -> str:
+    value = rng.choice([0, rng.randint(1, 999), rng.randint(1000, 999999)])
+    cents = rng.randint(0, 99)
+    style = rng.randrange(5)
+    if style == 0:
+        return str(value)
+    if style == 1:
+        return f"{value}.{cents:02d}"
+    if style == 2:
+        return f"{value:,}".replace(",", ".")               # 12.345 (miles CLP)
+    if style == 3:
+        return f"{value:,}".replace(",", ".") + f",{cents:02d}"
+    return f"{value:,}.{cents:02d}"                          # 12,345.67
+
+def _date(rng: random.Random) -> str:
+    year = rng.randint(2019, 2026)
+    month = rng.randint(1, 14)                               # incluye meses inválidos
+    day = rng.randint(1, 31)
+    sep = rng.choice("/-")
+    short = str(year)[2:]
+    return rng.choice([
+        f"{day:02d}{sep}{month:02d}{sep}{year}",
+        f"{day}{sep}{month}{sep}{short}",
+        f"{year}{sep}{month:02d}{sep}{day:02d}",
+        f"{short}{sep}{month}{sep}{day}",
+    ])
+
+def synthetic_receipt(rng: random.Random) -> str:
+    lines = []
+    if rng.random() < 0.3:
+        lines.append(f"RUT {rng.randint(10, 99)}.{rng.randint(100, 999)}.{rng.randint(100, 999)}-{rng.randint(0, 9)}")
+    if rng.random() < 0.2:
+        lines.append("")
+    lines.append(rng.choice(_MERCHANTS))
+    if rng.random() < 0.5:
+        lines.append(f"Av. Providencia {rng.randint(100, 3000)}")
+    for _ in range(rng.randint(0, 3)):
+        lines.append(f"Fecha: {_date(rng)}" if rng.random() < 0.5 else _date(rng) + f" {rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}")
+    if rng.random() < 0.7:
+        lines.append(rng.choice(_HEADERS))
+    for _ in range(rng.randint(0, 6)):
+        item = rng.choice(_ITEMS)
+        lines.append(f"{item} {rng.randint(1, 5)} ${_amount(rng)}" if rng.random() < 0.8 else "")
+    for _ in range(rng.randint(0, 2)):
+        lines.append(f"{rng.choice(_TOTAL_LABELS)} {_amount(rng)}")
+    if rng.random() < 0.4:
+        lines.append(f"{rng.choice(_FALLBACK_LABELS)} {_amount(rng)}")
+    if rng.random() < 0.3:
+        lines.append(f"Vencimiento {_date(rng)}")
+    if rng.random() < 0.2:
+        lines.append("Gracias por su compra")
+
+    text = "\n".join(lines)
+    if rng.random() < 0.15:
+        text = text.lower()
+    if rng.random() < 0.1:
+        text = text.replace("\n", "\r\n")
+    return text
+
+def corpus_texts() -> list[str]:
+    """Textos del corpus: recibos reales de `boletas.json` seguidos de los sintéticos."""
+    texts = []
+    with open(BOLETAS_PATH, "r", encoding="utf-8") as f:
+        for boleta in json.load(f):
+            for key in ("texto_extraido", "text"):
+                if boleta.get(key):
+                    texts.append(boleta[key])
+
+    # Casos borde fijos
+    texts += [
+        "",
+        "\n\n\n",
+        "Total: $50.00",
+        "TOTAL 0\nImporte 1.500",
+        "DESCRIPCION\nsin total",
+        "31/02/2024\n2024-02-30\n24-2-29",
+        "Comercio\nTOTAL 1.234.567,891",
+    ]
+
+    rng = random.Random(SEED)
+    texts += [synthetic_receipt(rng) for _ in range(SYNTHETIC_RECEIPTS)]
+    return texts
+
+def encode_result(result: dict) -> dict:
+    """Resultado del parser serializable a JSON (fechas en ISO)."""
+    result = dict(result)
+    if isinstance(result.get("date"), date):
+        result["date"] = result["date"].isoformat()
+    return result
+
+def main() -> int:
+    sys.path.insert(0, HERE)
+    from legacy_parser import parse_boleta_text
+
+    cases = [{"text": text, "expected": encode_result(parse_boleta_text(text))} for text in corpus_texts()]
+    with open(CORPUS_PATH, "w", encoding="utf-8") as f:
+        json.dump(cases, f, ensure_ascii=False, indent=1)
+    print(f"{len(cases)} casos escritos en {CORPUS_PATH}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,503 @@
+"""
+Suite de benchmarks de los caminos críticos de la API, con resultados en
+JSON y comparación contra una línea base.
+
+Casos:
+    parser            parse_boleta_text sobre el corpus generado (µs/recibo)
+    ocr               POST /ocr de punta a punta con recibos sintéticos
+                      dibujados con Pillow (requiere Tesseract, o --fake-ocr
+                      para medir todo menos Tesseract)
+    boletas[N]        GET /boletas: primera página, página a mitad de la
+                      tabla (OFFSET) y cursor a mitad de la tabla, sin cache
+                      de respuestas; además un sondeo sin cambios servido
+                      desde el cache y con If-None-Match (304)
+    stats[N]          GET /boletas/stats con y sin boleta_stats_rollup (sin
+                      cache de respuestas) y desde el cache
+    payload[N]        página de 100 boletas con texto OCR: serialización con
+                      json.dumps (camino por defecto de FastAPI), orjson y
+                      model_dump_json, y bytes enviados por /boletas sin
+                      comprimir, con gzip y con brotli
+    startup           arranque en frío de un worker: proceso nuevo que
+                      importa main_clean (sin DDL ni dependencias de OCR)
+
+Por defecto usa una base SQLite en benchmarks/.bench/ (BENCH_DATABASE_URL
+para apuntar a Postgres). Las boletas de cada tamaño se generan la primera
+vez y se reutilizan en las siguientes ejecuciones.
+
+Uso (desde backend/):
+    python benchmarks/suite.py [--only parser,boletas] [--sizes 10000,100000,1000000]
+    python benchmarks/suite.py --save-baseline          # guarda la línea base
+    python benchmarks/suite.py                          # compara y falla si hay regresiones
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import subprocess
+import argparse
+import platform
+import statistics
+from datetime import datetime, timedelta
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BACKEND = os.path.dirname(HERE)
+sys.path.insert(0, BACKEND)
+sys.path.insert(0, HERE)
+
+BENCH_DIR = os.path.join(HERE, ".bench")
+RESULTS_PATH = os.path.join(BENCH_DIR, "results.json")
+BASELINE_PATH = os.path.join(HERE, "baseline.json")
+
+CASES = ("parser", "ocr", "boletas", "stats", "payload", "startup")
+DEFAULT_SIZES = (10_000, 100_000)
+# Un caso es regresión si su valor supera la línea base en más de este margen
+DEFAULT_TOLERANCE = 0.3
+SEED_CHUNK = 10_000
+
+def _configure_environment():
+    """Variables que leen db.py, deps.py y main_clean.py al importarse."""
+    os.makedirs(BENCH_DIR, exist_ok=True)
+    database_url = os.getenv("BENCH_DATABASE_URL") or f"sqlite:///{os.path.join(BENCH_DIR, 'bench.db')}"
+    os.environ["DATABASE_URL"] = database_url
+    os.environ.setdefault("SUPABASE_JWT_SECRET", "benchmark-secret")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+def measure(fn, repeat: int, warmup: int = 2) -> dict:
+    """Milisegundos por llamada a `fn` (mediana, p95, media y mínimo de `repeat` llamadas)."""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        "unit": "ms",
+        "value": statistics.median(samples),
+        "p95": samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+        "mean": statistics.fmean(samples),
+        "min": samples[0],
+        "n": repeat,
+    }
+
+# --- Casos -----------------------------------------------------------------
+
+def bench_parser(args) -> dict:
+    from parser_corpus import corpus_texts
+    from receipt_parser import parse_boleta_text
+
+    texts = corpus_texts()
+    best = float("inf")
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        for text in texts:
+            parse_boleta_text(text)
+        best = min(best, time.perf_counter() - start)
+    return {
+        "parser": {
+            "unit": "us/recibo",
+            "value": best / len(texts) * 1e6,
+            "recibos_por_segundo": len(texts) / best,
+            "n": len(texts),
+        }
+    }
+
+def render_receipt(text: str) -> bytes:
+    """PNG de un recibo: texto negro sobre fondo blanco, como una foto escaneada."""
+    from io import BytesIO
+    from PIL import Image, ImageDraw, ImageFont
+
+    lines = text.splitlines() or [""]
+    try:
+        font = ImageFont.load_default(size=28)
+    except TypeError:                      # Pillow < 10.1
+        font = ImageFont.load_default()
+    image = Image.new("L", (900, 60 + 40 * len(lines)), 255)
+    draw = ImageDraw.Draw(image)
+    for index, line in enumerate(lines):
+        draw.text((40, 30 + 40 * index), line, fill=0, font=font)
+    buffer = BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+def bench_ocr(args, client) -> dict:
+    from unittest.mock import patch
+    from parser_corpus import synthetic_receipt
+    import main_clean
+    from main_clean import ocr_cache
+    from deps import get_current_user
+
+    name = "ocr[fake-ocr]" if args.fake_ocr else "ocr"
+    if not args.fake_ocr and shutil.which("tesseract") is None:
+        return {name: {"skipped": "tesseract no está instalado (use --fake-ocr)"}}
+
+    user_id = "bench-ocr"
+    _delete_user(user_id)
+    main_clean.app.dependency_overrides[get_current_user] = lambda: {"sub": user_id}
+
+    # Imágenes distintas en cada llamada: ni el cache de OCR ni la detección de duplicados las evitan
+    rng = random.Random(20250806)
+    receipts = [synthetic_receipt(rng) for _ in range(args.ocr_images)]
+    images = iter([render_receipt(text) for text in receipts * (1 + (args.repeat + 2) // len(receipts))])
+    fake_texts = iter(receipts * (1 + (args.repeat + 2) // len(receipts)))
+
+    async def fake_image_to_string(data, *_):
+        return next(fake_texts)
+
+    def post():
+        ocr_cache.clear()
+        response = client.post("/ocr", files={"file": ("bench.png", next(images), "image/png")})
+        if response.status_code != 200:
+            raise RuntimeError(f"/ocr respondió {response.status_code}: {response.text}")
+
+    try:
+        if args.fake_ocr:
+            with patch.object(main_clean.ocr_pool, "image_to_string", fake_image_to_string):
+                result = measure(post, args.repeat)
+        else:
+            result = measure(post, args.repeat)
+    finally:
+        main_clean.ocr_pool.shutdown()
+        _delete_user(user_id)
+    return {name: result}
+
+# Módulos que el proceso de la API no debería cargar al arrancar
+LAZY_MODULES = ("pytesseract", "PIL", "httpx")
+
+STARTUP_SCRIPT = (
+    "import sys, time\n"
+    "start = time.perf_counter()\n"
+    "import main_clean\n"
+    "print(time.perf_counter() - start)\n"
+    f"print(','.join(m for m in {LAZY_MODULES!r} if m in sys.modules))\n"
+)
+
+def bench_startup(args) -> dict:
+    imports, loaded = [], set()
+
+    def boot():
+        output = subprocess.run(
+            [sys.executable, "-c", STARTUP_SCRIPT],
+            cwd=BACKEND, env=os.environ, capture_output=True, text=True, check=True
+        ).stdout.splitlines()
+        imports.append(float(output[0]) * 1000)
+        loaded.update(name for name in output[1].split(",") if name)
+
+    process = measure(boot, max(5, args.repeat // 2), warmup=1)
+    imports = sorted(imports[1:])
+    return {
+        "startup_process": {**process, "lazy_modules_loaded": sorted(loaded)},
+        "startup_import": {"unit": "ms", "value": statistics.median(imports), "min": imports[0], "n": len(imports)},
+    }
+
+def _delete_user(user_id: str):
+    from db import SessionLocal
+    from models import Boleta, BoletaStatsRollup
+
+    with SessionLocal() as db:
+        db.query(Boleta).filter(Boleta.user_id == user_id).delete()
+        db.query(BoletaStatsRollup).filter(BoletaStatsRollup.user_id == user_id).delete()
+        db.commit()
+
+def seed_user(user_id: str, size: int):
+    """Genera `size` boletas del usuario (si no las tiene ya) y sus agregados."""
+    from sqlalchemy import func, insert, select
+    from parser_corpus import synthetic_receipt
+    from receipt_parser import parse_boleta_text
+    from db import SessionLocal
+    from models import Boleta
+    import boleta_texts
+    import rollup
+
+    with SessionLocal() as db:
+        if db.scalar(select(func.count()).select_from(Boleta).where(Boleta.user_id == user_id)) == size:
+            return
+    _delete_user(user_id)
+    print(f"  generando {size} boletas para {user_id}...", flush=True)
+
+    rng = random.Random(size)
+    templates = []
+    for _ in range(500):
+        text = synthetic_receipt(rng)
+        parsed = parse_boleta_text(text)
+        templates.append({key: parsed[key] for key in ("merchant", "total_amount", "date", "confidence")} | {"text": text})
+
+    start = datetime(2020, 1, 1)
+    with SessionLocal() as db:
+        for chunk_start in range(0, size, SEED_CHUNK):
+            rows = [
+                {
+                    **templates[index % len(templates)],
+                    "nombre_archivo": f"bench-{index}.jpg",
+                    "user_id": user_id,
+                    "fecha": start + timedelta(minutes=index),
+                }
+                for index in range(chunk_start, min(size, chunk_start + SEED_CHUNK))
+            ]
+            texts = [row.pop("text") for row in rows]
+            ids = db.scalars(insert(Boleta).returning(Boleta.id, sort_by_parameter_order=True), rows).all()
+            text_rows = [(boleta_id, row["merchant"], text) for boleta_id, row, text in zip(ids, rows, texts)]
+            for statement in boleta_texts.insert_statements(db.get_bind().dialect.name, text_rows):
+                db.execute(statement)
+            db.commit()
+        rollup.rebuild_rollups(db, user_id)
+
+def _uncached():
+    """Desactiva el cache de respuestas para medir las consultas."""
+    from unittest.mock import patch
+    from http_cache import response_cache
+
+    return patch.object(response_cache, "max_bytes", 0)
+
+def bench_boletas(args, client, size: int) -> dict:
+    from db import SessionLocal
+    from models import Boleta
+    from crud import encode_cursor
+    import main_clean
+    from deps import get_current_user
+
+    user_id = f"bench-{size}"
+    seed_user(user_id, size)
+    main_clean.app.dependency_overrides[get_current_user] = lambda: {"sub": user_id}
+
+    limit = 20
+    middle_page = max(1, size // limit // 2)
+    with SessionLocal() as db:
+        middle = (
+            db.query(Boleta).filter(Boleta.user_id == user_id)
+            .order_by(Boleta.fecha.desc(), Boleta.id.desc())
+            .offset((middle_page - 1) * limit).first()
+        )
+        cursor = encode_cursor(middle)
+
+    def get(url):
+        return lambda: _expect_ok(client.get(url))
+
+    with _uncached():
+        results = {
+            f"boletas_first_page[{size}]": measure(get(f"/boletas?limit={limit}"), args.repeat),
+            f"boletas_offset_middle[{size}]": measure(get(f"/boletas?limit={limit}&page={middle_page}"), args.repeat),
+            f"boletas_cursor_middle[{size}]": measure(get(f"/boletas?limit={limit}&cursor={cursor}"), args.repeat),
+        }
+    # Sondeo sin cambios: desde el cache de respuestas y con If-None-Match
+    url = f"/boletas?limit={limit}&page={middle_page}"
+    etag = _expect_ok(client.get(url)).headers["ETag"]
+    results[f"boletas_cached[{size}]"] = measure(get(url), args.repeat)
+    results[f"boletas_not_modified[{size}]"] = measure(
+        lambda: _expect_status(client.get(url, headers={"If-None-Match": etag}), 304), args.repeat
+    )
+    return results
+
+def bench_stats(args, client, size: int) -> dict:
+    from unittest.mock import patch
+    import main_clean
+    from deps import get_current_user
+
+    user_id = f"bench-{size}"
+    seed_user(user_id, size)
+    main_clean.app.dependency_overrides[get_current_user] = lambda: {"sub": user_id}
+
+    get = lambda: _expect_ok(client.get("/boletas/stats"))
+    with _uncached():
+        results = {f"stats_rollup[{size}]": measure(get, args.repeat)}
+        with patch.object(main_clean, "STATS_USE_ROLLUP", False):
+            results[f"stats_scan[{size}]"] = measure(get, max(3, args.repeat // 4))
+    results[f"stats_cached[{size}]"] = measure(get, args.repeat)
+    return results
+
+def bench_payload(args, client, size: int) -> dict:
+    import asyncio
+    from fastapi.responses import JSONResponse, ORJSONResponse
+    from fastapi.routing import serialize_response
+    from fastapi.utils import create_model_field
+    from db import SessionLocal
+    from crud import list_boletas
+    from schemas import BoletaOut, BoletaListResponse
+    import main_clean
+    from deps import get_current_user
+
+    user_id = f"bench-{size}"
+    seed_user(user_id, size)
+    main_clean.app.dependency_overrides[get_current_user] = lambda: {"sub": user_id}
+
+    limit = 100
+    with SessionLocal() as db:
+        items, total = list_boletas(db, user_id, 1, limit, include_text=True)
+    model = BoletaListResponse(
+        items=[BoletaOut.model_validate(item) for item in items],
+        total=total, page=1, limit=limit, pages=(total + limit - 1) // limit
+    )
+
+    # Lo que hace FastAPI con un response_model: validar, serializar y renderizar
+    field = create_model_field("response", BoletaListResponse, mode="serialization")
+    loop = asyncio.new_event_loop()
+
+    def fastapi_path(response_class):
+        def render():
+            content = loop.run_until_complete(serialize_response(field=field, response_content=model))
+            return response_class(content).body
+        return render
+
+    results = {}
+    try:
+        for name, render in (
+            ("json", fastapi_path(JSONResponse)),
+            ("orjson", fastapi_path(ORJSONResponse)),
+            ("model_dump_json", lambda: model.model_dump_json().encode("utf-8")),
+        ):
+            results[f"payload_serialize_{name}[{size}]"] = {
+                **measure(render, args.repeat), "bytes": len(render())
+            }
+    finally:
+        loop.close()
+
+    url = f"/boletas?limit={limit}&include_text=true"
+    with _uncached():
+        for encoding in ("identity", "gzip", "br"):
+            headers = {"Accept-Encoding": encoding}
+            get = lambda: _expect_ok(client.get(url, headers=headers))
+            response = get()
+            results[f"payload_boletas_{encoding}[{size}]"] = {
+                **measure(get, args.repeat),
+                "bytes": int(response.headers["content-length"]),
+                "content_encoding": response.headers.get("content-encoding", "identity"),
+            }
+    return results
+
+def _expect_ok(response):
+    return _expect_status(response, 200)
+
+def _expect_status(response, status: int):
+    if response.status_code != status:
+        raise RuntimeError(f"{response.request.url} respondió {response.status_code}: {response.text}")
+    return response
+
+# --- Resultados y línea base -------------------------------------------------
+
+def compare_results(current: dict, baseline: dict, tolerance: float = DEFAULT_TOLERANCE) -> list:
+    """
+    Compara dos resultados de la suite (menor es mejor en todos los casos).
+
+    Returns:
+        Lista de (caso, valor base, valor actual, cambio relativo) de los
+        casos que empeoraron más que `tolerance`
+    """
+    regressions = []
+    for name, result in current["results"].items():
+        base = baseline.get("results", {}).get(name)
+        if not base or "value" not in base or "value" not in result:
+            continue
+        change = (result["value"] - base["value"]) / base["value"] if base["value"] else 0.0
+        if change > tolerance:
+            regressions.append((name, base["value"], result["value"], change))
+    return regressions
+
+def _print_results(current: dict, baseline: dict | None):
+    base_results = (baseline or {}).get("results", {})
+    for name, result in current["results"].items():
+        if "skipped" in result:
+            print(f"{name:40} omitido: {result['skipped']}")
+            continue
+        line = f"{name:40} {result['value']:10.3f} {result['unit']}"
+        if "bytes" in result:
+            line += f"  {result['bytes']:>9} bytes"
+        base = base_results.get(name)
+        if base and base.get("value"):
+            line += f"   (base {base['value']:.3f}, {100 * (result['value'] / base['value'] - 1):+.1f}%)"
+        print(line)
+
+def _metadata(args) -> dict:
+    return {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "database": os.environ["DATABASE_URL"].split("://")[0],
+        "sizes": args.sizes,
+        "repeat": args.repeat,
+        "fake_ocr": args.fake_ocr,
+    }
+
+def run(args) -> dict:
+    _configure_environment()
+    results = {}
+    if "parser" in args.only:
+        results.update(bench_parser(args))
+    if "startup" in args.only:
+        results.update(bench_startup(args))
+
+    if set(args.only) & {"ocr", "boletas", "stats", "payload"}:
+        from fastapi.testclient import TestClient
+        from db import create_schema
+        import main_clean
+
+        # La app ya no crea tablas al importarse (DB_CREATE_SCHEMA)
+        create_schema()
+        client = TestClient(main_clean.app)
+        try:
+            if "ocr" in args.only:
+                results.update(bench_ocr(args, client))
+            for size in args.sizes:
+                if "boletas" in args.only:
+                    results.update(bench_boletas(args, client, size))
+                if "stats" in args.only:
+                    results.update(bench_stats(args, client, size))
+                if "payload" in args.only:
+                    results.update(bench_payload(args, client, size))
+        finally:
+            main_clean.app.dependency_overrides.clear()
+    return {"meta": _metadata(args), "results": results}
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Suite de benchmarks de la API")
+    parser.add_argument("--only", default=",".join(CASES), help=f"Casos separados por coma ({', '.join(CASES)})")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)), help="Boletas por usuario para /boletas y /boletas/stats")
+    parser.add_argument("--repeat", type=int, default=20, help="Llamadas medidas por caso")
+    parser.add_argument("--ocr-images", type=int, default=10, help="Recibos sintéticos distintos para /ocr")
+    parser.add_argument("--fake-ocr", action="store_true", help="Reemplazar Tesseract por el texto del recibo generado")
+    parser.add_argument("--output", default=RESULTS_PATH, help="Archivo JSON de resultados")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="Línea base con la que comparar")
+    parser.add_argument("--save-baseline", action="store_true", help="Guardar estos resultados como línea base")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="Empeoramiento tolerado (0.25 = 25%%)")
+    args = parser.parse_args(argv)
+    args.only = [case.strip() for case in args.only.split(",") if case.strip()]
+    args.sizes = [int(size) for size in args.sizes.split(",") if size.strip()]
+    unknown = set(args.only) - set(CASES)
+    if unknown:
+        parser.error(f"Casos desconocidos: {', '.join(sorted(unknown))}")
+
+    current = run(args)
+
+    baseline = None
+    if not args.save_baseline and os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    _print_results(current, baseline)
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(current, f, indent=1)
+    print(f"\nResultados en {args.output}")
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(current, f, indent=1)
+        print(f"Línea base guardada en {args.baseline}")
+        return 0
+    if baseline is None:
+        print(f"Sin línea base ({args.baseline}); use --save-baseline para crearla")
+        return 0
+
+    regressions = compare_results(current, baseline, args.tolerance)
+    if regressions:
+        print(f"\nREGRESIONES (más de {args.tolerance:.0%} peor que la línea base):")
+        for name, base, value, change in regressions:
+            print(f"  {name}: {base:.3f} -> {value:.3f} ({change:+.1%})")
+        return 1
+    print(f"Sin regresiones respecto de la línea base (tolerancia {args.tolerance:.0%})")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,130 @@
+import sys
+import logging
+import argparse
+from typing import Iterable, Optional
+from dotenv import load_dotenv
+
+# Cargar variables de entorno (también se usa como script)
+load_dotenv()
+
+from sqlalchemy import event, insert, select, table, column
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from db import SessionLocal
+from models import BoletaText
+import search
+import versions
+
+logger = logging.getLogger(__name__)
+
+# Texto OCR en boleta_texts (comprimido, ver models.CompressedText). Las
+# funciones de crud.py y crud_async.py ejecutan estas sentencias en la misma
+# transacción que inserta las boletas.
+
+_texts = BoletaText.__table__
+
+def _text_size(text: Optional[str]) -> int:
+    return len(text.encode("utf-8")) if text else 0
+
+def insert_statements(dialect_name: str, rows: Iterable[tuple]) -> list:
+    """
+    INSERTs del texto OCR (y su documento de búsqueda) de boletas nuevas.
+
+    Args:
+        dialect_name: Dialecto de la conexión ('postgresql' o 'sqlite')
+        rows: Tuplas (boleta_id, merchant, text); `text` puede ser None
+    """
+    rows = list(rows)
+    if not rows:
+        return []
+    values = [
+        {"boleta_id": boleta_id, "text": text, "text_size": _text_size(text)}
+        for boleta_id, _, text in rows
+    ]
+    if dialect_name == "postgresql":
+        for value, (_, merchant, text) in zip(values, rows):
+            value["search_vector"] = search.pg_search_vector(merchant, text)
+        # El trigger de sql/007 ya creó un registro vacío para cada boleta
+        statement = pg_insert(_texts).values(values)
+        return [statement.on_conflict_do_update(
+            index_elements=[_texts.c.boleta_id],
+            set_={name: statement.excluded[name] for name in ("text", "text_size", "search_vector")},
+        )]
+    if dialect_name == "sqlite":
+        return [
+            insert(_texts).values(values),
+            insert(search.sqlite_fts).values([
+                {"rowid": boleta_id, "merchant": merchant, "text": text}
+                for boleta_id, merchant, text in rows
+            ]),
+        ]
+    raise NotImplementedError(f"Dialecto no soportado para textos: {dialect_name}")
+
+# SQLite no aplica ON DELETE CASCADE sin PRAGMA foreign_keys: borrar con un trigger
+SQLITE_CASCADE_DDL = (
+    "CREATE TRIGGER IF NOT EXISTS boleta_texts_ad AFTER DELETE ON boletas BEGIN "
+    "DELETE FROM boleta_texts WHERE boleta_id = old.id; END"
+)
+
+@event.listens_for(_texts, "after_create")
+def create_sqlite_cascade(target, connection, **kw):
+    """Borra el texto de las boletas eliminadas en SQLite (desarrollo y tests)."""
+    if connection.dialect.name == "sqlite":
+        connection.exec_driver_sql(SQLITE_CASCADE_DDL)
+
+# `boletas.text` sigue en Postgres para los inserts del dashboard, pero el modelo ya no la tiene
+_legacy_boletas = table("boletas", column("id"), column("merchant"), column("text"), column("user_id"))
+
+def migrate_texts(db: Session, batch_size: int = 1000) -> int:
+    """
+    Copia `boletas.text` a boleta_texts para las boletas que aún no tienen registro.
+
+    Paso previo a sql/008_boletas_clear_text.sql; se puede interrumpir y
+    volver a ejecutar. Incrementa la versión de los usuarios de cada lote
+    para invalidar ETags y respuestas en cache armadas antes de migrar.
+
+    Returns:
+        Cantidad de boletas migradas
+    """
+    dialect_name = db.get_bind().dialect.name
+    migrated = 0
+    last_id = 0
+    while True:
+        rows = db.execute(
+            select(
+                _legacy_boletas.c.id, _legacy_boletas.c.merchant, _legacy_boletas.c.text,
+                _legacy_boletas.c.user_id
+            )
+            .outerjoin(_texts, _texts.c.boleta_id == _legacy_boletas.c.id)
+            .where(_texts.c.boleta_id.is_(None), _legacy_boletas.c.id > last_id)
+            .order_by(_legacy_boletas.c.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            return migrated
+        last_id = rows[-1].id
+        for statement in insert_statements(dialect_name, [(row.id, row.merchant, row.text) for row in rows]):
+            db.execute(statement)
+        db.execute(versions.bump_statement(dialect_name, [row.user_id for row in rows]))
+        db.commit()
+        migrated += len(rows)
+        logger.info(f"Textos migrados: {migrated}")
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Mantenimiento de boleta_texts")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    subcommands.add_parser("migrate", help="Copiar boletas.text a boleta_texts (antes de sql/008)")
+    parser.parse_args(argv)
+
+    db = SessionLocal()
+    try:
+        migrated = migrate_texts(db)
+        print(f"Texto OCR migrado para {migrated} boletas")
+        return 0
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
@@ -0,0 +1,120 @@
+import os
+from typing import Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.middleware.gzip import GZipResponder, IdentityResponder
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:     # brotli es opcional: sin él solo se ofrece gzip
+    brotli = None
+
+# Compresión de respuestas según Accept-Encoding (brotli o gzip)
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+COMPRESS_GZIP_LEVEL = int(os.getenv("COMPRESS_GZIP_LEVEL", "6"))
+# Calidades altas de brotli son para contenido estático; 4-5 rinde más que gzip -6 en JSON
+COMPRESS_BROTLI_QUALITY = int(os.getenv("COMPRESS_BROTLI_QUALITY", "4"))
+
+def parse_accept_encoding(header: str) -> dict:
+    """'br;q=0.8, gzip' -> {'br': 0.8, 'gzip': 1.0} (codificaciones en minúsculas)."""
+    weights = {}
+    for part in header.split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        weight = 1.0
+        params = params.strip().lower()
+        if params.startswith("q="):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[coding] = weight
+    return weights
+
+def choose_encoding(header: Optional[str], brotli_available: bool = brotli is not None) -> Optional[str]:
+    """
+    Codificación a usar para un Accept-Encoding: 'br', 'gzip' o None.
+
+    A igual peso se prefiere brotli, que en JSON comprime más a menor costo.
+    """
+    if not header:
+        return None
+    weights = parse_accept_encoding(header)
+    wildcard = weights.get("*", 0.0)
+    candidates = (("br", 2), ("gzip", 1)) if brotli_available else (("gzip", 1),)
+    best, best_key = None, (0.0, 0)
+    for coding, preference in candidates:
+        key = (weights.get(coding, wildcard), preference)
+        if key[0] > 0 and key > best_key:
+            best, best_key = coding, key
+    return best
+
+class _WeakETagMixin:
+    """Un ETag fuerte identifica los bytes sin comprimir: al comprimir pasa a débil (como nginx)."""
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        async def send_weak_etag(message):
+            # content_encoding_set: la respuesta ya venía codificada, no la tocamos
+            if message["type"] == "http.response.start" and not self.content_encoding_set:
+                headers = MutableHeaders(raw=message["headers"])
+                etag = headers.get("etag")
+                if "content-encoding" in headers and etag and not etag.startswith("W/"):
+                    headers["ETag"] = "W/" + etag
+            await send(message)
+
+        await super().__call__(scope, receive, send_weak_etag)
+
+class _GZipResponder(_WeakETagMixin, GZipResponder):
+    pass
+
+class _BrotliResponder(_WeakETagMixin, IdentityResponder):
+    content_encoding = "br"
+
+    def __init__(self, app: ASGIApp, minimum_size: int, quality: int):
+        super().__init__(app, minimum_size)
+        self.compressor = brotli.Compressor(quality=quality)
+
+    def apply_compression(self, body: bytes, *, more_body: bool) -> bytes:
+        data = self.compressor.process(body)
+        if not more_body:
+            data += self.compressor.finish()
+        return data
+
+class CompressionMiddleware:
+    """
+    Comprime respuestas de al menos `minimum_size` bytes con brotli o gzip.
+
+    Usa los responders de Starlette (respuestas completas y en streaming,
+    respeta un Content-Encoding ya puesto, agrega `Vary: Accept-Encoding`)
+    y elige la codificación según los pesos de Accept-Encoding.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = COMPRESS_MIN_BYTES,
+        gzip_level: int = COMPRESS_GZIP_LEVEL,
+        brotli_quality: int = COMPRESS_BROTLI_QUALITY
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding"))
+        if encoding == "br":
+            responder = _BrotliResponder(self.app, self.minimum_size, self.brotli_quality)
+        elif encoding == "gzip":
+            responder = _GZipResponder(self.app, self.minimum_size, compresslevel=self.gzip_level)
+        else:
+            await self.app(scope, receive, send)
+            return
+        await responder(scope, receive, send)
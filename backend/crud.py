@@ -1,35 +1,215 @@
+import base64
 import logging
-from sqlalchemy.orm import Session
-from sqlalchemy import desc
-from typing import Tuple, List
-from models import Boleta
+from datetime import date, datetime, timedelta
+from sqlalchemy.orm import Session, undefer
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy import desc, update, insert, or_, and_, tuple_, select
+from typing import Tuple, List, Optional, Iterator
+from models import Boleta, OCRJob
 from schemas import BoletaCreate
+import dedup
+import rollup
+import search
+import versions
+import boleta_texts
 
 logger = logging.getLogger(__name__)
 
+# Columnas de la vista de lista: todo menos el texto OCR (ver schemas.BoletaSummary)
+BOLETA_SUMMARY_COLUMNS = (
+    Boleta.id, Boleta.nombre_archivo, Boleta.merchant, Boleta.total_amount,
+    Boleta.date, Boleta.confidence, Boleta.fecha
+)
+
+def _boleta_columns(boleta_data: dict) -> dict:
+    """Descarta claves que no son columnas de `boletas` (p.ej. 'description' del parser)."""
+    columns = Boleta.__table__.columns
+    return {key: value for key, value in boleta_data.items() if key in columns}
+
+def _add_texts(db: Session, boletas: List[Boleta], texts: List[Optional[str]]) -> None:
+    """Guarda el texto OCR de boletas recién insertadas en `boleta_texts` (misma transacción)."""
+    rows = [(boleta.id, boleta.merchant, text) for boleta, text in zip(boletas, texts)]
+    for statement in boleta_texts.insert_statements(db.get_bind().dialect.name, rows):
+        db.execute(statement)
+
+def get_boletas_version(db: Session, user_id: str) -> int:
+    """Versión actual de las boletas del usuario (0 si nunca cambiaron)."""
+    return db.scalar(versions.version_statement(user_id)) or 0
+
+def find_duplicate(
+    db: Session,
+    user_id: str,
+    image_hash: Optional[str] = None,
+    fingerprint: Optional[str] = None
+) -> Boleta | None:
+    """
+    Busca una boleta del usuario con la misma imagen o la misma huella.
+    
+    Returns:
+        Boleta existente marcada en `duplicate` ('image' o 'fingerprint'), o None
+    """
+    statement = dedup.duplicate_statement(user_id, image_hash, fingerprint)
+    if statement is None:
+        return None
+    return dedup.pick_duplicate(db.scalars(statement), image_hash)
+
 def create_boleta(db: Session, boleta_data: dict) -> Boleta:
     """
     Crea una nueva boleta en la base de datos.
     
+    Si el usuario ya tiene una boleta con la misma imagen (`image_hash`) o
+    con el mismo comercio, monto y fecha (ver dedup.py), no inserta nada y
+    devuelve la existente con `duplicate` indicando el criterio.
+    
     Args:
         db: Sesión de base de datos
         boleta_data: Datos de la boleta a crear
         
     Returns:
-        Boleta creada
+        Boleta creada, o la existente si es duplicada
     """
+    boleta_data = dedup.with_fingerprint(boleta_data)
+    user_id = boleta_data.get("user_id")
+    image_hash = boleta_data.get("image_hash")
+    fingerprint = boleta_data.get("fingerprint")
     try:
-        boleta = Boleta(**boleta_data)
+        existing = find_duplicate(db, user_id, image_hash, fingerprint)
+        if existing is not None:
+            logger.info(f"Boleta duplicada ({existing.duplicate}) de ID {existing.id}, no se inserta")
+            return existing
+        
+        boleta = Boleta(**_boleta_columns(boleta_data))
         db.add(boleta)
+        db.flush()
+        _add_texts(db, [boleta], [boleta_data.get("text")])
         db.commit()
         db.refresh(boleta)
+        # El texto ya se conoce: evitar releerlo de boleta_texts
+        set_committed_value(boleta, "text", boleta_data.get("text"))
         logger.info(f"Boleta creada exitosamente: ID {boleta.id}")
         return boleta
+    except IntegrityError:
+        # Otra petición insertó la misma imagen entre la búsqueda y el INSERT
+        db.rollback()
+        existing = find_duplicate(db, user_id, image_hash, fingerprint)
+        if existing is None:
+            raise
+        return existing
     except Exception as e:
         db.rollback()
         logger.error(f"Error creando boleta: {e}")
         raise
 
+def _existing_duplicates(db: Session, rows: List[dict]) -> dict:
+    """
+    Boletas ya guardadas con la misma imagen o huella que alguna de `rows`,
+    en una sola consulta.
+    
+    Returns:
+        Diccionario (user_id, criterio, hash) -> Boleta
+    """
+    keys: dict = {}
+    for row in rows:
+        image_hashes, fingerprints = keys.setdefault(row["user_id"], (set(), set()))
+        if row.get("image_hash"):
+            image_hashes.add(row["image_hash"])
+        if row.get("fingerprint") and dedup.DEDUP_FINGERPRINT:
+            fingerprints.add(row["fingerprint"])
+    
+    conditions = [
+        and_(Boleta.user_id == user_id, or_(Boleta.image_hash.in_(image_hashes), Boleta.fingerprint.in_(fingerprints)))
+        for user_id, (image_hashes, fingerprints) in keys.items()
+        if image_hashes or fingerprints
+    ]
+    if not conditions:
+        return {}
+    
+    existing = {}
+    statement = select(Boleta).options(undefer(Boleta.text)).where(or_(*conditions)).order_by(Boleta.id)
+    for boleta in db.scalars(statement):
+        if boleta.image_hash:
+            existing.setdefault((boleta.user_id, dedup.IMAGE, boleta.image_hash), boleta)
+        if boleta.fingerprint:
+            existing.setdefault((boleta.user_id, dedup.FINGERPRINT, boleta.fingerprint), boleta)
+    return existing
+
+def _duplicate_keys(row: dict) -> List[tuple]:
+    """Claves de búsqueda de una fila, la de imagen primero."""
+    keys = []
+    if row.get("image_hash"):
+        keys.append((row["user_id"], dedup.IMAGE, row["image_hash"]))
+    if row.get("fingerprint") and dedup.DEDUP_FINGERPRINT:
+        keys.append((row["user_id"], dedup.FINGERPRINT, row["fingerprint"]))
+    return keys
+
+def create_boletas_bulk(db: Session, boletas_data: List[dict]) -> List[Boleta]:
+    """
+    Crea varias boletas en una sola transacción con un INSERT masivo.
+    
+    Las duplicadas (contra la base o dentro del mismo lote) no se insertan:
+    en su lugar se devuelve una copia de la boleta original con `duplicate`
+    indicando el criterio, como en `create_boleta`.
+    
+    Args:
+        db: Sesión de base de datos
+        boletas_data: Lista de datos de boletas a crear
+        
+    Returns:
+        Boletas creadas o existentes, en el mismo orden que `boletas_data`
+    """
+    if not boletas_data:
+        return []
+    
+    try:
+        rows = [_boleta_columns(dedup.with_fingerprint(data)) for data in boletas_data]
+        existing = _existing_duplicates(db, rows)
+        
+        results: List[Optional[Boleta]] = [None] * len(rows)
+        new_rows: List[dict] = []
+        new_texts: List[Optional[str]] = []
+        from_batch: List[tuple] = []            # (índice, índice en new_rows, criterio o None)
+        first_in_batch: dict = {}
+        for index, row in enumerate(rows):
+            keys = _duplicate_keys(row)
+            match = next((key for key in keys if key in existing), None)
+            if match is not None:
+                results[index] = dedup.flagged_copy(existing[match], match[1])
+                continue
+            match = next((key for key in keys if key in first_in_batch), None)
+            if match is not None:
+                from_batch.append((index, first_in_batch[match], match[1]))
+                continue
+            for key in keys:
+                first_in_batch[key] = len(new_rows)
+            from_batch.append((index, len(new_rows), None))
+            new_rows.append(row)
+            new_texts.append(boletas_data[index].get("text"))
+        
+        boletas = []
+        if new_rows:
+            boletas = list(db.scalars(
+                insert(Boleta).returning(Boleta, sort_by_parameter_order=True),
+                new_rows
+            ))
+            _add_texts(db, boletas, new_texts)
+        # Separar de la sesión antes del commit para no recargar cada fila después
+        for boleta, text in zip(boletas, new_texts):
+            set_committed_value(boleta, "text", text)
+            db.expunge(boleta)
+        db.commit()
+        
+        for index, new_index, kind in from_batch:
+            boleta = boletas[new_index]
+            results[index] = boleta if kind is None else dedup.flagged_copy(boleta, kind)
+        
+        logger.info(f"{len(boletas)} boletas creadas en lote ({len(rows) - len(boletas)} duplicadas)")
+        return results
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Error creando boletas en lote: {e}")
+        raise
+
 def get_boleta_by_id(db: Session, boleta_id: int, user_id: str) -> Boleta | None:
     """
     Obtiene una boleta por ID, solo si pertenece al usuario.
@@ -43,7 +223,7 @@ def get_boleta_by_id(db: Session, boleta_id: int, user_id: str) -> Boleta | None
         Boleta si existe y pertenece al usuario, None en caso contrario
     """
     try:
-        return db.query(Boleta).filter(
+        return db.query(Boleta).options(undefer(Boleta.text)).filter(
             Boleta.id == boleta_id,
             Boleta.user_id == user_id
         ).first()
@@ -55,8 +235,10 @@ def list_boletas(
     db: Session, 
     user_id: str, 
     page: int = 1, 
-    limit: int = 20
-) -> Tuple[List[Boleta], int]:
+    limit: int = 20,
+    include_total: bool = True,
+    include_text: bool = True
+) -> Tuple[List[Boleta], Optional[int]]:
     """
     Lista boletas del usuario con paginación.
     
@@ -65,6 +247,9 @@ def list_boletas(
         user_id: ID del usuario
         page: Número de página (1-based)
         limit: Límite de items por página
+        include_total: Si es False no se ejecuta el COUNT y total es None
+        include_text: Si es False solo se leen `BOLETA_SUMMARY_COLUMNS`
+            (filas en vez de objetos Boleta)
         
     Returns:
         Tupla con (items, total)
@@ -74,10 +259,15 @@ def list_boletas(
         query = db.query(Boleta).filter(Boleta.user_id == user_id)
         
         # Contar total
-        total = query.count()
+        total = query.count() if include_total else None
         
-        # Aplicar paginación y ordenamiento
-        items = query.order_by(desc(Boleta.fecha)).offset(
+        if not include_text:
+            query = query.with_entities(*BOLETA_SUMMARY_COLUMNS)
+        else:
+            query = query.options(undefer(Boleta.text))
+        
+        # Aplicar paginación y ordenamiento (id desempata fechas iguales)
+        items = query.order_by(desc(Boleta.fecha), desc(Boleta.id)).offset(
             (page - 1) * limit
         ).limit(limit).all()
         
@@ -86,7 +276,135 @@ def list_boletas(
         
     except Exception as e:
         logger.error(f"Error listando boletas para usuario {user_id}: {e}")
-        return [], 0
+        return [], 0 if include_total else None
+
+class InvalidCursor(ValueError):
+    """El cursor de paginación no fue generado por `encode_cursor`."""
+
+def encode_cursor(boleta: Boleta) -> str:
+    """Cursor opaco que apunta a la posición de una boleta en el orden (fecha, id) desc."""
+    raw = f"{boleta.fecha.isoformat()}|{boleta.id}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """
+    Decodifica un cursor generado por `encode_cursor`.
+    
+    Raises:
+        InvalidCursor: Si el cursor no es válido
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8")
+        fecha, boleta_id = raw.split("|")
+        return datetime.fromisoformat(fecha), int(boleta_id)
+    except (UnicodeError, ValueError, TypeError) as e:
+        raise InvalidCursor(f"Cursor inválido: {cursor}") from e
+
+def list_boletas_after(
+    db: Session,
+    user_id: str,
+    cursor: Optional[str] = None,
+    limit: int = 20,
+    include_total: bool = False,
+    include_text: bool = True
+) -> Tuple[List[Boleta], Optional[str], Optional[int]]:
+    """
+    Lista boletas del usuario con paginación por cursor (keyset).
+    
+    Recorre `boletas_user_fecha_idx` desde la posición del cursor, por lo
+    que el costo de una página no depende de su profundidad.
+    
+    Args:
+        db: Sesión de base de datos
+        user_id: ID del usuario
+        cursor: Cursor de la página anterior (None para la primera)
+        limit: Límite de items por página
+        include_total: Si es True también se cuenta el total de boletas
+        include_text: Si es False solo se leen `BOLETA_SUMMARY_COLUMNS`
+        
+    Returns:
+        Tupla con (items, next_cursor, total)
+        
+    Raises:
+        InvalidCursor: Si el cursor no es válido
+    """
+    query = db.query(Boleta).filter(Boleta.user_id == user_id)
+    total = query.count() if include_total else None
+    if not include_text:
+        query = query.with_entities(*BOLETA_SUMMARY_COLUMNS)
+    else:
+        query = query.options(undefer(Boleta.text))
+    
+    if cursor:
+        fecha, boleta_id = decode_cursor(cursor)
+        query = query.filter(tuple_(Boleta.fecha, Boleta.id) < tuple_(fecha, boleta_id))
+    
+    # Se pide un item extra para saber si hay página siguiente
+    items = query.order_by(desc(Boleta.fecha), desc(Boleta.id)).limit(limit + 1).all()
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        next_cursor = encode_cursor(items[-1])
+    
+    logger.info(f"Listadas {len(items)} boletas para usuario {user_id} por cursor")
+    return items, next_cursor, total
+
+def search_boletas(
+    db: Session,
+    user_id: str,
+    limit: int = 20,
+    offset: int = 0,
+    **filters
+) -> Tuple[List, bool]:
+    """
+    Busca boletas del usuario por texto, comercio, monto y fecha.
+    
+    Args:
+        db: Sesión de base de datos
+        user_id: ID del usuario
+        limit: Límite de resultados
+        offset: Resultados a saltar
+        filters: Filtros de `search.search_statement` (q, merchant, min_amount...)
+        
+    Returns:
+        Tupla con (filas de `BOLETA_SUMMARY_COLUMNS`, hay_más_resultados)
+    """
+    statement = search.search_statement(
+        db.get_bind().dialect.name, user_id, BOLETA_SUMMARY_COLUMNS, **filters
+    )
+    items = db.execute(statement.offset(offset).limit(limit + 1)).all()
+    logger.info(f"Búsqueda de boletas para usuario {user_id}: {min(len(items), limit)} resultados")
+    return items[:limit], len(items) > limit
+
+def iter_boletas(
+    db: Session,
+    user_id: str,
+    include_text: bool = False,
+    batch_size: int = 1000
+) -> Iterator:
+    """
+    Recorre todas las boletas del usuario sin cargarlas en memoria.
+    
+    Usa `yield_per`, que en Postgres abre un cursor del lado del servidor:
+    las filas llegan en lotes de `batch_size` a medida que se consumen.
+    
+    Args:
+        db: Sesión de base de datos (debe seguir abierta mientras se itera)
+        user_id: ID del usuario
+        include_text: Si se incluye la columna del texto OCR
+        batch_size: Filas por lote leído de la base
+        
+    Returns:
+        Iterador de filas de `BOLETA_SUMMARY_COLUMNS` (+ text)
+    """
+    columns = BOLETA_SUMMARY_COLUMNS + ((Boleta.text,) if include_text else ())
+    statement = (
+        select(*columns)
+        .where(Boleta.user_id == user_id)
+        .order_by(desc(Boleta.fecha), desc(Boleta.id))
+        .execution_options(yield_per=batch_size)
+    )
+    yield from db.execute(statement)
 
 def delete_boleta(db: Session, boleta_id: int, user_id: str) -> bool:
     """
@@ -115,35 +433,180 @@ def delete_boleta(db: Session, boleta_id: int, user_id: str) -> bool:
         logger.error(f"Error eliminando boleta {boleta_id}: {e}")
         return False
 
-def get_boletas_stats(db: Session, user_id: str) -> dict:
+def stats_statement(user_id: str, date_from: Optional[date] = None, date_to: Optional[date] = None):
+    """Consulta agrupada de `get_boletas_stats` para un usuario y rango de fechas."""
+    statement = rollup.stats_groups_statement().where(Boleta.user_id == user_id)
+    if date_from is not None:
+        statement = statement.where(Boleta.date >= date_from)
+    if date_to is not None:
+        statement = statement.where(Boleta.date <= date_to)
+    return statement
+
+def stats_from_groups(groups, top_merchants: int) -> dict:
+    """Estadísticas de un usuario a partir de las filas de `stats_statement`."""
+    deltas = rollup.deltas_from_groups(groups)
+    return rollup.format_stats(
+        {(kind, bucket): delta for (_, kind, bucket), delta in deltas.items()},
+        top_merchants
+    )
+
+def get_boletas_stats(
+    db: Session,
+    user_id: str,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    top_merchants: int = 10,
+    use_rollup: bool = True
+) -> dict:
     """
-    Obtiene estadísticas básicas de las boletas del usuario.
+    Obtiene estadísticas de las boletas del usuario.
+    
+    Sin filtros de fecha se leen los agregados de `boleta_stats_rollup`.
+    Con filtros (o si el usuario aún no tiene agregados) se ejecuta una
+    sola consulta agrupada por (año, mes, comercio) y los totales y
+    desgloses se combinan a partir de esos grupos.
     
     Args:
         db: Sesión de base de datos
         user_id: ID del usuario
+        date_from: Fecha de boleta mínima (inclusive)
+        date_to: Fecha de boleta máxima (inclusive)
+        top_merchants: Cantidad de comercios en el desglose (por monto total)
+        use_rollup: Permite leer los agregados precalculados
         
     Returns:
         Diccionario con estadísticas
     """
     try:
-        query = db.query(Boleta).filter(Boleta.user_id == user_id)
+        if use_rollup and date_from is None and date_to is None:
+            stats = rollup.read_rollup_stats(db, user_id, top_merchants)
+            if stats is not None:
+                return stats
         
-        total_boletas = query.count()
-        total_amount = db.query(Boleta.total_amount).filter(
-            Boleta.user_id == user_id,
-            Boleta.total_amount.isnot(None)
-        ).scalar() or 0
-        
-        return {
-            "total_boletas": total_boletas,
-            "total_amount": float(total_amount),
-            "avg_confidence": db.query(Boleta.confidence).filter(
-                Boleta.user_id == user_id,
-                Boleta.confidence.isnot(None)
-            ).scalar() or 0
-        }
+        statement = stats_statement(user_id, date_from, date_to)
+        return stats_from_groups(db.execute(statement), top_merchants)
         
     except Exception as e:
         logger.error(f"Error obteniendo estadísticas para usuario {user_id}: {e}")
-        return {"total_boletas": 0, "total_amount": 0, "avg_confidence": 0}
+        return rollup.format_stats({}, top_merchants)
+
+def create_ocr_job(db: Session, user_id: str, nombre_archivo: str, image: bytes) -> OCRJob:
+    """
+    Encola un trabajo de OCR para procesarlo en segundo plano.
+    
+    Args:
+        db: Sesión de base de datos
+        user_id: ID del usuario
+        nombre_archivo: Nombre del archivo subido
+        image: Bytes de la imagen
+        
+    Returns:
+        Trabajo creado en estado 'pending'
+    """
+    try:
+        job = OCRJob(user_id=user_id, nombre_archivo=nombre_archivo, image=image)
+        db.add(job)
+        db.commit()
+        db.refresh(job)
+        logger.info(f"Trabajo OCR {job.id} encolado para usuario {user_id}")
+        return job
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Error encolando trabajo OCR: {e}")
+        raise
+
+def get_ocr_job(db: Session, job_id: str, user_id: str) -> OCRJob | None:
+    """
+    Obtiene un trabajo de OCR, solo si pertenece al usuario.
+    
+    Args:
+        db: Sesión de base de datos
+        job_id: ID del trabajo
+        user_id: ID del usuario
+        
+    Returns:
+        Trabajo si existe y pertenece al usuario, None en caso contrario
+    """
+    return db.query(OCRJob).filter(
+        OCRJob.id == job_id,
+        OCRJob.user_id == user_id
+    ).first()
+
+def claim_ocr_job(db: Session, lease_seconds: int, max_attempts: int) -> OCRJob | None:
+    """
+    Toma el trabajo pendiente más antiguo y lo marca como 'running'.
+    
+    También recupera trabajos 'running' cuyo lease expiró (worker caído).
+    La toma es un UPDATE condicional, por lo que dos workers nunca
+    procesan el mismo trabajo.
+    
+    Args:
+        db: Sesión de base de datos
+        lease_seconds: Segundos tras los cuales un trabajo 'running' se considera abandonado
+        max_attempts: Intentos máximos antes de marcar el trabajo como fallido
+        
+    Returns:
+        Trabajo tomado o None si no hay trabajo disponible
+    """
+    while True:
+        now = datetime.utcnow()
+        stale = now - timedelta(seconds=lease_seconds)
+        candidate = db.query(OCRJob.id, OCRJob.status, OCRJob.updated_at).filter(
+            or_(
+                OCRJob.status == "pending",
+                and_(OCRJob.status == "running", OCRJob.updated_at < stale)
+            )
+        ).order_by(OCRJob.created_at).first()
+        if candidate is None:
+            return None
+        
+        result = db.execute(
+            update(OCRJob)
+            .where(
+                OCRJob.id == candidate.id,
+                OCRJob.status == candidate.status,
+                OCRJob.updated_at == candidate.updated_at
+            )
+            .values(status="running", attempts=OCRJob.attempts + 1, updated_at=now)
+        )
+        db.commit()
+        if result.rowcount != 1:
+            # Otro worker lo tomó primero
+            continue
+        
+        job = db.get(OCRJob, candidate.id)
+        if job.attempts > max_attempts:
+            fail_ocr_job(db, job, "Demasiados intentos fallidos")
+            continue
+        return job
+
+def complete_ocr_job(db: Session, job: OCRJob, boleta_id: int) -> None:
+    """Marca un trabajo como terminado y libera la imagen almacenada."""
+    job.status = "done"
+    job.boleta_id = boleta_id
+    job.image = None
+    job.error = None
+    job.updated_at = datetime.utcnow()
+    db.commit()
+    logger.info(f"Trabajo OCR {job.id} terminado, boleta {boleta_id}")
+
+def fail_ocr_job(db: Session, job: OCRJob, error: str, retry: bool = False) -> None:
+    """
+    Registra el fallo de un trabajo.
+    
+    Args:
+        db: Sesión de base de datos
+        job: Trabajo que falló
+        error: Mensaje de error visible para el usuario
+        retry: Si es True el trabajo vuelve a 'pending' para reintentarse; es
+            para OCR saturado, así que no cuenta como intento fallido
+    """
+    job.status = "pending" if retry else "failed"
+    job.error = error
+    if retry:
+        job.attempts = max(job.attempts - 1, 0)
+    else:
+        job.image = None
+    job.updated_at = datetime.utcnow()
+    db.commit()
+    logger.warning(f"Trabajo OCR {job.id} {'reencolado' if retry else 'fallido'}: {error}")
@@ -0,0 +1,251 @@
+import logging
+from datetime import date
+from typing import Tuple, List, Optional
+from sqlalchemy import select, func, desc, tuple_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import undefer
+from sqlalchemy.orm.attributes import set_committed_value
+from models import Boleta
+from crud import BOLETA_SUMMARY_COLUMNS, _boleta_columns, encode_cursor, decode_cursor, stats_statement, stats_from_groups
+import dedup
+import rollup
+import search
+import versions
+import boleta_texts
+
+logger = logging.getLogger(__name__)
+
+# Versiones async de las funciones de crud.py usadas por las rutas de boletas
+# (DB_ASYNC=true). Comparten consultas y agregados con la versión sync.
+
+async def _add_texts(db: AsyncSession, boletas: List[Boleta], texts: List[Optional[str]]) -> None:
+    """Guarda el texto OCR de boletas recién insertadas en `boleta_texts` (misma transacción)."""
+    rows = [(boleta.id, boleta.merchant, text) for boleta, text in zip(boletas, texts)]
+    for statement in boleta_texts.insert_statements(db.bind.dialect.name, rows):
+        await db.execute(statement)
+
+async def get_boletas_version(db: AsyncSession, user_id: str) -> int:
+    """Versión actual de las boletas del usuario (ver crud.get_boletas_version)."""
+    return await db.scalar(versions.version_statement(user_id)) or 0
+
+async def find_duplicate(
+    db: AsyncSession,
+    user_id: str,
+    image_hash: Optional[str] = None,
+    fingerprint: Optional[str] = None
+) -> Boleta | None:
+    """Busca una boleta del usuario con la misma imagen o la misma huella (ver crud.find_duplicate)."""
+    statement = dedup.duplicate_statement(user_id, image_hash, fingerprint)
+    if statement is None:
+        return None
+    return dedup.pick_duplicate(await db.scalars(statement), image_hash)
+
+async def create_boleta(db: AsyncSession, boleta_data: dict) -> Boleta:
+    """
+    Crea una nueva boleta en la base de datos.
+    
+    Si es duplicada devuelve la existente con `duplicate` indicando el
+    criterio (ver crud.create_boleta).
+    
+    Args:
+        db: Sesión async de base de datos
+        boleta_data: Datos de la boleta a crear
+        
+    Returns:
+        Boleta creada, o la existente si es duplicada
+    """
+    boleta_data = dedup.with_fingerprint(boleta_data)
+    user_id = boleta_data.get("user_id")
+    image_hash = boleta_data.get("image_hash")
+    fingerprint = boleta_data.get("fingerprint")
+    try:
+        existing = await find_duplicate(db, user_id, image_hash, fingerprint)
+        if existing is not None:
+            logger.info(f"Boleta duplicada ({existing.duplicate}) de ID {existing.id}, no se inserta")
+            return existing
+        
+        boleta = Boleta(**_boleta_columns(boleta_data))
+        db.add(boleta)
+        await db.flush()
+        await _add_texts(db, [boleta], [boleta_data.get("text")])
+        await db.commit()
+        await db.refresh(boleta)
+        # Con AsyncSession no hay carga diferida implícita: dejar el texto cargado
+        set_committed_value(boleta, "text", boleta_data.get("text"))
+        logger.info(f"Boleta creada exitosamente: ID {boleta.id}")
+        return boleta
+    except IntegrityError:
+        # Otra petición insertó la misma imagen entre la búsqueda y el INSERT
+        await db.rollback()
+        existing = await find_duplicate(db, user_id, image_hash, fingerprint)
+        if existing is None:
+            raise
+        return existing
+    except Exception as e:
+        await db.rollback()
+        logger.error(f"Error creando boleta: {e}")
+        raise
+
+async def get_boleta_by_id(db: AsyncSession, boleta_id: int, user_id: str) -> Boleta | None:
+    """Obtiene una boleta por ID, solo si pertenece al usuario."""
+    try:
+        return await db.scalar(select(Boleta).options(undefer(Boleta.text)).where(
+            Boleta.id == boleta_id,
+            Boleta.user_id == user_id
+        ))
+    except Exception as e:
+        logger.error(f"Error obteniendo boleta {boleta_id}: {e}")
+        return None
+
+async def _count_boletas(db: AsyncSession, user_id: str) -> int:
+    return await db.scalar(select(func.count()).select_from(Boleta).where(Boleta.user_id == user_id))
+
+def _list_statement(user_id: str, include_text: bool):
+    """SELECT de boletas del usuario; sin texto solo lee `BOLETA_SUMMARY_COLUMNS`."""
+    if include_text:
+        return select(Boleta).options(undefer(Boleta.text)).where(Boleta.user_id == user_id)
+    return select(*BOLETA_SUMMARY_COLUMNS).where(Boleta.user_id == user_id)
+
+async def _fetch(db: AsyncSession, statement, include_text: bool) -> list:
+    """Objetos Boleta si se pidió el texto, filas de columnas en caso contrario."""
+    if include_text:
+        return list(await db.scalars(statement))
+    return list(await db.execute(statement))
+
+async def list_boletas(
+    db: AsyncSession,
+    user_id: str,
+    page: int = 1,
+    limit: int = 20,
+    include_total: bool = True,
+    include_text: bool = True
+) -> Tuple[List[Boleta], Optional[int]]:
+    """
+    Lista boletas del usuario con paginación.
+    
+    Returns:
+        Tupla con (items, total); total es None si `include_total` es False
+    """
+    try:
+        total = await _count_boletas(db, user_id) if include_total else None
+        
+        items = await _fetch(
+            db,
+            _list_statement(user_id, include_text)
+            .order_by(desc(Boleta.fecha), desc(Boleta.id))
+            .offset((page - 1) * limit)
+            .limit(limit),
+            include_text
+        )
+        
+        logger.info(f"Listadas {len(items)} boletas para usuario {user_id}, página {page}")
+        return items, total
+        
+    except Exception as e:
+        logger.error(f"Error listando boletas para usuario {user_id}: {e}")
+        return [], 0 if include_total else None
+
+async def list_boletas_after(
+    db: AsyncSession,
+    user_id: str,
+    cursor: Optional[str] = None,
+    limit: int = 20,
+    include_total: bool = False,
+    include_text: bool = True
+) -> Tuple[List[Boleta], Optional[str], Optional[int]]:
+    """
+    Lista boletas del usuario con paginación por cursor (keyset).
+    
+    Returns:
+        Tupla con (items, next_cursor, total)
+        
+    Raises:
+        InvalidCursor: Si el cursor no es válido
+    """
+    total = await _count_boletas(db, user_id) if include_total else None
+    
+    statement = _list_statement(user_id, include_text)
+    if cursor:
+        fecha, boleta_id = decode_cursor(cursor)
+        statement = statement.where(tuple_(Boleta.fecha, Boleta.id) < tuple_(fecha, boleta_id))
+    
+    # Se pide un item extra para saber si hay página siguiente
+    items = await _fetch(
+        db, statement.order_by(desc(Boleta.fecha), desc(Boleta.id)).limit(limit + 1), include_text
+    )
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        next_cursor = encode_cursor(items[-1])
+    
+    logger.info(f"Listadas {len(items)} boletas para usuario {user_id} por cursor")
+    return items, next_cursor, total
+
+async def search_boletas(
+    db: AsyncSession,
+    user_id: str,
+    limit: int = 20,
+    offset: int = 0,
+    **filters
+) -> Tuple[List, bool]:
+    """
+    Busca boletas del usuario (ver `crud.search_boletas`).
+    
+    Returns:
+        Tupla con (filas de `BOLETA_SUMMARY_COLUMNS`, hay_más_resultados)
+    """
+    statement = search.search_statement(db.bind.dialect.name, user_id, BOLETA_SUMMARY_COLUMNS, **filters)
+    items = list(await db.execute(statement.offset(offset).limit(limit + 1)))
+    logger.info(f"Búsqueda de boletas para usuario {user_id}: {min(len(items), limit)} resultados")
+    return items[:limit], len(items) > limit
+
+async def delete_boleta(db: AsyncSession, boleta_id: int, user_id: str) -> bool:
+    """
+    Elimina una boleta, solo si pertenece al usuario.
+    
+    Returns:
+        True si se eliminó, False en caso contrario
+    """
+    try:
+        boleta = await get_boleta_by_id(db, boleta_id, user_id)
+        if not boleta:
+            return False
+            
+        await db.delete(boleta)
+        await db.commit()
+        logger.info(f"Boleta {boleta_id} eliminada para usuario {user_id}")
+        return True
+        
+    except Exception as e:
+        await db.rollback()
+        logger.error(f"Error eliminando boleta {boleta_id}: {e}")
+        return False
+
+async def get_boletas_stats(
+    db: AsyncSession,
+    user_id: str,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    top_merchants: int = 10,
+    use_rollup: bool = True
+) -> dict:
+    """
+    Obtiene estadísticas de las boletas del usuario (ver `crud.get_boletas_stats`).
+    
+    Returns:
+        Diccionario con estadísticas
+    """
+    try:
+        if use_rollup and date_from is None and date_to is None:
+            rows = await db.scalars(rollup.rollup_rows_statement(user_id))
+            stats = rollup.stats_from_rollup_rows(rows, top_merchants)
+            if stats is not None:
+                return stats
+        
+        groups = await db.execute(stats_statement(user_id, date_from, date_to))
+        return stats_from_groups(groups, top_merchants)
+        
+    except Exception as e:
+        logger.error(f"Error obteniendo estadísticas para usuario {user_id}: {e}")
+        return rollup.format_stats({}, top_merchants)
@@ -1,7 +1,10 @@
 import os
+import time
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker, DeclarativeBase
-from sqlalchemy.pool import StaticPool
+from sqlalchemy.pool import StaticPool, QueuePool
+
+from metrics import registry, DB_POOL_CHECKOUT_SECONDS
 
 # Obtener URL de base de datos desde variables de entorno
 DATABASE_URL = os.getenv("DATABASE_URL")
@@ -12,15 +15,50 @@ if not DATABASE_URL:
 class Base(DeclarativeBase):
     pass
 
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool que mide cuánto se espera por una conexión libre (ver /metrics)."""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            DB_POOL_CHECKOUT_SECONDS.observe(time.perf_counter() - start)
+
 # Configurar engine con pool de conexiones
 engine = create_engine(
     DATABASE_URL,
+    poolclass=InstrumentedQueuePool,
     pool_pre_ping=True,
     pool_recycle=300,
     pool_size=5,
     max_overflow=10
 )
 
+registry.gauge(
+    "db_pool_connections", "Conexiones del pool de la base de datos por estado", ("state",),
+    fn=lambda: {
+        ("checked_out",): engine.pool.checkedout(),
+        ("idle",): engine.pool.checkedin(),
+        ("overflow",): max(engine.pool.overflow(), 0),
+    }
+)
+registry.gauge("db_pool_size", "Tamaño configurado del pool de la base de datos", fn=lambda: engine.pool.size())
+
+# Crear tablas al iniciar la app (desarrollo con SQLite). En Supabase el
+# esquema se aplica con los scripts de sql/, y los workers no tocan la base al arrancar.
+DB_CREATE_SCHEMA = os.getenv("DB_CREATE_SCHEMA", "false").lower() == "true"
+
+def create_schema(bind=None):
+    """Crea las tablas (y el índice FTS en SQLite) que aún no existen."""
+    import models  # registra las tablas en Base.metadata
+    import search  # trigger de la tabla FTS de SQLite
+    import boleta_texts  # trigger de borrado de boleta_texts en SQLite
+    import versions  # triggers de versión de boletas en SQLite
+    import rollup  # triggers de agregados de boletas en SQLite
+
+    Base.metadata.create_all(bind=bind or engine)
+
 # Crear sesión local
 SessionLocal = sessionmaker(
     bind=engine,
@@ -35,3 +73,62 @@ def get_db():
         yield db
     finally:
         db.close()
+
+# Fábrica de sesiones para quien maneja la sesión por su cuenta (p.ej. respuestas en streaming)
+def get_session_factory():
+    return SessionLocal
+
+# Engine async opcional (asyncpg en Postgres, aiosqlite en tests)
+DB_ASYNC = os.getenv("DB_ASYNC", "false").lower() == "true"
+
+_ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "postgres": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+def async_database_url(url: str) -> str:
+    """Convierte una URL de base de datos sync a su driver async."""
+    scheme, sep, rest = url.partition("://")
+    dialect = scheme.split("+")[0]
+    if dialect not in _ASYNC_DRIVERS:
+        raise ValueError(f"Sin driver async para el dialecto: {dialect}")
+    return f"{_ASYNC_DRIVERS[dialect]}{sep}{rest}"
+
+def make_async_engine(url: str = DATABASE_URL):
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    return create_async_engine(
+        async_database_url(url),
+        pool_pre_ping=True,
+        pool_recycle=300,
+        pool_size=5,
+        max_overflow=10
+    )
+
+_async_session_factory = None
+
+def get_async_session_factory():
+    """Crea el engine async la primera vez que se usa (requiere el driver instalado)."""
+    global _async_session_factory
+    if _async_session_factory is None:
+        from sqlalchemy.ext.asyncio import async_sessionmaker
+
+        _async_session_factory = async_sessionmaker(
+            bind=make_async_engine(),
+            autoflush=False,
+            expire_on_commit=False
+        )
+    return _async_session_factory
+
+# Función para obtener sesión async de base de datos
+async def get_async_db():
+    async with get_async_session_factory()() as db:
+        yield db
+
+async def dispose_async_engine():
+    """Cierra las conexiones del engine async, si se creó."""
+    global _async_session_factory
+    if _async_session_factory is not None:
+        await _async_session_factory.kw["bind"].dispose()
+        _async_session_factory = None
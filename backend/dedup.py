@@ -0,0 +1,156 @@
+import os
+import sys
+import hashlib
+import logging
+import argparse
+import unicodedata
+from decimal import Decimal, InvalidOperation
+from typing import Iterable, Optional
+from dotenv import load_dotenv
+
+# Cargar variables de entorno (también se usa como script)
+load_dotenv()
+
+from sqlalchemy import select, update, or_
+from sqlalchemy.orm import Session, undefer
+from sqlalchemy.orm.attributes import set_committed_value
+
+from db import SessionLocal
+from models import Boleta
+
+logger = logging.getLogger(__name__)
+
+# Tratar como duplicada una boleta con mismo comercio, monto y fecha
+# (además de la misma imagen, que siempre se detecta)
+DEDUP_FINGERPRINT = os.getenv("DEDUP_FINGERPRINT", "true").lower() == "true"
+
+# Valores de `Boleta.duplicate`
+IMAGE = "image"
+FINGERPRINT = "fingerprint"
+
+def normalize_merchant(merchant: Optional[str]) -> str:
+    """Comercio en minúsculas, sin tildes ni signos: 'Café  Haití!' -> 'cafe haiti'."""
+    if not merchant:
+        return ""
+    decomposed = unicodedata.normalize("NFKD", merchant)
+    chars = (c if c.isalnum() else " " for c in decomposed if not unicodedata.combining(c))
+    return " ".join("".join(chars).lower().split())
+
+def receipt_fingerprint(merchant, total_amount, date) -> Optional[str]:
+    """
+    Huella de una compra a partir de (comercio, monto, fecha) normalizados.
+
+    Returns:
+        SHA-256 en hex, o None si falta alguno de los tres datos
+    """
+    merchant = normalize_merchant(merchant)
+    if not merchant or total_amount is None or not date:
+        return None
+    try:
+        amount = Decimal(str(total_amount)).quantize(Decimal("0.01"))
+    except InvalidOperation:
+        return None
+    day = date.isoformat() if hasattr(date, "isoformat") else str(date)
+    return hashlib.sha256(f"{merchant}|{amount}|{day}".encode("utf-8")).hexdigest()
+
+def with_fingerprint(boleta_data: dict) -> dict:
+    """Agrega `fingerprint` a los datos de una boleta si no lo traen."""
+    if boleta_data.get("fingerprint"):
+        return boleta_data
+    fingerprint = receipt_fingerprint(
+        boleta_data.get("merchant"), boleta_data.get("total_amount"), boleta_data.get("date")
+    )
+    return {**boleta_data, "fingerprint": fingerprint}
+
+def duplicate_statement(user_id: str, image_hash: Optional[str] = None, fingerprint: Optional[str] = None):
+    """
+    SELECT de boletas del usuario con la misma imagen o la misma huella.
+
+    Returns:
+        Consulta, o None si no hay nada con qué comparar
+    """
+    conditions = []
+    if image_hash:
+        conditions.append(Boleta.image_hash == image_hash)
+    if fingerprint and DEDUP_FINGERPRINT:
+        conditions.append(Boleta.fingerprint == fingerprint)
+    if not conditions:
+        return None
+    return (
+        select(Boleta)
+        .options(undefer(Boleta.text))      # la duplicada se devuelve completa
+        .where(Boleta.user_id == user_id, or_(*conditions))
+        .order_by(Boleta.id)
+        .limit(10)
+    )
+
+def pick_duplicate(candidates: Iterable[Boleta], image_hash: Optional[str] = None) -> Optional[Boleta]:
+    """
+    Elige la boleta existente (misma imagen antes que misma huella) y la marca.
+
+    `duplicate` indica el criterio: 'image' o 'fingerprint'.
+    """
+    candidates = list(candidates)
+    if not candidates:
+        return None
+    for boleta in candidates:
+        if image_hash and boleta.image_hash == image_hash:
+            boleta.duplicate = IMAGE
+            return boleta
+    candidates[0].duplicate = FINGERPRINT
+    return candidates[0]
+
+def flagged_copy(boleta: Boleta, kind: str) -> Boleta:
+    """Copia sin sesión de una boleta, marcada como duplicada con el criterio `kind`."""
+    copy = Boleta(**{column.key: getattr(boleta, column.key) for column in Boleta.__table__.columns})
+    set_committed_value(copy, "text", boleta.text)
+    copy.duplicate = kind
+    return copy
+
+def backfill_fingerprints(db: Session, batch_size: int = 1000) -> int:
+    """
+    Calcula `fingerprint` de las boletas que no lo tienen (creadas antes de sql/005).
+
+    Returns:
+        Cantidad de boletas actualizadas
+    """
+    updated = 0
+    last_id = 0
+    while True:
+        rows = db.execute(
+            select(Boleta.id, Boleta.merchant, Boleta.total_amount, Boleta.date)
+            .where(Boleta.fingerprint.is_(None), Boleta.id > last_id)
+            .order_by(Boleta.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            return updated
+        last_id = rows[-1].id
+        values = [
+            {"id": row.id, "fingerprint": fingerprint}
+            for row in rows
+            if (fingerprint := receipt_fingerprint(row.merchant, row.total_amount, row.date))
+        ]
+        if values:
+            db.execute(update(Boleta), values)
+        db.commit()
+        updated += len(values)
+        logger.info(f"Huellas calculadas: {updated}")
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Mantenimiento de la detección de boletas duplicadas")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    subcommands.add_parser("backfill", help="Calcular huellas de boletas existentes")
+    parser.parse_args(argv)
+
+    db = SessionLocal()
+    try:
+        updated = backfill_fingerprints(db)
+        print(f"Huellas calculadas para {updated} boletas")
+        return 0
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
@@ -1,9 +1,15 @@
 import os
+import time
+import hashlib
 import logging
+import threading
+from collections import OrderedDict
 from fastapi import Header, HTTPException, Depends
 from jose import jwt, JWTError
 from typing import Dict, Optional
 
+from metrics import registry, hit_ratio
+
 logger = logging.getLogger(__name__)
 
 # Obtener secret JWT desde variables de entorno
@@ -12,6 +18,77 @@ SUPABASE_JWT_SECRET = os.getenv("SUPABASE_JWT_SECRET")
 if not SUPABASE_JWT_SECRET:
     raise ValueError("SUPABASE_JWT_SECRET environment variable is not set")
 
+# Cache de tokens ya verificados
+AUTH_TOKEN_CACHE_SIZE = int(os.getenv("AUTH_TOKEN_CACHE_SIZE", "1024"))        # 0 = sin cache
+AUTH_TOKEN_CACHE_MAX_TTL = int(os.getenv("AUTH_TOKEN_CACHE_MAX_TTL", "300"))   # tokens sin 'exp'
+
+class TokenCache:
+    """
+    Cache LRU de tokens JWT ya verificados.
+
+    Las entradas se indexan por el SHA-256 del token (no se guarda el token)
+    y vencen en el 'exp' del token, o tras `max_ttl` segundos si no lo tiene.
+    """
+
+    def __init__(self, max_entries: int = AUTH_TOKEN_CACHE_SIZE, max_ttl: int = AUTH_TOKEN_CACHE_MAX_TTL):
+        self.max_entries = max_entries
+        self.max_ttl = max_ttl
+        self._entries: "OrderedDict[bytes, tuple[Dict[str, str], float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def _key(token: str) -> bytes:
+        return hashlib.sha256(token.encode("utf-8")).digest()
+
+    def get(self, token: str) -> Optional[Dict[str, str]]:
+        """Usuario de un token verificado y aún vigente, o None."""
+        key = self._key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] <= time.time():
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return dict(entry[0])
+
+    def put(self, token: str, user: Dict[str, str], exp=None):
+        """Guarda un token recién verificado hasta su expiración."""
+        if self.max_entries <= 0:
+            return
+        now = time.time()
+        expires_at = float(exp) if exp is not None else now + self.max_ttl
+        if expires_at <= now:
+            return
+        key = self._key(token)
+        with self._lock:
+            self._entries[key] = (dict(user), expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+# Cache compartido por las requests autenticadas
+token_cache = TokenCache()
+
+registry.counter_func("auth_token_cache_hits_total", "Tokens JWT encontrados en el cache", lambda: token_cache.hits)
+registry.counter_func("auth_token_cache_misses_total", "Tokens JWT verificados sin cache", lambda: token_cache.misses)
+registry.gauge(
+    "auth_token_cache_hit_ratio", "Fracción de requests autenticadas resueltas por el cache",
+    fn=lambda: hit_ratio(token_cache.hits, token_cache.misses)
+)
+
 async def get_current_user(authorization: str = Header(...)) -> Dict[str, str]:
     """
     Valida el token JWT de Supabase y retorna el usuario autenticado.
@@ -42,6 +119,11 @@ async def get_current_user(authorization: str = Header(...)) -> Dict[str, str]:
                 detail="Invalid authorization scheme. Use 'Bearer <token>'"
             )
         
+        # Token ya verificado en una request anterior
+        user = token_cache.get(token)
+        if user is not None:
+            return user
+
         # Decodificar JWT
         payload = jwt.decode(
             token, 
@@ -59,8 +141,10 @@ async def get_current_user(authorization: str = Header(...)) -> Dict[str, str]:
                 detail="Invalid token: missing user ID"
             )
         
-        logger.info(f"User authenticated: {user_id}")
-        return {"sub": user_id}
+        logger.debug(f"User authenticated: {user_id}")
+        user = {"sub": user_id}
+        token_cache.put(token, user, payload.get("exp"))
+        return user
         
     except JWTError as e:
         logger.warning(f"JWT validation failed: {e}")
@@ -0,0 +1,107 @@
+import io
+import os
+import csv
+import json
+import logging
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Callable, Iterable, Iterator
+
+from sqlalchemy.orm import Session
+
+from crud import iter_boletas
+
+logger = logging.getLogger(__name__)
+
+# Filas por lote leído de la base y por bloque enviado al cliente
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", "500"))
+
+EXPORT_COLUMNS = ("id", "nombre_archivo", "fecha", "date", "merchant", "total_amount", "confidence")
+
+MEDIA_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+}
+
+def _json_value(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+def _csv_value(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return "" if value is None else value
+
+def csv_chunks(rows: Iterable, columns: tuple, chunk_rows: int = EXPORT_CHUNK_ROWS) -> Iterator[bytes]:
+    """Serializa filas a CSV en bloques de `chunk_rows` (el encabezado va solo, primero)."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    yield buffer.getvalue().encode("utf-8")
+    
+    buffer.seek(0)
+    buffer.truncate()
+    pending = 0
+    for row in rows:
+        writer.writerow([_csv_value(getattr(row, name)) for name in columns])
+        pending += 1
+        if pending >= chunk_rows:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    if pending:
+        yield buffer.getvalue().encode("utf-8")
+
+def ndjson_chunks(rows: Iterable, columns: tuple, chunk_rows: int = EXPORT_CHUNK_ROWS) -> Iterator[bytes]:
+    """Serializa filas a JSON por línea en bloques de `chunk_rows`."""
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(
+            {name: _json_value(getattr(row, name)) for name in columns},
+            ensure_ascii=False
+        ))
+        if len(lines) >= chunk_rows:
+            yield ("\n".join(lines) + "\n").encode("utf-8")
+            lines = []
+    if lines:
+        yield ("\n".join(lines) + "\n").encode("utf-8")
+
+_FORMATTERS = {"csv": csv_chunks, "ndjson": ndjson_chunks}
+
+def stream_export(
+    session_factory: Callable[[], Session],
+    user_id: str,
+    export_format: str = "csv",
+    include_text: bool = False,
+    chunk_rows: int = EXPORT_CHUNK_ROWS,
+    batch_size: int = EXPORT_BATCH_SIZE
+) -> Iterator[bytes]:
+    """
+    Genera la exportación de las boletas de un usuario.
+    
+    El generador abre su propia sesión y la cierra al terminar (o si el
+    cliente corta la descarga), porque se consume después de que la
+    request terminó de resolver sus dependencias.
+    
+    Args:
+        session_factory: Fábrica de sesiones (ver `db.get_session_factory`)
+        user_id: ID del usuario
+        export_format: 'csv' o 'ndjson'
+        include_text: Si se incluye el texto OCR
+        chunk_rows: Filas por bloque enviado
+        batch_size: Filas por lote leído de la base
+    """
+    formatter = _FORMATTERS[export_format]
+    columns = EXPORT_COLUMNS + (("text",) if include_text else ())
+    db = session_factory()
+    try:
+        logger.info(f"Exportando boletas ({export_format}) para usuario {user_id}")
+        rows = iter_boletas(db, user_id, include_text=include_text, batch_size=batch_size)
+        yield from formatter(rows, columns, chunk_rows)
+    finally:
+        db.close()
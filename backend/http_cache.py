@@ -0,0 +1,103 @@
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Iterable, Optional
+from urllib.parse import urlencode
+
+from metrics import registry, hit_ratio
+
+# Cache de respuestas de GET /boletas y /boletas/stats en memoria; 0 = sin
+# cache (los ETag y el 304 siguen funcionando)
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(8 * 1024 * 1024)))
+
+# Overhead aproximado por entrada en memoria (dict, clave, bytes)
+_ENTRY_OVERHEAD = 256
+
+def make_etag(user_id: str, version: int, path: str, params: Iterable[tuple]) -> str:
+    """
+    ETag fuerte de una respuesta de lectura.
+
+    Depende solo de la versión de las boletas del usuario (ver versions.py),
+    la ruta y los parámetros (en cualquier orden), así que se calcula sin
+    leer las boletas.
+    """
+    material = "|".join((user_id, str(version), path, urlencode(sorted(params))))
+    return '"' + hashlib.sha256(material.encode("utf-8")).hexdigest()[:32] + '"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Si el header If-None-Match incluye `etag` (comparación débil, como pide GET)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    tags = (tag.strip() for tag in if_none_match.split(","))
+    return etag in (tag[2:] if tag.startswith("W/") else tag for tag in tags)
+
+class ResponseCache:
+    """
+    Cuerpos JSON ya serializados, indexados por ETag.
+
+    LRU acotado por tamaño total en bytes. Como el ETag incluye la versión,
+    una escritura no necesita invalidar nada: las entradas viejas dejan de
+    pedirse y se descartan solas.
+    """
+
+    def __init__(self, max_bytes: int = RESPONSE_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def size_bytes(self) -> int:
+        return self._bytes
+
+    def get(self, etag: str) -> Optional[bytes]:
+        with self._lock:
+            body = self._entries.get(etag)
+            if body is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(etag)
+            self.hits += 1
+            return body
+
+    def put(self, etag: str, body: bytes):
+        size = len(body) + _ENTRY_OVERHEAD
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(etag, None)
+            if previous is not None:
+                self._bytes -= len(previous) + _ENTRY_OVERHEAD
+            self._entries[etag] = body
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted) + _ENTRY_OVERHEAD
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+# Cache compartido por las rutas de lectura de boletas
+response_cache = ResponseCache()
+
+registry.counter_func(
+    "response_cache_hits_total", "Respuestas de lectura servidas desde el cache", lambda: response_cache.hits
+)
+registry.counter_func(
+    "response_cache_misses_total", "Respuestas de lectura calculadas y guardadas", lambda: response_cache.misses
+)
+registry.gauge(
+    "response_cache_hit_ratio", "Fracción de respuestas de lectura servidas desde el cache",
+    fn=lambda: hit_ratio(response_cache.hits, response_cache.misses)
+)
+registry.gauge("response_cache_memory_bytes", "Bytes del cache de respuestas", fn=lambda: response_cache.size_bytes)
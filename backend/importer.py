@@ -0,0 +1,272 @@
+import os
+import sys
+import json
+import time
+import codecs
+import logging
+import argparse
+from datetime import date, datetime
+from typing import Callable, Iterator, Optional, Tuple
+from dotenv import load_dotenv
+
+# Cargar variables de entorno (también se usa como script)
+load_dotenv()
+
+from sqlalchemy.orm import Session
+
+from db import SessionLocal
+from crud import create_boletas_bulk
+from receipt_parser import parse_boleta_text
+
+logger = logging.getLogger(__name__)
+
+IMPORT_CHUNK_SIZE = 1000
+_READ_SIZE = 64 * 1024
+_SEPARATORS = " \t\r\n,[]"
+
+# Campos que produce parse_boleta_text y que se completan si faltan en el volcado
+_PARSED_FIELDS = ("merchant", "total_amount", "date")
+
+class InvalidRecord(ValueError):
+    """Registro del volcado que no se puede importar."""
+
+def iter_json_records(stream, offset: int = 0, read_size: int = _READ_SIZE) -> Iterator[Tuple[dict, int]]:
+    """
+    Recorre los objetos de un archivo JSON sin cargarlo completo.
+
+    Acepta un arreglo de objetos (`[{...}, {...}]`) u objetos seguidos
+    (NDJSON). Lee en bloques de `read_size` bytes y decodifica cada objeto
+    con `raw_decode` a medida que se completa.
+
+    Args:
+        stream: Archivo abierto en modo binario
+        offset: Byte desde el que continuar (un offset devuelto antes)
+        read_size: Bytes por lectura
+
+    Yields:
+        Tuplas (objeto, byte siguiente al objeto), para reanudar desde ahí
+
+    Raises:
+        json.JSONDecodeError: Si el archivo está mal formado
+    """
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder("utf-8")()
+    stream.seek(offset)
+    if offset == 0 and stream.read(len(codecs.BOM_UTF8)) == codecs.BOM_UTF8:
+        offset = len(codecs.BOM_UTF8)
+    stream.seek(offset)
+
+    buffer = ""
+    base = 0            # índice de `buffer` cuyo offset en bytes es `position`
+    position = offset
+    eof = False
+    while True:
+        index = base
+        while index < len(buffer) and buffer[index] in _SEPARATORS:
+            index += 1
+
+        if index < len(buffer):
+            try:
+                record, end = decoder.raw_decode(buffer, index)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                record = None
+            if record is not None:
+                position += len(buffer[base:end].encode("utf-8"))
+                base = end
+                yield record, position
+                continue
+        elif eof:
+            return
+
+        # Objeto incompleto o buffer agotado: leer más
+        chunk = stream.read(read_size)
+        eof = not chunk
+        buffer = buffer[base:] + text_decoder.decode(chunk, final=eof)
+        base = 0
+
+def _parse_fecha(raw: dict) -> datetime:
+    """Fecha de registro: 'fecha' ISO, o el id legado si es un timestamp epoch."""
+    if raw.get("fecha"):
+        return datetime.fromisoformat(raw["fecha"])
+    legacy_id = raw.get("id")
+    if isinstance(legacy_id, (int, float)) and 1e9 <= legacy_id < 1e11:
+        return datetime.utcfromtimestamp(legacy_id)
+    return datetime.utcnow()
+
+def normalize_record(raw: dict, default_user_id: Optional[str] = None) -> dict:
+    """
+    Convierte un registro de volcado (formato legado o actual) en datos de boleta.
+
+    - `texto_extraido` (legado) se importa como `text`.
+    - El `id` legado (timestamp epoch) se descarta; solo se usa como fecha
+      de registro si falta `fecha`.
+    - Si faltan comercio, monto o fecha se completan con `parse_boleta_text`.
+
+    Raises:
+        InvalidRecord: Si el registro no es un objeto o no tiene usuario
+    """
+    if not isinstance(raw, dict):
+        raise InvalidRecord(f"Se esperaba un objeto, no {type(raw).__name__}")
+    user_id = raw.get("user_id") or default_user_id
+    if not user_id:
+        raise InvalidRecord("Registro sin user_id (use --user-id)")
+
+    text = raw.get("text")
+    if text is None:
+        text = raw.get("texto_extraido")
+
+    data = {
+        "nombre_archivo": raw.get("nombre_archivo") or "importado",
+        "text": text,
+        "merchant": raw.get("merchant"),
+        "total_amount": raw.get("total_amount"),
+        "date": date.fromisoformat(raw["date"]) if raw.get("date") else None,
+        "confidence": raw.get("confidence"),
+        "fecha": _parse_fecha(raw),
+        "user_id": user_id,
+    }
+
+    if text and any(field not in raw for field in _PARSED_FIELDS):
+        parsed = parse_boleta_text(text)
+        for field in _PARSED_FIELDS:
+            if field not in raw:
+                data[field] = parsed.get(field)
+        if "confidence" not in raw:
+            data["confidence"] = parsed.get("confidence")
+    return data
+
+def _load_checkpoint(path: str, source: str, size: int) -> Optional[dict]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            checkpoint = json.load(f)
+    except FileNotFoundError:
+        return None
+    if checkpoint.get("source") != source or checkpoint.get("size") != size:
+        logger.warning(f"Checkpoint {path} corresponde a otro archivo, se ignora")
+        return None
+    return checkpoint
+
+def _save_checkpoint(path: str, checkpoint: dict):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp_path, path)
+
+def import_file(
+    path: str,
+    default_user_id: Optional[str] = None,
+    session_factory: Callable[[], Session] = SessionLocal,
+    chunk_size: int = IMPORT_CHUNK_SIZE,
+    checkpoint_path: Optional[str] = None,
+    restart: bool = False,
+    read_size: int = _READ_SIZE
+) -> dict:
+    """
+    Importa un volcado JSON de boletas en lotes, con checkpoint para reanudar.
+
+    Cada lote se inserta con `create_boletas_bulk` (un INSERT masivo que
+    también actualiza `boleta_stats_rollup`) en su propia transacción;
+    tras cada commit se guarda en el checkpoint el byte del archivo hasta
+    el que se importó. Si el proceso se corta entre el commit y el
+    checkpoint, ese lote se vuelve a procesar al reanudar; las boletas que
+    ya existen (ver dedup.py) se cuentan como duplicadas y no se repiten.
+
+    Args:
+        path: Archivo JSON (arreglo de objetos o NDJSON)
+        default_user_id: Usuario de los registros que no traen user_id
+        session_factory: Fábrica de sesiones de base de datos
+        chunk_size: Registros por lote
+        checkpoint_path: Archivo de checkpoint (por defecto `<path>.checkpoint.json`)
+        restart: Ignorar el checkpoint y empezar desde el principio
+        read_size: Bytes por lectura del archivo
+
+    Returns:
+        Resumen del checkpoint (registros leídos, importados, duplicados y
+        omitidos en total) más `imported_now` y `seconds` de esta ejecución
+    """
+    source = os.path.abspath(path)
+    size = os.path.getsize(source)
+    checkpoint_path = checkpoint_path or f"{source}.checkpoint.json"
+
+    checkpoint = None if restart else _load_checkpoint(checkpoint_path, source, size)
+    if checkpoint is None:
+        checkpoint = {"source": source, "size": size, "offset": 0, "records": 0,
+                      "imported": 0, "duplicates": 0, "skipped": 0, "done": False}
+    elif checkpoint["done"]:
+        logger.info(f"{path} ya fue importado ({checkpoint['imported']} boletas); use --restart para repetir")
+        return {**checkpoint, "imported_now": 0, "seconds": 0.0}
+    else:
+        checkpoint.setdefault("duplicates", 0)
+        logger.info(f"Reanudando {path} desde el byte {checkpoint['offset']} ({checkpoint['imported']} boletas importadas)")
+
+    start = time.perf_counter()
+    imported_now = 0
+    pending: list = []
+    pending_offset = checkpoint["offset"]
+
+    def flush():
+        nonlocal imported_now
+        db = session_factory()
+        try:
+            boletas = create_boletas_bulk(db, pending) if pending else []
+        finally:
+            db.close()
+        created = sum(1 for boleta in boletas if boleta.duplicate is None)
+        imported_now += created
+        checkpoint["imported"] += created
+        checkpoint["duplicates"] += len(boletas) - created
+        checkpoint["offset"] = pending_offset
+        _save_checkpoint(checkpoint_path, checkpoint)
+        pending.clear()
+
+        elapsed = time.perf_counter() - start
+        logger.info(
+            f"{checkpoint['imported']} boletas importadas "
+            f"({100 * checkpoint['offset'] / max(size, 1):.1f}% del archivo, "
+            f"{imported_now / max(elapsed, 1e-9):.0f} boletas/s)"
+        )
+
+    with open(source, "rb") as stream:
+        for raw, end in iter_json_records(stream, checkpoint["offset"], read_size):
+            checkpoint["records"] += 1
+            pending_offset = end
+            try:
+                pending.append(normalize_record(raw, default_user_id))
+            except (InvalidRecord, ValueError, TypeError) as e:
+                checkpoint["skipped"] += 1
+                logger.warning(f"Registro {checkpoint['records']} omitido: {e}")
+            if len(pending) >= chunk_size:
+                flush()
+
+    flush()
+    checkpoint["done"] = True
+    _save_checkpoint(checkpoint_path, checkpoint)
+    return {**checkpoint, "imported_now": imported_now, "seconds": time.perf_counter() - start}
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Importa volcados JSON de boletas (p.ej. boletas/boletas.json)")
+    parser.add_argument("path", help="Archivo JSON: arreglo de objetos o NDJSON")
+    parser.add_argument("--user-id", help="Usuario de los registros que no traen user_id")
+    parser.add_argument("--chunk-size", type=int, default=IMPORT_CHUNK_SIZE, help="Registros por INSERT")
+    parser.add_argument("--checkpoint", help="Archivo de checkpoint (por defecto <path>.checkpoint.json)")
+    parser.add_argument("--restart", action="store_true", help="Ignorar el checkpoint y empezar de cero")
+    args = parser.parse_args(argv)
+
+    summary = import_file(
+        args.path, args.user_id, chunk_size=args.chunk_size,
+        checkpoint_path=args.checkpoint, restart=args.restart
+    )
+    rate = summary["imported_now"] / summary["seconds"] if summary["seconds"] else 0.0
+    print(
+        f"{summary['imported_now']} boletas importadas en {summary['seconds']:.1f}s ({rate:.0f} boletas/s); "
+        f"total del archivo: {summary['imported']} importadas, {summary['duplicates']} duplicadas, "
+        f"{summary['skipped']} omitidas "
+        f"de {summary['records']} registros"
+    )
+    return 0
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
@@ -0,0 +1,123 @@
+import os
+import asyncio
+import logging
+from typing import Awaitable, Callable
+
+from sqlalchemy.orm import Session
+
+from db import SessionLocal
+from models import OCRJob
+from crud import claim_ocr_job, complete_ocr_job, fail_ocr_job
+from ocr import OCRPoolSaturated
+from admission import Overloaded
+
+logger = logging.getLogger(__name__)
+
+# Configuración de la cola de trabajos
+OCR_JOB_WORKERS = int(os.getenv("OCR_JOB_WORKERS", "2"))
+OCR_JOB_POLL_SECONDS = float(os.getenv("OCR_JOB_POLL_SECONDS", "2"))
+OCR_JOB_LEASE_SECONDS = int(os.getenv("OCR_JOB_LEASE_SECONDS", "300"))
+OCR_JOB_MAX_ATTEMPTS = int(os.getenv("OCR_JOB_MAX_ATTEMPTS", "3"))
+
+class OCRJobError(Exception):
+    """Error de procesamiento cuyo mensaje se muestra al usuario en el estado del trabajo."""
+
+JobHandler = Callable[[Session, OCRJob], Awaitable[int]]
+
+class OCRJobRunner:
+    """
+    Workers en segundo plano que consumen la tabla `ocr_jobs`.
+
+    Cada worker toma un trabajo, ejecuta el `handler` (OCR + parseo +
+    creación de boleta) y registra el resultado. Los trabajos viven en la
+    base de datos, así que los pendientes sobreviven a reinicios y los que
+    quedaron a medias se recuperan cuando expira su lease.
+    """
+
+    def __init__(
+        self,
+        handler: JobHandler,
+        session_factory: Callable[[], Session] = SessionLocal,
+        workers: int = OCR_JOB_WORKERS,
+        poll_interval: float = OCR_JOB_POLL_SECONDS,
+        lease_seconds: int = OCR_JOB_LEASE_SECONDS,
+        max_attempts: int = OCR_JOB_MAX_ATTEMPTS
+    ):
+        self.handler = handler
+        self.session_factory = session_factory
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._tasks: list[asyncio.Task] = []
+        self._wakeup: asyncio.Event | None = None
+
+    def notify(self):
+        """Despierta a un worker inactivo tras encolar un trabajo."""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def run_once(self) -> bool:
+        """
+        Procesa un trabajo si hay alguno disponible.
+
+        Returns:
+            True si se procesó un trabajo, False si no había trabajo o
+            el OCR estaba saturado (el trabajo vuelve a la cola sin gastar
+            un intento)
+        """
+        db = self.session_factory()
+        try:
+            job = await asyncio.to_thread(
+                claim_ocr_job, db, self.lease_seconds, self.max_attempts
+            )
+            if job is None:
+                return False
+
+            try:
+                boleta_id = await self.handler(db, job)
+            except (OCRPoolSaturated, Overloaded) as e:
+                await asyncio.to_thread(fail_ocr_job, db, job, str(e), True)
+                return False
+            except OCRJobError as e:
+                await asyncio.to_thread(fail_ocr_job, db, job, str(e))
+            except Exception as e:
+                logger.error(f"Error procesando trabajo OCR {job.id}: {e}")
+                await asyncio.to_thread(fail_ocr_job, db, job, "Error interno del servidor")
+            else:
+                await asyncio.to_thread(complete_ocr_job, db, job, boleta_id)
+            return True
+        finally:
+            db.close()
+
+    async def _worker(self):
+        while True:
+            try:
+                processed = await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error en worker de trabajos OCR: {e}")
+                processed = False
+
+            if not processed:
+                # Esperar un trabajo nuevo o el próximo sondeo (otros procesos, leases vencidos)
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+
+    def start(self):
+        if self._tasks:
+            return
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        logger.info(f"Cola de trabajos OCR iniciada con {self.workers} workers")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._wakeup = None
@@ -1,27 +1,46 @@
 import os
+import time
+import asyncio
 import logging
-import re
+from contextlib import asynccontextmanager
 from datetime import datetime, date
-from typing import Optional
+from typing import Optional, List
 from dotenv import load_dotenv
 
 # Cargar variables de entorno
 load_dotenv()
 
-from fastapi import FastAPI, File, UploadFile, HTTPException, Depends, Query
+import orjson
+from fastapi import FastAPI, File, UploadFile, HTTPException, Depends, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, ORJSONResponse, StreamingResponse, Response
 from sqlalchemy.orm import Session
-import pytesseract
-from PIL import Image
-import httpx
 
 # Importar módulos locales
-from db import get_db, engine
-from models import Base
+from db import get_db, get_session_factory, get_async_db, dispose_async_engine, create_schema, DB_ASYNC, DB_CREATE_SCHEMA
 from deps import get_current_user
-from crud import create_boleta, list_boletas, get_boletas_stats
-from schemas import BoletaOut, BoletaListResponse, OCRFromStorageRequest, OCRResponse
+from crud import (
+    create_boleta, create_boletas_bulk, find_duplicate, list_boletas, list_boletas_after, encode_cursor, InvalidCursor, get_boletas_stats,
+    get_boleta_by_id, get_boletas_version, search_boletas, create_ocr_job, get_ocr_job
+)
+from models import OCRJob
+import crud_async
+from schemas import (
+    BoletaOut, BoletaSummary, BoletaListResponse, BoletaSearchResponse, OCRFromStorageRequest, OCRResponse, OCRJobOut,
+    OCRBatchItem, OCRBatchResponse, BoletaStats
+)
+from ocr import ocr_pool, ocr_settings, OCRPoolSaturated
+from pdf import InvalidPDF, PDF_CONTENT_TYPE, is_pdf
+from admission import ocr_admission, AdmissionRejected
+from ocr_cache import ocr_cache, image_digest, cache_key
+from storage import download_image, close_http_client, DownloadTooLarge, DownloadFailed
+from jobs import OCRJobRunner, OCRJobError
+from receipt_parser import parse_boleta_text
+from export import stream_export, MEDIA_TYPES
+from http_cache import response_cache, make_etag, etag_matches
+from compression import CompressionMiddleware
+import metrics
+from metrics import stage_timer
 
 # Configurar logging
 logging.basicConfig(
@@ -30,200 +49,254 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Crear tablas si no existen
-Base.metadata.create_all(bind=engine)
+# Máximo de archivos aceptados por POST /ocr/batch
+OCR_BATCH_MAX_FILES = int(os.getenv("OCR_BATCH_MAX_FILES", "100"))
+
+# Leer /boletas/stats desde boleta_stats_rollup (hasta `python rollup.py rebuild` se consulta boletas)
+STATS_USE_ROLLUP = os.getenv("STATS_USE_ROLLUP", "true").lower() == "true"
+
+# Sesión de las rutas de boletas: AsyncSession con DB_ASYNC=true (ver crud_async)
+get_boletas_db = get_async_db if DB_ASYNC else get_db
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if DB_CREATE_SCHEMA:
+        await asyncio.to_thread(create_schema)
+    ocr_job_runner.start()
+    yield
+    await ocr_job_runner.stop()
+    await close_http_client()
+    await dispose_async_engine()
+    # Liberar procesos de OCR al apagar el worker
+    ocr_pool.shutdown()
 
 app = FastAPI(
     title="GastoÁgil API",
     description="API para gestión de gastos con OCR",
-    version="2.0.0"
+    version="2.0.0",
+    lifespan=lifespan,
+    # orjson en vez de json.dumps para las respuestas que arma FastAPI
+    default_response_class=ORJSONResponse
 )
 
 # Configuración de CORS para permitir peticiones desde el frontend
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["http://localhost:3000", "http://127.0.0.1:3000", "*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-import os
-from fastapi.middleware.cors import CORSMiddleware
-# Configurar CORS para permitir el frontend
+# (ALLOWED_ORIGINS separados por coma; por defecto el frontend local)
 frontend_port = os.getenv("FRONTEND_PORT", "3000")
 frontend_host = os.getenv("FRONTEND_HOST", "localhost")
-allowed_origin = f"http://{frontend_host}:{frontend_port}"
+allowed_origins = [
+    origin.strip() for origin in os.getenv("ALLOWED_ORIGINS", "").split(",") if origin.strip()
+] or list(dict.fromkeys([
+    "http://localhost:3000", "http://127.0.0.1:3000", f"http://{frontend_host}:{frontend_port}"
+]))
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=[allowed_origin],
+    allow_origins=allowed_origins,
     allow_credentials=True,
     allow_methods=["GET", "POST", "PUT", "DELETE"],
     allow_headers=["*"],
 )
 
-def parse_boleta_text(text: str) -> dict:
+# brotli o gzip para respuestas de al menos COMPRESS_MIN_BYTES
+app.add_middleware(CompressionMiddleware)
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """Latencia por método, ruta (la plantilla, p.ej. /boletas/{boleta_id:int}) y status."""
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        metrics.HTTP_REQUEST_SECONDS.observe(
+            time.perf_counter() - start,
+            method=request.method,
+            route=getattr(route, "path", "unmatched"),
+            status=status
+        )
+
+def validate_image_upload(file: UploadFile) -> None:
     """
-    Parsea el texto extraído por OCR para obtener información estructurada.
+    Valida tipo y tamaño declarado de un archivo subido (imagen o PDF).
+    
+    Raises:
+        HTTPException: Si el archivo no es una imagen ni un PDF o supera 10MB
+    """
+    if not (file.content_type.startswith('image/') or file.content_type == PDF_CONTENT_TYPE):
+        raise HTTPException(status_code=400, detail="Archivo debe ser una imagen o un PDF")
+    
+    if file.size and file.size > 10 * 1024 * 1024:  # 10MB
+        raise HTTPException(status_code=400, detail="Archivo demasiado grande (máx 10MB)")
+
+def admission_error(error: AdmissionRejected) -> HTTPException:
+    """429 (cuota del usuario) o 503 (OCR saturado) con Retry-After."""
+    return HTTPException(
+        status_code=error.status_code,
+        detail=error.detail,
+        headers={"Retry-After": str(error.retry_after)}
+    )
+
+def ocr_saturated_error() -> HTTPException:
+    """503 cuando la cola del pool de OCR está llena."""
+    return HTTPException(
+        status_code=503,
+        detail="Servicio de OCR saturado, intente más tarde",
+        headers={"Retry-After": str(ocr_admission.retry_after())}
+    )
+
+async def extract_receipt(data: bytes, digest: Optional[str] = None) -> tuple[str, dict]:
+    """
+    Obtiene el texto OCR y su parseo para una imagen o PDF, usando el cache.
+    
+    Las imágenes ya procesadas (mismo contenido y misma configuración de
+    OCR) no vuelven a pasar por Tesseract. De un PDF se procesan todas sus
+    páginas en paralelo y se parsea el texto unido.
     
     Args:
-        text: Texto extraído por OCR
+        data: Bytes de la imagen o del PDF
+        digest: `image_digest(data)` si ya se calculó
         
     Returns:
-        Diccionario con información parseada
+        Tupla con (texto, información parseada)
+        
+    Raises:
+        InvalidPDF: Si es un PDF dañado o con demasiadas páginas
     """
+    pdf = is_pdf(data)
+    key = cache_key(digest or image_digest(data), *ocr_settings(pdf=pdf))
+    with stage_timer("cache_lookup"):
+        cached = await ocr_cache.lookup(key)
+    if cached is not None:
+        return cached.text, cached.parsed
+    
+    if pdf:
+        text = await ocr_pool.pdf_to_string(data)
+    else:
+        text = await ocr_pool.image_to_string(data)
+    with stage_timer("parse"):
+        parsed_info = parse_boleta_text(text)
+    if text.strip():
+        await ocr_cache.store(key, text, parsed_info)
+    return text, parsed_info
+
+async def process_ocr_job(db: Session, job: OCRJob) -> int:
+    """
+    Procesa un trabajo encolado: OCR, parseo y creación de la boleta.
+    
+    Args:
+        db: Sesión de base de datos del worker
+        job: Trabajo a procesar
+        
+    Returns:
+        ID de la boleta creada (o de la existente, si la imagen ya se subió)
+    """
+    with stage_timer("image_hash"):
+        image_hash = image_digest(job.image)
+    with stage_timer("dedup_lookup"):
+        existing = await asyncio.to_thread(find_duplicate, db, job.user_id, image_hash)
+    if existing is not None:
+        return existing.id
+    
     try:
-        # Buscar comercio (líneas que no contengan números)
-        lines = text.split('\n')
-        merchant = None
-        for line in lines[:8]:  # Buscar en las primeras 8 líneas
-            line_clean = line.strip()
-            if line_clean and not re.search(r'\d', line_clean) and len(line_clean) > 3:
-                merchant = line_clean
-                break
-
-        # Buscar total SOLO en la línea que contiene 'TOTAL'
-        total_amount = None
-        for line in lines:
-            if 'TOTAL' in line.upper():
-                match = re.search(r'TOTAL\s*[:]?[\$]?\s*(\d{1,3}(?:[.,]\d{3})*(?:[.,]\d{2,3})?)', line, re.IGNORECASE)
-                if match:
-                    total_str = match.group(1).replace('.', '').replace(',', '.')
-                    try:
-                        total_amount = float(total_str)
-                        break
-                    except ValueError:
-                        continue
-        # Buscar descripción (líneas entre encabezado y TOTAL)
-        description_lines = []
-        start_desc = False
-        for line in lines:
-            if re.search(r'DESCRIPCION|DESCRIPCIÓN|DESCRIPTION', line, re.IGNORECASE):
-                start_desc = True
-                continue
-            if 'TOTAL' in line.upper():
-                break
-            if start_desc and line.strip():
-                description_lines.append(line.strip())
-        description = ' '.join(description_lines) if description_lines else None
-
-        # Buscar fecha (varios formatos)
-        detected_date = None
-        date_patterns = [
-            r'(\d{1,2})[/-](\d{1,2})[/-](\d{2,4})',
-            r'(\d{4})[/-](\d{1,2})[/-](\d{1,2})'
-        ]
-        for pat in date_patterns:
-            for line in lines:
-                match = re.search(pat, line)
-                if match:
-                    try:
-                        if len(match.groups()) == 3:
-                            if pat.startswith(r'(\d{4})'):
-                                year, month, day = match.groups()
-                            else:
-                                day, month, year = match.groups()
-                            if len(year) == 2:
-                                year = '20' + year
-                            detected_date = date(int(year), int(month), int(day))
-                            break
-                    except ValueError:
-                        continue
-            if detected_date:
-                break
-
-        # Si no se detectó total, intentar buscar en toda la línea con variantes
-        if not total_amount:
-            for line in lines:
-                match = re.search(r'(TOTAL|Total|Importe|Monto|Amount|Sum)\s*[:]?[\$]?\s*(\d{1,3}(?:[.,]\d{3})*(?:[.,]\d{2,3})?)', line, re.IGNORECASE)
-                if match:
-                    total_str = match.group(2).replace('.', '').replace(',', '.')
-                    try:
-                        total_amount = float(total_str)
-                        break
-                    except ValueError:
-                        continue
-
-        # Si no se detectó fecha, intentar buscar con variantes
-        if not detected_date:
-            for line in lines:
-                match = re.search(r'(\d{2,4})[/-](\d{1,2})[/-](\d{1,2})', line)
-                if match:
-                    try:
-                        year, month, day = match.groups()
-                        if len(year) == 2:
-                            year = '20' + year
-                        detected_date = date(int(year), int(month), int(day))
-                        break
-                    except ValueError:
-                        continue
-
-        return {
-            "merchant": merchant,
-            "total_amount": total_amount,
-            "date": detected_date,
-            "description": description,
-            "confidence": 0.85  # Valor por defecto
-        }
-    except Exception as e:
-        logger.error(f"Error parseando texto OCR: {e}")
-        return {
-            "merchant": None,
-            "total_amount": None,
-            "date": None,
-            "confidence": 0.0
-        }
+        # Mismo cupo global que /ocr; si no hay, el worker reencola el trabajo
+        async with ocr_admission.slot():
+            text, parsed_info = await extract_receipt(job.image, image_hash)
+    except InvalidPDF as e:
+        raise OCRJobError(str(e))
+    
+    if not text.strip():
+        raise OCRJobError("No se pudo extraer texto de la imagen")
+    
+    boleta_data = {
+        "nombre_archivo": job.nombre_archivo,
+        "text": text,
+        "user_id": job.user_id,
+        "image_hash": image_hash,
+        **parsed_info
+    }
+    
+    with stage_timer("db_commit"):
+        boleta = await asyncio.to_thread(create_boleta, db, boleta_data)
+    return boleta.id
+
+ocr_job_runner = OCRJobRunner(process_ocr_job)
+
+async def _find_image_duplicate(db, user_id: str, image_hash: str):
+    """Boleta del usuario con la misma imagen, para no repetir el OCR."""
+    if DB_ASYNC:
+        return await crud_async.find_duplicate(db, user_id, image_hash)
+    return find_duplicate(db, user_id, image_hash)
 
 @app.post("/ocr", response_model=BoletaOut)
 async def extract_text(
     file: UploadFile = File(...),
     user: dict = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db = Depends(get_boletas_db)
 ):
     """
-    Extrae texto de una imagen usando OCR y guarda en base de datos.
+    Extrae texto de una imagen (o de todas las páginas de un PDF) usando
+    OCR y guarda en base de datos.
     
     Args:
-        file: Archivo de imagen a procesar
+        file: Archivo de imagen o PDF a procesar
         user: Usuario autenticado
         db: Sesión de base de datos
         
     Returns:
-        Boleta creada con información extraída
+        Boleta creada con información extraída, o la existente (con
+        `duplicate`) si el usuario ya la había subido
     """
     try:
-        # Validar archivo
-        if not file.content_type.startswith('image/'):
-            raise HTTPException(status_code=400, detail="Archivo debe ser una imagen")
+        # Validar archivo y cuota del usuario
+        validate_image_upload(file)
+        ocr_admission.check_rate(user["sub"])
         
-        if file.size and file.size > 10 * 1024 * 1024:  # 10MB
-            raise HTTPException(status_code=400, detail="Archivo demasiado grande (máx 10MB)")
+        # Misma imagen ya guardada: devolverla sin pasar por OCR
+        with stage_timer("upload_read"):
+            data = await file.read()
+        with stage_timer("image_hash"):
+            image_hash = image_digest(data)
+        with stage_timer("dedup_lookup"):
+            existing = await _find_image_duplicate(db, user["sub"], image_hash)
+        if existing is not None:
+            return existing
         
-        # Procesar imagen con OCR
-        image = Image.open(file.file)
-        text = pytesseract.image_to_string(image, lang='spa')
+        # Procesar imagen con OCR en el pool de procesos (con cupo global)
+        async with ocr_admission.slot():
+            text, parsed_info = await extract_receipt(data, image_hash)
         
         if not text.strip():
             raise HTTPException(status_code=400, detail="No se pudo extraer texto de la imagen")
         
-        # Parsear información
-        parsed_info = parse_boleta_text(text)
-        
         # Crear boleta en base de datos
         boleta_data = {
             "nombre_archivo": file.filename,
             "text": text,
             "user_id": user["sub"],
+            "image_hash": image_hash,
             **parsed_info
         }
         
-        boleta = create_boleta(db, boleta_data)
+        with stage_timer("db_commit"):
+            if DB_ASYNC:
+                boleta = await crud_async.create_boleta(db, boleta_data)
+            else:
+                boleta = create_boleta(db, boleta_data)
         logger.info(f"OCR procesado exitosamente para usuario {user['sub']}")
         
         return boleta
         
     except HTTPException:
         raise
+    except AdmissionRejected as e:
+        raise admission_error(e)
+    except InvalidPDF as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except OCRPoolSaturated as e:
+        logger.warning(f"OCR rechazado: {e}")
+        raise ocr_saturated_error()
     except Exception as e:
         logger.error(f"Error procesando OCR: {e}")
         raise HTTPException(status_code=500, detail="Error interno del servidor")
@@ -232,7 +305,7 @@ async def extract_text(
 async def extract_text_from_storage(
     payload: OCRFromStorageRequest,
     user: dict = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db = Depends(get_boletas_db)
 ):
     """
     Extrae texto de una imagen desde Supabase Storage usando URL firmada.
@@ -246,43 +319,71 @@ async def extract_text_from_storage(
         Respuesta con resultado del OCR
     """
     try:
-        # Descargar imagen desde URL firmada
-        async with httpx.AsyncClient() as client:
-            response = await client.get(payload.signedUrl)
-            response.raise_for_status()
-            
-            # Procesar imagen
-            image = Image.open(io.BytesIO(response.content))
-            text = pytesseract.image_to_string(image, lang='spa')
-            
-            if not text.strip():
-                return OCRResponse(
-                    success=False,
-                    error="No se pudo extraer texto de la imagen"
-                )
-            
-            # Parsear información
-            parsed_info = parse_boleta_text(text)
-            
-            # Crear boleta en base de datos
-            boleta_data = {
-                "nombre_archivo": payload.nombre_archivo,
-                "text": text,
-                "user_id": user["sub"],
-                **parsed_info
-            }
-            
-            boleta = create_boleta(db, boleta_data)
-            logger.info(f"OCR desde storage procesado para usuario {user['sub']}")
-            
-            return OCRResponse(success=True, boleta=boleta)
-            
-    except httpx.HTTPError as e:
+        ocr_admission.check_rate(user["sub"])
+        
+        # Descargar imagen desde URL firmada con el cliente compartido
+        with stage_timer("download"):
+            data = await download_image(payload.signedUrl)
+        with stage_timer("image_hash"):
+            image_hash = image_digest(data)
+        with stage_timer("dedup_lookup"):
+            existing = await _find_image_duplicate(db, user["sub"], image_hash)
+        if existing is not None:
+            return OCRResponse(success=True, boleta=existing)
+        
+        # Procesar imagen en el pool de procesos (con cupo global)
+        async with ocr_admission.slot():
+            text, parsed_info = await extract_receipt(data, image_hash)
+        
+        if not text.strip():
+            return OCRResponse(
+                success=False,
+                error="No se pudo extraer texto de la imagen"
+            )
+        
+        # Crear boleta en base de datos
+        boleta_data = {
+            "nombre_archivo": payload.nombre_archivo,
+            "text": text,
+            "user_id": user["sub"],
+            "image_hash": image_hash,
+            **parsed_info
+        }
+        
+        with stage_timer("db_commit"):
+            if DB_ASYNC:
+                boleta = await crud_async.create_boleta(db, boleta_data)
+            else:
+                boleta = create_boleta(db, boleta_data)
+        logger.info(f"OCR desde storage procesado para usuario {user['sub']}")
+        
+        return OCRResponse(success=True, boleta=boleta)
+        
+    except AdmissionRejected as e:
+        raise admission_error(e)
+    except DownloadTooLarge as e:
+        logger.warning(f"Imagen de storage rechazada: {e}")
+        return OCRResponse(
+            success=False,
+            error="Imagen demasiado grande (máx 10MB)"
+        )
+    except DownloadFailed as e:
         logger.error(f"Error descargando imagen: {e}")
         return OCRResponse(
             success=False,
             error="Error descargando imagen desde storage"
         )
+    except InvalidPDF as e:
+        return OCRResponse(
+            success=False,
+            error=str(e)
+        )
+    except OCRPoolSaturated as e:
+        logger.warning(f"OCR desde storage rechazado: {e}")
+        return OCRResponse(
+            success=False,
+            error="Servicio de OCR saturado, intente más tarde"
+        )
     except Exception as e:
         logger.error(f"Error procesando OCR desde storage: {e}")
         return OCRResponse(
@@ -290,19 +391,247 @@ async def extract_text_from_storage(
             error="Error interno del servidor"
         )
 
+async def _ocr_batch_file(file: UploadFile, semaphore: asyncio.Semaphore) -> tuple[str, dict, str]:
+    """
+    Valida y procesa con OCR un archivo de un lote.
+    
+    Returns:
+        Tupla con (texto, información parseada, hash de la imagen)
+        
+    Raises:
+        HTTPException: Si el archivo no es válido o no tiene texto
+    """
+    validate_image_upload(file)
+    # Leer dentro del semáforo: en memoria hay a lo sumo un archivo por proceso del pool
+    async with semaphore:
+        with stage_timer("upload_read"):
+            data = await file.read()
+        if len(data) > 10 * 1024 * 1024:  # 10MB
+            raise HTTPException(status_code=400, detail="Archivo demasiado grande (máx 10MB)")
+        
+        image_hash = image_digest(data)
+        async with ocr_admission.slot():
+            text, parsed_info = await extract_receipt(data, image_hash)
+    
+    if not text.strip():
+        raise HTTPException(status_code=400, detail="No se pudo extraer texto de la imagen")
+    return text, parsed_info, image_hash
+
+@app.post("/ocr/batch", response_model=OCRBatchResponse)
+async def extract_text_batch(
+    files: List[UploadFile] = File(...),
+    user: dict = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Procesa varias imágenes en paralelo y guarda las boletas en una transacción.
+    
+    Los archivos que fallan no impiden guardar el resto; cada uno tiene su
+    propio resultado en la respuesta.
+    
+    Args:
+        files: Archivos de imagen a procesar
+        user: Usuario autenticado
+        db: Sesión de base de datos
+        
+    Returns:
+        Resultado por archivo y totales del lote
+    """
+    if len(files) > OCR_BATCH_MAX_FILES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Demasiados archivos (máx {OCR_BATCH_MAX_FILES} por lote)"
+        )
+    
+    # Cada imagen del lote consume un token de la cuota del usuario
+    try:
+        ocr_admission.check_rate(user["sub"], cost=len(files))
+    except AdmissionRejected as e:
+        raise admission_error(e)
+    
+    # Un lote no ocupa más procesos que los del pool para no llenar la cola
+    semaphore = asyncio.Semaphore(ocr_pool.max_workers)
+    results = await asyncio.gather(
+        *(_ocr_batch_file(file, semaphore) for file in files),
+        return_exceptions=True
+    )
+    
+    items: List[OCRBatchItem] = []
+    pending = []  # (índice en items, datos de la boleta)
+    for file, result in zip(files, results):
+        if isinstance(result, HTTPException):
+            error = result.detail
+        elif isinstance(result, InvalidPDF):
+            error = str(result)
+        elif isinstance(result, (OCRPoolSaturated, AdmissionRejected)):
+            error = "Servicio de OCR saturado, intente más tarde"
+        elif isinstance(result, Exception):
+            logger.error(f"Error procesando OCR de {file.filename}: {result}")
+            error = "Error procesando la imagen"
+        else:
+            error = None
+        
+        items.append(OCRBatchItem(nombre_archivo=file.filename, success=error is None, error=error))
+        if error is None:
+            text, parsed_info, image_hash = result
+            pending.append((len(items) - 1, {
+                "nombre_archivo": file.filename,
+                "text": text,
+                "user_id": user["sub"],
+                "image_hash": image_hash,
+                **parsed_info
+            }))
+    
+    try:
+        with stage_timer("db_commit"):
+            boletas = create_boletas_bulk(db, [data for _, data in pending])
+    except Exception as e:
+        logger.error(f"Error guardando lote de boletas: {e}")
+        for index, _ in pending:
+            items[index].success = False
+            items[index].error = "Error guardando la boleta"
+    else:
+        for (index, _), boleta in zip(pending, boletas):
+            items[index].boleta = BoletaOut.model_validate(boleta)
+    
+    succeeded = sum(1 for item in items if item.success)
+    logger.info(f"Lote OCR procesado para usuario {user['sub']}: {succeeded}/{len(items)} boletas")
+    
+    return OCRBatchResponse(
+        items=items,
+        total=len(items),
+        succeeded=succeeded,
+        failed=len(items) - succeeded
+    )
+
+@app.post("/ocr/jobs", response_model=OCRJobOut, status_code=202)
+async def submit_ocr_job(
+    file: UploadFile = File(...),
+    user: dict = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Encola una imagen para OCR en segundo plano y responde de inmediato.
+    
+    Args:
+        file: Archivo de imagen a procesar
+        user: Usuario autenticado
+        db: Sesión de base de datos
+        
+    Returns:
+        Trabajo creado; su estado se consulta en GET /ocr/jobs/{job_id}
+    """
+    validate_image_upload(file)
+    try:
+        ocr_admission.check_rate(user["sub"])
+    except AdmissionRejected as e:
+        raise admission_error(e)
+    
+    try:
+        data = await file.read()
+        job = create_ocr_job(db, user["sub"], file.filename, data)
+    except Exception as e:
+        logger.error(f"Error encolando OCR: {e}")
+        raise HTTPException(status_code=500, detail="Error interno del servidor")
+    
+    ocr_job_runner.notify()
+    return job
+
+@app.get("/ocr/jobs/{job_id}", response_model=OCRJobOut)
+async def get_ocr_job_status(
+    job_id: str,
+    user: dict = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Consulta el estado de un trabajo de OCR del usuario.
+    
+    Args:
+        job_id: ID del trabajo
+        user: Usuario autenticado
+        db: Sesión de base de datos
+        
+    Returns:
+        Estado del trabajo, con la boleta creada cuando terminó
+    """
+    job = get_ocr_job(db, job_id, user["sub"])
+    if not job:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+    
+    result = OCRJobOut.model_validate(job)
+    if job.status == "done" and job.boleta_id is not None:
+        boleta = get_boleta_by_id(db, job.boleta_id, user["sub"])
+        if boleta:
+            result.boleta = BoletaOut.model_validate(boleta)
+    return result
+
+def _cached_json(body: Optional[bytes], etag: str) -> Response:
+    # no-cache: el navegador guarda la respuesta pero revalida con If-None-Match
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if body is None:
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
+
+async def conditional_lookup(request: Request, db, user_id: str) -> tuple[str, Optional[Response]]:
+    """
+    ETag de una ruta de lectura y, si se puede, la respuesta sin consultar boletas.
+    
+    La versión se lee antes que los datos: si una escritura llega en medio,
+    la respuesta queda guardada con la versión anterior y nunca se sirve
+    con la nueva.
+    
+    Returns:
+        Tupla con (ETag, respuesta 304 o desde cache; None si hay que calcularla)
+    """
+    if DB_ASYNC:
+        version = await crud_async.get_boletas_version(db, user_id)
+    else:
+        version = get_boletas_version(db, user_id)
+    etag = make_etag(user_id, version, request.url.path, request.query_params.multi_items())
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return etag, _cached_json(None, etag)
+    body = response_cache.get(etag)
+    return etag, (_cached_json(body, etag) if body is not None else None)
+
+def cache_response(model, etag: str) -> Response:
+    """Serializa la respuesta de una ruta de lectura y la guarda bajo su ETag."""
+    # Mismo serializador que ORJSONResponse (default_response_class)
+    body = orjson.dumps(model.model_dump(mode="json"))
+    response_cache.put(etag, body)
+    return _cached_json(body, etag)
+
 @app.get("/boletas", response_model=BoletaListResponse)
 async def list_user_boletas(
+    request: Request,
     page: int = Query(1, ge=1, description="Número de página"),
     limit: int = Query(20, ge=1, le=100, description="Items por página"),
+    cursor: Optional[str] = Query(None, description="Cursor de la página anterior (next_cursor)"),
+    include_total: Optional[bool] = Query(None, description="Calcular el total exacto (por defecto solo en modo página)"),
+    include_text: bool = Query(True, description="Incluir el texto OCR de cada boleta (false = items resumidos)"),
     user: dict = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db = Depends(get_boletas_db)
 ):
     """
     Lista boletas del usuario autenticado con paginación.
     
+    Con `cursor` se usa paginación keyset sobre (fecha, id), de costo
+    constante sin importar la profundidad; `page` se ignora. Todas las
+    respuestas incluyen `next_cursor` cuando hay más resultados.
+    
+    Por defecto los items incluyen el texto OCR, como siempre. Con
+    `include_text=false` se devuelven items resumidos sin leer el texto de
+    la base; el texto de una boleta se obtiene con GET /boletas/{id}.
+    
+    La respuesta lleva ETag: con `If-None-Match` y sin cambios en las
+    boletas del usuario se responde 304 sin consultarlas.
+    
     Args:
         page: Número de página (1-based)
         limit: Límite de items por página (máx 100)
+        cursor: Cursor devuelto en `next_cursor` por la página anterior
+        include_total: Si se calcula el total de boletas
+        include_text: Si los items incluyen el texto OCR
+        request: Request (If-None-Match y parámetros para el ETag)
         user: Usuario autenticado
         db: Sesión de base de datos
         
@@ -310,30 +639,66 @@ async def list_user_boletas(
         Lista paginada de boletas del usuario
     """
     try:
-        items, total = list_boletas(db, user["sub"], page, limit)
-        pages = (total + limit - 1) // limit  # Calcular total de páginas
+        etag, cached = await conditional_lookup(request, db, user["sub"])
+        if cached is not None:
+            return cached
+        
+        if cursor is not None:
+            args = (db, user["sub"], cursor, limit)
+            options = {"include_total": bool(include_total), "include_text": include_text}
+            if DB_ASYNC:
+                items, next_cursor, total = await crud_async.list_boletas_after(*args, **options)
+            else:
+                items, next_cursor, total = list_boletas_after(*args, **options)
+            page = None
+        else:
+            args = (db, user["sub"], page, limit)
+            options = {"include_total": include_total is not False, "include_text": include_text}
+            if DB_ASYNC:
+                items, total = await crud_async.list_boletas(*args, **options)
+            else:
+                items, total = list_boletas(*args, **options)
+            has_more = page * limit < total if total is not None else len(items) == limit
+            next_cursor = encode_cursor(items[-1]) if items and has_more else None
         
-        return BoletaListResponse(
-            items=[BoletaOut.model_validate(item) for item in items],
+        pages = (total + limit - 1) // limit if total is not None else None  # Calcular total de páginas
+        
+        schema = BoletaOut if include_text else BoletaSummary
+        return cache_response(BoletaListResponse(
+            items=[schema.model_validate(item) for item in items],
             total=total,
             page=page,
             limit=limit,
-            pages=pages
-        )
+            pages=pages,
+            next_cursor=next_cursor
+        ), etag)
         
+    except InvalidCursor as e:
+        logger.warning(f"Cursor rechazado: {e}")
+        raise HTTPException(status_code=400, detail="Cursor inválido")
     except Exception as e:
         logger.error(f"Error listando boletas: {e}")
         raise HTTPException(status_code=500, detail="Error interno del servidor")
 
-@app.get("/boletas/stats")
+@app.get("/boletas/stats", response_model=BoletaStats)
 async def get_user_stats(
+    request: Request,
+    date_from: Optional[date] = Query(None, description="Fecha de boleta mínima (YYYY-MM-DD)"),
+    date_to: Optional[date] = Query(None, description="Fecha de boleta máxima (YYYY-MM-DD)"),
+    top_merchants: int = Query(10, ge=1, le=100, description="Comercios en el desglose"),
     user: dict = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db = Depends(get_boletas_db)
 ):
     """
     Obtiene estadísticas de las boletas del usuario.
     
+    Con ETag y cache de respuestas, como GET /boletas.
+    
     Args:
+        date_from: Fecha de boleta mínima (inclusive)
+        date_to: Fecha de boleta máxima (inclusive)
+        top_merchants: Cantidad de comercios en el desglose
+        request: Request (If-None-Match y parámetros para el ETag)
         user: Usuario autenticado
         db: Sesión de base de datos
         
@@ -341,13 +706,137 @@ async def get_user_stats(
         Estadísticas de boletas del usuario
     """
     try:
-        stats = get_boletas_stats(db, user["sub"])
-        return stats
+        etag, cached = await conditional_lookup(request, db, user["sub"])
+        if cached is not None:
+            return cached
+        
+        args = (db, user["sub"], date_from, date_to, top_merchants)
+        if DB_ASYNC:
+            stats = await crud_async.get_boletas_stats(*args, use_rollup=STATS_USE_ROLLUP)
+        else:
+            stats = get_boletas_stats(*args, use_rollup=STATS_USE_ROLLUP)
+        return cache_response(BoletaStats.model_validate(stats), etag)
         
     except Exception as e:
         logger.error(f"Error obteniendo estadísticas: {e}")
         raise HTTPException(status_code=500, detail="Error interno del servidor")
 
+@app.get("/boletas/search", response_model=BoletaSearchResponse)
+async def search_user_boletas(
+    q: Optional[str] = Query(None, max_length=200, description="Palabras a buscar en comercio y texto OCR"),
+    merchant: Optional[str] = Query(None, max_length=200, description="Prefijo del comercio"),
+    min_amount: Optional[float] = Query(None, ge=0, description="Monto mínimo"),
+    max_amount: Optional[float] = Query(None, ge=0, description="Monto máximo"),
+    date_from: Optional[date] = Query(None, description="Fecha de boleta mínima (YYYY-MM-DD)"),
+    date_to: Optional[date] = Query(None, description="Fecha de boleta máxima (YYYY-MM-DD)"),
+    limit: int = Query(20, ge=1, le=100, description="Resultados por página"),
+    offset: int = Query(0, ge=0, le=10000, description="Resultados a saltar"),
+    user: dict = Depends(get_current_user),
+    db = Depends(get_boletas_db)
+):
+    """
+    Busca boletas del usuario con filtros y búsqueda de texto completo.
+    
+    `q` usa el índice de texto completo (tsvector en Postgres, FTS5 en
+    SQLite) y ordena por relevancia; los demás filtros usan los índices
+    compuestos por usuario de sql/004_boletas_search.sql.
+    
+    Args:
+        q: Palabras a buscar (todas deben aparecer)
+        merchant: Prefijo del comercio, sin distinguir mayúsculas
+        min_amount: Monto mínimo (inclusive)
+        max_amount: Monto máximo (inclusive)
+        date_from: Fecha de boleta mínima (inclusive)
+        date_to: Fecha de boleta máxima (inclusive)
+        limit: Resultados por página (máx 100)
+        offset: Resultados a saltar
+        user: Usuario autenticado
+        db: Sesión de base de datos
+        
+    Returns:
+        Boletas encontradas, sin texto OCR
+    """
+    filters = {
+        "q": q, "merchant": merchant, "min_amount": min_amount, "max_amount": max_amount,
+        "date_from": date_from, "date_to": date_to
+    }
+    try:
+        if DB_ASYNC:
+            items, has_more = await crud_async.search_boletas(db, user["sub"], limit, offset, **filters)
+        else:
+            items, has_more = search_boletas(db, user["sub"], limit, offset, **filters)
+        
+        return BoletaSearchResponse(
+            items=[BoletaSummary.model_validate(item) for item in items],
+            limit=limit,
+            offset=offset,
+            next_offset=offset + limit if has_more else None
+        )
+        
+    except Exception as e:
+        logger.error(f"Error buscando boletas: {e}")
+        raise HTTPException(status_code=500, detail="Error interno del servidor")
+
+@app.get("/boletas/export")
+async def export_user_boletas(
+    export_format: str = Query("csv", alias="format", pattern="^(csv|ndjson)$", description="csv o ndjson"),
+    include_text: bool = Query(False, description="Incluir el texto OCR de cada boleta"),
+    user: dict = Depends(get_current_user),
+    session_factory = Depends(get_session_factory)
+):
+    """
+    Exporta todas las boletas del usuario en streaming.
+    
+    Las filas se leen con un cursor del lado del servidor y se envían por
+    bloques, así que la memoria no crece con la cantidad de boletas y la
+    descarga empieza antes de terminar la consulta.
+    
+    Args:
+        export_format: Formato de salida ('csv' o 'ndjson')
+        include_text: Si se incluye el texto OCR
+        user: Usuario autenticado
+        session_factory: Fábrica de sesiones (la sesión vive lo que dura la descarga)
+        
+    Returns:
+        Archivo con las boletas, ordenadas de la más reciente a la más antigua
+    """
+    filename = f"boletas.{export_format}"
+    return StreamingResponse(
+        stream_export(session_factory, user["sub"], export_format, include_text),
+        media_type=MEDIA_TYPES[export_format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@app.get("/boletas/{boleta_id:int}", response_model=BoletaOut)
+async def get_user_boleta(
+    boleta_id: int,
+    user: dict = Depends(get_current_user),
+    db = Depends(get_boletas_db)
+):
+    """
+    Obtiene una boleta del usuario, con su texto OCR.
+    
+    Args:
+        boleta_id: ID de la boleta
+        user: Usuario autenticado
+        db: Sesión de base de datos
+        
+    Returns:
+        Boleta completa
+    """
+    if DB_ASYNC:
+        boleta = await crud_async.get_boleta_by_id(db, boleta_id, user["sub"])
+    else:
+        boleta = get_boleta_by_id(db, boleta_id, user["sub"])
+    if boleta is None:
+        raise HTTPException(status_code=404, detail="Boleta no encontrada")
+    return boleta
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics_endpoint():
+    """Métricas del proceso en formato de texto de Prometheus."""
+    return Response(content=metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
+
 @app.get("/health")
 async def health_check():
     """Endpoint de salud del sistema."""
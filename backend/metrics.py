@@ -0,0 +1,240 @@
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+from typing import Callable, Iterable, Optional
+
+# Métricas en memoria del proceso, expuestas en GET /metrics con el formato
+# de texto de Prometheus (sin depender de un servicio ni de prometheus_client).
+# Con varios workers de uvicorn cada proceso reporta las suyas.
+
+# Límites (segundos) de los histogramas de latencia
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+def _escape(value) -> str:
+    return str(value).replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"")
+
+def _format_labels(labelnames: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Metric:
+    """Base de las métricas: nombre, ayuda y etiquetas."""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} requiere las etiquetas {self.labelnames}, no {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        header = f"# HELP {self.name} {self.documentation}\n# TYPE {self.name} {self.kind}\n"
+        return header + "".join(f"{line}\n" for line in self.samples())
+
+class Counter(Metric):
+    """Contador que solo aumenta."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: dict = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        # Sin etiquetas se reporta 0 desde el inicio, como hace prometheus_client
+        values = self._values or ({} if self.labelnames else {(): 0})
+        for key, value in sorted(values.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+class Gauge(Metric):
+    """
+    Valor que sube y baja.
+
+    Con `fn` el valor se lee al renderizar (p.ej. el tamaño de una cola):
+    `fn()` devuelve un número, o un dict {tupla de etiquetas: número}.
+    """
+
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Iterable[str] = (),
+        fn: Optional[Callable[[], object]] = None
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.fn = fn
+        self._values: dict = {}
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def _current(self) -> dict:
+        if self.fn is None:
+            return dict(self._values)
+        value = self.fn()
+        return value if isinstance(value, dict) else {(): value}
+
+    def samples(self):
+        for key, value in sorted(self._current().items()):
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+class CounterFunc(Gauge):
+    """Contador mantenido por otro objeto (p.ej. `ocr_cache.hits`), leído con `fn`."""
+
+    kind = "counter"
+
+class Histogram(Metric):
+    """Distribución de valores (latencias) en buckets acumulativos."""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Iterable[str] = (),
+        buckets: Iterable[float] = DEFAULT_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: dict = {}     # etiquetas -> [conteos por bucket, suma, total]
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observa los segundos que tarda el bloque `with`."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels) -> int:
+        series = self._series.get(self._key(labels))
+        return series[2] if series else 0
+
+    def samples(self):
+        series = self._series or ({} if self.labelnames else {(): [[0] * (len(self.buckets) + 1), 0.0, 0]})
+        for key, (counts, total, count) in sorted(series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, key)} {count}"
+
+class Registry:
+    """Conjunto de métricas que se exponen juntas."""
+
+    def __init__(self):
+        self._metrics: dict = {}
+
+    def register(self, metric: Metric) -> Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Métrica duplicada: {metric.name}")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Iterable[str] = (), fn=None) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames, fn))
+
+    def counter_func(self, name: str, documentation: str, fn, labelnames: Iterable[str] = ()) -> CounterFunc:
+        return self.register(CounterFunc(name, documentation, labelnames, fn))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Iterable[str] = (),
+        buckets: Iterable[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """Todas las métricas en formato de texto de Prometheus."""
+        return "".join(metric.render() for metric in self._metrics.values())
+
+# Registro global del proceso
+registry = Registry()
+
+HTTP_REQUEST_SECONDS = registry.histogram(
+    "http_request_duration_seconds", "Latencia de las requests HTTP por ruta",
+    ("method", "route", "status")
+)
+
+# Etapas del pipeline de OCR: upload_read, image_hash, dedup_lookup,
+# cache_lookup, pool_wait, decode/draft/exif_rotate/... (pasos de preprocess),
+# tesseract, parse, db_commit
+OCR_STAGE_SECONDS = registry.histogram(
+    "ocr_stage_duration_seconds", "Duración de cada etapa del pipeline de OCR", ("stage",)
+)
+
+DB_POOL_CHECKOUT_SECONDS = registry.histogram(
+    "db_pool_checkout_wait_seconds", "Espera para obtener una conexión del pool de la base de datos"
+)
+
+def stage_timer(stage: str):
+    """Context manager que mide una etapa del pipeline de OCR."""
+    return OCR_STAGE_SECONDS.time(stage=stage)
+
+def observe_stages(timings: dict):
+    """Registra los segundos por etapa que devuelve el proceso de OCR."""
+    for stage, seconds in timings.items():
+        OCR_STAGE_SECONDS.observe(seconds, stage=stage)
+
+def hit_ratio(hits: int, misses: int) -> float:
+    total = hits + misses
+    return hits / total if total else 0.0
@@ -1,20 +1,157 @@
-from sqlalchemy.orm import Mapped, mapped_column
-from sqlalchemy import Text, Numeric, Date, BigInteger, String
+import os
+import uuid
+import zlib
+from sqlalchemy.orm import Mapped, mapped_column, column_property
+from sqlalchemy import Text, Numeric, Date, BigInteger, String, Integer, LargeBinary, Index, ForeignKey, select, text
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.types import TypeDecorator
 from datetime import datetime
 from db import Base
 
+# Nivel de zlib del texto OCR en boleta_texts (1 = más rápido, 9 = más chico)
+TEXT_COMPRESSION_LEVEL = int(os.getenv("TEXT_COMPRESSION_LEVEL", "6"))
+
+class CompressedText(TypeDecorator):
+    """
+    Texto guardado como bytes zlib; se comprime y descomprime en Python.
+    
+    Lee también UTF-8 sin comprimir: lo que escribe el trigger de
+    sql/007_boleta_texts.sql cuando se inserta `boletas.text` directamente.
+    """
+    impl = LargeBinary
+    cache_ok = True
+    
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return zlib.compress(value.encode("utf-8"), TEXT_COMPRESSION_LEVEL)
+    
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        try:
+            return zlib.decompress(value).decode("utf-8")
+        except zlib.error:
+            return bytes(value).decode("utf-8")
+
+class BoletaText(Base):
+    """
+    Texto OCR de una boleta, fuera de `boletas` y comprimido.
+    
+    Cada boleta tiene un registro (aunque no tenga texto, por la búsqueda).
+    En Postgres `search_vector` guarda el documento de búsqueda de comercio
+    + texto, que ya no se puede calcular desde `boletas` (ver search.py).
+    """
+    __tablename__ = "boleta_texts"
+    
+    boleta_id: Mapped[int] = mapped_column(
+        BigInteger().with_variant(Integer, "sqlite"),
+        # Diferida: el trigger de Postgres lo inserta antes que la boleta
+        ForeignKey("boletas.id", ondelete="CASCADE", deferrable=True, initially="DEFERRED"),
+        primary_key=True
+    )
+    text: Mapped[str | None] = mapped_column(CompressedText, nullable=True)
+    text_size: Mapped[int] = mapped_column(Integer, default=0, nullable=False)  # bytes UTF-8 sin comprimir
+    # En SQLite la búsqueda usa la tabla FTS5 boletas_fts y esta columna queda en NULL
+    search_vector: Mapped[str | None] = mapped_column(TSVECTOR().with_variant(Text, "sqlite"), nullable=True)
+    
+    def __repr__(self):
+        return f"<BoletaText(boleta_id={self.boleta_id}, text_size={self.text_size})>"
+
 class Boleta(Base):
     __tablename__ = "boletas"
+    # Índices de los filtros de /boletas/search (en Postgres ver sql/004_boletas_search.sql)
+    __table_args__ = (
+        Index("boletas_user_date_idx", "user_id", "date"),
+        Index("boletas_user_amount_idx", "user_id", "total_amount"),
+        Index("boletas_user_merchant_idx", "user_id", text("lower(merchant)")),
+        # Detección de duplicados (ver dedup.py y sql/005_boletas_dedup.sql)
+        Index("boletas_user_image_hash_idx", "user_id", "image_hash", unique=True),
+        Index("boletas_user_fingerprint_idx", "user_id", "fingerprint"),
+    )
     
-    id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=True)
+    # En SQLite solo INTEGER PRIMARY KEY es autoincremental
+    id: Mapped[int] = mapped_column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True)
     nombre_archivo: Mapped[str] = mapped_column(Text, nullable=False)
-    text: Mapped[str | None] = mapped_column(Text, nullable=True)
     merchant: Mapped[str | None] = mapped_column(Text, nullable=True)
     total_amount: Mapped[float | None] = mapped_column(Numeric(12,2), nullable=True)
     date: Mapped[datetime | None] = mapped_column(Date, nullable=True)
     confidence: Mapped[float | None] = mapped_column(Numeric(4,3), nullable=True)
     fecha: Mapped[datetime] = mapped_column(default=datetime.utcnow, nullable=False)
     user_id: Mapped[str] = mapped_column(String, nullable=False)
+    image_hash: Mapped[str | None] = mapped_column(String(64), nullable=True)   # SHA-256 de la imagen
+    fingerprint: Mapped[str | None] = mapped_column(String(64), nullable=True)  # comercio + monto + fecha
+    
+    # Texto OCR desde boleta_texts, diferido: solo se lee al accederlo o con
+    # `undefer(Boleta.text)`, así las listas y estadísticas no tocan esa tabla.
+    # Es de solo lectura: se escribe con boleta_texts.insert_statements.
+    text: Mapped[str | None] = column_property(
+        select(BoletaText.text).where(BoletaText.boleta_id == id).scalar_subquery(),
+        deferred=True
+    )
+    
+    # No es columna: 'image' o 'fingerprint' cuando create_boleta devuelve una boleta ya existente
+    duplicate = None
     
     def __repr__(self):
         return f"<Boleta(id={self.id}, nombre_archivo='{self.nombre_archivo}', user_id='{self.user_id}')>"
+
+class OCRJob(Base):
+    """Trabajo de OCR encolado para procesamiento en segundo plano"""
+    __tablename__ = "ocr_jobs"
+    __table_args__ = (
+        Index("ocr_jobs_status_created_idx", "status", "created_at"),
+    )
+    
+    id: Mapped[str] = mapped_column(String(32), primary_key=True, default=lambda: uuid.uuid4().hex)
+    user_id: Mapped[str] = mapped_column(String, nullable=False)
+    nombre_archivo: Mapped[str] = mapped_column(Text, nullable=False)
+    status: Mapped[str] = mapped_column(String(16), default="pending", nullable=False)
+    image: Mapped[bytes | None] = mapped_column(LargeBinary, nullable=True)
+    boleta_id: Mapped[int | None] = mapped_column(BigInteger, nullable=True)
+    error: Mapped[str | None] = mapped_column(Text, nullable=True)
+    attempts: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(default=datetime.utcnow, nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(default=datetime.utcnow, nullable=False)
+    
+    def __repr__(self):
+        return f"<OCRJob(id='{self.id}', status='{self.status}', user_id='{self.user_id}')>"
+
+class BoletaStatsRollup(Base):
+    """
+    Agregados por usuario mantenidos al crear o eliminar boletas.
+    
+    `kind` indica la dimensión: 'all' (un registro por usuario, bucket ''),
+    'month' (bucket 'YYYY-MM', '' sin fecha) o 'merchant' (bucket = comercio,
+    '' sin comercio).
+    """
+    __tablename__ = "boleta_stats_rollup"
+    
+    user_id: Mapped[str] = mapped_column(String, primary_key=True)
+    kind: Mapped[str] = mapped_column(String(16), primary_key=True)
+    bucket: Mapped[str] = mapped_column(Text, primary_key=True)
+    count: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    amount_count: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    amount_sum: Mapped[float] = mapped_column(Numeric(14,2), default=0, nullable=False)
+    amount_min: Mapped[float | None] = mapped_column(Numeric(12,2), nullable=True)
+    amount_max: Mapped[float | None] = mapped_column(Numeric(12,2), nullable=True)
+    confidence_count: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    confidence_sum: Mapped[float] = mapped_column(Numeric(14,3), default=0, nullable=False)
+    
+    def __repr__(self):
+        return f"<BoletaStatsRollup(user_id='{self.user_id}', kind='{self.kind}', bucket='{self.bucket}')>"
+
+class BoletaVersion(Base):
+    """
+    Versión de las boletas de un usuario, para ETags y cache de respuestas.
+    
+    Se incrementa en la misma transacción que crea o elimina boletas; los
+    registros nunca se borran, así una versión no se repite.
+    """
+    __tablename__ = "boleta_versions"
+    
+    user_id: Mapped[str] = mapped_column(String, primary_key=True)
+    version: Mapped[int] = mapped_column(BigInteger, default=0, nullable=False)
+    
+    def __repr__(self):
+        return f"<BoletaVersion(user_id='{self.user_id}', version={self.version})>"
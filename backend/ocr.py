@@ -0,0 +1,226 @@
+import io
+import os
+import time
+import asyncio
+import logging
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from preprocess import PREPROCESS_CONFIG, preprocess_image
+from pdf import PDF_RENDER_DPI, PDF_MAX_PAGES, PDF_PAGE_CONCURRENCY, InvalidPDF, page_count, render_page
+from metrics import registry, observe_stages
+
+logger = logging.getLogger(__name__)
+
+# Configuración del pool de OCR
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", "0")) or (os.cpu_count() or 1)
+OCR_QUEUE_SIZE = int(os.getenv("OCR_QUEUE_SIZE", str(OCR_WORKERS * 4)))
+OCR_LANG = os.getenv("OCR_LANG", "spa")
+OCR_TESSERACT_CONFIG = os.getenv("OCR_TESSERACT_CONFIG", "")
+
+class OCRPoolSaturated(Exception):
+    """Se lanza cuando el pool de OCR y su cola de espera están llenos."""
+
+def _load_ocr_modules():
+    """
+    Importa pytesseract y PIL. Corre al iniciar cada proceso del pool, así
+    el proceso de la API no los carga y la primera imagen no paga el import.
+    """
+    import pytesseract
+    from PIL import Image
+
+    return pytesseract, Image
+
+def ocr_image_bytes(data: bytes, lang: str = OCR_LANG, config: str = OCR_TESSERACT_CONFIG) -> tuple[str, dict]:
+    """
+    Preprocesa una imagen y ejecuta Tesseract. Corre dentro de un proceso del pool.
+
+    Args:
+        data: Bytes de la imagen
+        lang: Idioma de Tesseract
+        config: Opciones adicionales de Tesseract (p.ej. "--oem 1 --psm 6")
+
+    Returns:
+        Tupla con (texto extraído, segundos por etapa)
+    """
+    pytesseract, Image = _load_ocr_modules()
+    with Image.open(io.BytesIO(data)) as image:
+        processed, timings = preprocess_image(image, PREPROCESS_CONFIG)
+        start = time.perf_counter()
+        text = pytesseract.image_to_string(processed, lang=lang, config=config)
+        timings["tesseract"] = time.perf_counter() - start
+    return text, timings
+
+def ocr_pdf_page(
+    path: str,
+    index: int,
+    lang: str = OCR_LANG,
+    config: str = OCR_TESSERACT_CONFIG,
+    dpi: int = PDF_RENDER_DPI
+) -> tuple[str, dict]:
+    """
+    Rasteriza una página de un PDF, la preprocesa y ejecuta Tesseract.
+    Corre dentro de un proceso del pool.
+
+    Returns:
+        Tupla con (texto de la página, segundos por etapa)
+    """
+    pytesseract, _ = _load_ocr_modules()
+    image, render_seconds = render_page(path, index, dpi, PREPROCESS_CONFIG.max_dimension)
+    with image:
+        processed, timings = preprocess_image(image, PREPROCESS_CONFIG)
+        start = time.perf_counter()
+        text = pytesseract.image_to_string(processed, lang=lang, config=config)
+        timings["tesseract"] = time.perf_counter() - start
+    return text, {"pdf_render": render_seconds, **timings}
+
+def _write_file(fd: int, data: bytes):
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+
+class OCRPool:
+    """
+    Pool de procesos para OCR con cola acotada.
+
+    Mantiene el event loop libre mientras Tesseract procesa imágenes en
+    paralelo, y rechaza trabajo nuevo cuando hay más de
+    `max_workers + queue_size` tareas en curso.
+    """
+
+    def __init__(self, max_workers: int | None = None, queue_size: int | None = None):
+        self.max_workers = max_workers or OCR_WORKERS
+        self.queue_size = OCR_QUEUE_SIZE if queue_size is None else queue_size
+        self._executor: ProcessPoolExecutor | None = None
+        self._pending = 0
+        self._page_slots: tuple | None = None     # (event loop, semáforo de páginas de PDF)
+
+    @property
+    def pending(self) -> int:
+        """Tareas enviadas al pool que aún no terminan (en ejecución o en cola)."""
+        return self._pending
+
+    @property
+    def capacity(self) -> int:
+        return self.max_workers + self.queue_size
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers, initializer=_load_ocr_modules)
+            logger.info(f"Pool de OCR iniciado con {self.max_workers} procesos")
+        return self._executor
+
+    async def run(self, fn, *args):
+        """
+        Ejecuta `fn(*args)` en el pool sin bloquear el event loop.
+
+        Raises:
+            OCRPoolSaturated: Si la cola de espera está llena
+        """
+        if self._pending >= self.capacity:
+            raise OCRPoolSaturated(
+                f"Pool de OCR saturado ({self._pending}/{self.capacity} tareas)"
+            )
+
+        self._pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), fn, *args)
+        except BrokenProcessPool:
+            # Un proceso murió (p.ej. OOM); se recrea el pool en la próxima tarea
+            logger.error("Pool de OCR roto, se recreará")
+            self._executor = None
+            raise
+        finally:
+            self._pending -= 1
+
+    def _page_semaphore(self) -> asyncio.Semaphore:
+        """
+        Semáforo de páginas de PDF compartido por todas las requests.
+
+        Admisión cuenta un PDF como una sola request, así que sus páginas no
+        pueden ocupar más de un proceso cada una: entre todos los PDFs hay a
+        lo sumo `max_workers` páginas en el pool y la cola queda para las
+        demás requests admitidas. Se crea por event loop (los tests usan
+        varios).
+        """
+        loop = asyncio.get_running_loop()
+        if self._page_slots is None or self._page_slots[0] is not loop:
+            self._page_slots = (loop, asyncio.Semaphore(self.max_workers))
+        return self._page_slots[1]
+
+    async def _run_timed(self, fn, *args) -> str:
+        """Ejecuta una función de OCR que devuelve (texto, segundos por etapa) y registra las etapas."""
+        start = time.perf_counter()
+        text, timings = await self.run(fn, *args)
+        # Lo que no gastó el proceso fue espera en la cola del pool (y envío de la imagen)
+        pool_wait = time.perf_counter() - start - sum(timings.values())
+        observe_stages({"pool_wait": max(pool_wait, 0.0), **timings})
+        logger.debug("Etapas de OCR: " + ", ".join(f"{step}={secs * 1000:.1f}ms" for step, secs in timings.items()))
+        return text
+
+    async def image_to_string(self, data: bytes, lang: str = OCR_LANG) -> str:
+        """Extrae texto de una imagen usando un proceso del pool."""
+        return await self._run_timed(ocr_image_bytes, data, lang, OCR_TESSERACT_CONFIG)
+
+    async def pdf_to_string(self, data: bytes, lang: str = OCR_LANG) -> str:
+        """
+        Extrae el texto de todas las páginas de un PDF, en paralelo.
+
+        El PDF se escribe en un archivo temporal y cada proceso del pool
+        rasteriza solo su página, así en memoria hay a lo sumo
+        `PDF_PAGE_CONCURRENCY` páginas (por defecto, una por proceso). Las
+        páginas de todos los PDFs comparten además `_page_semaphore()`, así
+        varios PDFs admitidos a la vez esperan su turno en vez de llenar la
+        cola del pool.
+
+        Returns:
+            Texto de las páginas en orden, separadas por salto de línea
+
+        Raises:
+            InvalidPDF: Si el PDF no se puede abrir o supera PDF_MAX_PAGES
+            OCRPoolSaturated: Si la cola del pool se llena
+        """
+        fd, path = tempfile.mkstemp(suffix=".pdf")
+        try:
+            await asyncio.to_thread(_write_file, fd, data)
+            pages = await self.run(page_count, path)
+            if pages > PDF_MAX_PAGES:
+                raise InvalidPDF(f"PDF con {pages} páginas (máx {PDF_MAX_PAGES})")
+
+            semaphore = asyncio.Semaphore(PDF_PAGE_CONCURRENCY or self.max_workers)
+
+            page_slots = self._page_semaphore()
+
+            async def ocr_page(index: int) -> str:
+                async with semaphore, page_slots:
+                    return await self._run_timed(ocr_pdf_page, path, index, lang, OCR_TESSERACT_CONFIG, PDF_RENDER_DPI)
+
+            tasks = [asyncio.ensure_future(ocr_page(index)) for index in range(pages)]
+            try:
+                texts = await asyncio.gather(*tasks)
+            except BaseException:
+                # Una página falló: no seguir con las que esperan su turno
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                raise
+        finally:
+            os.unlink(path)
+        return "\n".join(texts)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+def ocr_settings(lang: str = OCR_LANG, pdf: bool = False) -> tuple[str, ...]:
+    """Parámetros que determinan el texto que produce el OCR (para claves de cache)."""
+    settings = (lang, OCR_TESSERACT_CONFIG, PREPROCESS_CONFIG.signature())
+    return settings + (f"pdf_dpi={PDF_RENDER_DPI}",) if pdf else settings
+
+# Pool compartido por los endpoints de OCR
+ocr_pool = OCRPool()
+
+registry.gauge("ocr_pool_pending", "Tareas de OCR en ejecución o en cola", fn=lambda: ocr_pool.pending)
+registry.gauge("ocr_pool_capacity", "Máximo de tareas de OCR antes de rechazar (503)", fn=lambda: ocr_pool.capacity)
@@ -0,0 +1,235 @@
+import os
+import json
+import asyncio
+import hashlib
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import date
+
+from metrics import registry, hit_ratio
+
+logger = logging.getLogger(__name__)
+
+# Configuración del cache de resultados de OCR
+OCR_CACHE_MAX_BYTES = int(os.getenv("OCR_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+OCR_CACHE_DIR = os.getenv("OCR_CACHE_DIR") or None
+OCR_CACHE_DISK_MAX_BYTES = int(os.getenv("OCR_CACHE_DISK_MAX_BYTES", str(512 * 1024 * 1024)))
+
+# Se incrementa cuando cambia el formato de las entradas o el parser
+CACHE_VERSION = "1"
+
+# Overhead aproximado por entrada en memoria (dict, claves, objetos)
+_ENTRY_OVERHEAD = 512
+
+def image_digest(data: bytes) -> str:
+    """Hash SHA-256 del contenido de una imagen."""
+    return hashlib.sha256(data).hexdigest()
+
+def cache_key(digest: str, *settings: str) -> str:
+    """
+    Clave de cache para una imagen y la configuración de OCR usada.
+
+    Args:
+        digest: Hash de la imagen (ver `image_digest`)
+        settings: Parámetros que cambian el resultado (idioma, config de Tesseract...)
+    """
+    material = "|".join((CACHE_VERSION, digest, *settings))
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+@dataclass
+class CachedOCR:
+    """Texto de OCR y resultado de `parse_boleta_text` para una imagen."""
+    text: str
+    parsed: dict
+
+    @property
+    def size(self) -> int:
+        return len(self.text.encode("utf-8")) + _ENTRY_OVERHEAD
+
+    def to_json(self) -> str:
+        parsed = dict(self.parsed)
+        if isinstance(parsed.get("date"), date):
+            parsed["date"] = parsed["date"].isoformat()
+        return json.dumps({"text": self.text, "parsed": parsed})
+
+    @classmethod
+    def from_json(cls, raw: str) -> "CachedOCR":
+        data = json.loads(raw)
+        parsed = data["parsed"]
+        if parsed.get("date"):
+            parsed["date"] = date.fromisoformat(parsed["date"])
+        return cls(text=data["text"], parsed=parsed)
+
+class OCRCache:
+    """
+    Cache de resultados de OCR con dos niveles.
+
+    - Memoria: LRU acotado por tamaño total en bytes.
+    - Disco (opcional): un archivo JSON por entrada en `disk_dir`; al superar
+      `disk_max_bytes` se eliminan los archivos usados hace más tiempo.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = OCR_CACHE_MAX_BYTES,
+        disk_dir: str | None = OCR_CACHE_DIR,
+        disk_max_bytes: int = OCR_CACHE_DISK_MAX_BYTES
+    ):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self._entries: "OrderedDict[str, CachedOCR]" = OrderedDict()
+        self._bytes = 0
+        self._disk_bytes: int | None = None
+        # `get`/`put` también corren en hilos cuando hay nivel en disco
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def size_bytes(self) -> int:
+        return self._bytes
+
+    # --- Nivel en memoria -------------------------------------------------
+
+    def _memory_get(self, key: str) -> CachedOCR | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def _memory_put(self, key: str, entry: CachedOCR):
+        if entry.size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous.size
+            self._entries[key] = entry
+            self._bytes += entry.size
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.size
+
+    # --- Nivel en disco ---------------------------------------------------
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, key[:2], f"{key}.json")
+
+    def _disk_get(self, key: str) -> CachedOCR | None:
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = CachedOCR.from_json(f.read())
+            os.utime(path)  # marcar como usado recientemente
+            return entry
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Entrada de cache de OCR ilegible {path}: {e}")
+            return None
+
+    def _disk_put(self, key: str, entry: CachedOCR):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        payload = entry.to_json().encode("utf-8")
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, "wb") as f:
+            f.write(payload)
+        os.replace(tmp_path, path)
+
+        if self._disk_bytes is None:
+            self._disk_bytes = sum(size for _, size, _ in self._disk_files())
+        else:
+            self._disk_bytes += len(payload)
+        if self._disk_bytes > self.disk_max_bytes:
+            self._disk_evict()
+
+    def _disk_files(self):
+        for root, _, names in os.walk(self.disk_dir):
+            for name in names:
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield path, stat.st_size, stat.st_mtime
+
+    def _disk_evict(self):
+        """Elimina los archivos menos usados hasta quedar en el 90% del límite."""
+        files = sorted(self._disk_files(), key=lambda item: item[2])
+        total = sum(size for _, size, _ in files)
+        target = int(self.disk_max_bytes * 0.9)
+        for path, size, _ in files:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except FileNotFoundError:
+                pass
+        self._disk_bytes = total
+
+    # --- API --------------------------------------------------------------
+
+    def get(self, key: str) -> CachedOCR | None:
+        """Busca una entrada en memoria y luego en disco."""
+        entry = self._memory_get(key)
+        if entry is None and self.disk_dir:
+            entry = self._disk_get(key)
+            if entry is not None:
+                self._memory_put(key, entry)
+
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return CachedOCR(text=entry.text, parsed=dict(entry.parsed))
+
+    def put(self, key: str, text: str, parsed: dict):
+        """Guarda el resultado de OCR en memoria y, si está configurado, en disco."""
+        entry = CachedOCR(text=text, parsed=dict(parsed))
+        self._memory_put(key, entry)
+        if self.disk_dir:
+            try:
+                self._disk_put(key, entry)
+            except OSError as e:
+                logger.warning(f"No se pudo escribir el cache de OCR en disco: {e}")
+
+    async def lookup(self, key: str) -> CachedOCR | None:
+        """Versión async de `get`; la lectura de disco no bloquea el event loop."""
+        if key in self._entries or not self.disk_dir:
+            return self.get(key)
+        return await asyncio.to_thread(self.get, key)
+
+    async def store(self, key: str, text: str, parsed: dict):
+        """Versión async de `put`."""
+        if not self.disk_dir:
+            self.put(key, text, parsed)
+        else:
+            await asyncio.to_thread(self.put, key, text, parsed)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+# Cache compartido por los endpoints de OCR
+ocr_cache = OCRCache()
+
+registry.counter_func("ocr_cache_hits_total", "Consultas al cache de OCR con resultado", lambda: ocr_cache.hits)
+registry.counter_func("ocr_cache_misses_total", "Consultas al cache de OCR sin resultado", lambda: ocr_cache.misses)
+registry.gauge(
+    "ocr_cache_hit_ratio", "Fracción de consultas al cache de OCR con resultado",
+    fn=lambda: hit_ratio(ocr_cache.hits, ocr_cache.misses)
+)
+registry.gauge("ocr_cache_memory_bytes", "Bytes del cache de OCR en memoria", fn=lambda: ocr_cache.size_bytes)
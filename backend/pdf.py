@@ -0,0 +1,67 @@
+import os
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Configuración de recibos en PDF (pypdfium2, importado solo en los procesos de OCR)
+PDF_RENDER_DPI = int(os.getenv("PDF_RENDER_DPI", "300"))
+PDF_MAX_PAGES = int(os.getenv("PDF_MAX_PAGES", "20"))
+# Páginas de un mismo PDF rasterizadas a la vez; 0 = una por proceso del pool
+PDF_PAGE_CONCURRENCY = int(os.getenv("PDF_PAGE_CONCURRENCY", "0"))
+
+PDF_CONTENT_TYPE = "application/pdf"
+
+class InvalidPDF(Exception):
+    """El archivo no es un PDF válido o tiene demasiadas páginas."""
+
+def is_pdf(data: bytes) -> bool:
+    """Reconoce un PDF por su firma, sin importar el content-type declarado."""
+    return data[:1024].lstrip().startswith(b"%PDF-")
+
+def _open(path: str):
+    import pypdfium2 as pdfium
+
+    try:
+        return pdfium.PdfDocument(path)
+    except pdfium.PdfiumError as e:
+        raise InvalidPDF(f"PDF inválido: {e}") from None
+
+def page_count(path: str) -> int:
+    """Cantidad de páginas del PDF. Corre dentro de un proceso del pool."""
+    document = _open(path)
+    try:
+        return len(document)
+    finally:
+        document.close()
+
+def render_page(path: str, index: int, dpi: int = PDF_RENDER_DPI, max_dimension: int = 0):
+    """
+    Rasteriza una página del PDF en escala de grises.
+
+    Solo se decodifica la página pedida, así un proceso tiene en memoria
+    una página a la vez sin importar el largo del documento.
+
+    Args:
+        path: Archivo PDF
+        index: Página (desde 0)
+        dpi: Resolución de rasterizado
+        max_dimension: Lado mayor máximo en px (0 = sin límite); reduce el DPI
+            de páginas grandes en vez de rasterizarlas completas y achicarlas
+
+    Returns:
+        Tupla con (imagen PIL en modo "L", segundos de rasterizado)
+    """
+    start = time.perf_counter()
+    document = _open(path)
+    try:
+        page = document[index]
+        width, height = page.get_size()     # puntos (1/72")
+        scale = dpi / 72
+        if max_dimension:
+            scale = min(scale, max_dimension / max(width, height, 1))
+        # to_pil() comparte el buffer del bitmap: copiar antes de cerrar el documento
+        image = page.render(scale=scale, grayscale=True).to_pil().copy()
+    finally:
+        document.close()
+    return image, time.perf_counter() - start
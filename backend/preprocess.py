@@ -0,0 +1,178 @@
+from __future__ import annotations
+
+import os
+import time
+import logging
+from dataclasses import dataclass, fields
+from typing import TYPE_CHECKING
+
+# PIL se importa al procesar la primera imagen (en los procesos de OCR), no al
+# importar el módulo: la API solo necesita PREPROCESS_CONFIG
+if TYPE_CHECKING:
+    from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+def _env_bool(name: str, default: bool) -> bool:
+    return os.getenv(name, str(default)).strip().lower() in ("1", "true", "yes", "on")
+
+@dataclass(frozen=True)
+class PreprocessConfig:
+    """Pasos de normalización aplicados a una imagen antes de Tesseract."""
+    enabled: bool = True
+    exif_rotate: bool = True
+    grayscale: bool = True
+    max_dimension: int = 2500   # px del lado mayor; 0 = sin límite
+    target_dpi: int = 300       # reduce imágenes con DPI declarado mayor; 0 = no
+    crop: bool = False          # recortar a la región clara del recibo
+    binarize: bool = False      # umbral de Otsu
+
+    @classmethod
+    def from_env(cls) -> "PreprocessConfig":
+        return cls(
+            enabled=_env_bool("OCR_PREPROCESS", True),
+            exif_rotate=_env_bool("OCR_PREPROCESS_EXIF_ROTATE", True),
+            grayscale=_env_bool("OCR_PREPROCESS_GRAYSCALE", True),
+            max_dimension=int(os.getenv("OCR_PREPROCESS_MAX_DIMENSION", "2500")),
+            target_dpi=int(os.getenv("OCR_PREPROCESS_TARGET_DPI", "300")),
+            crop=_env_bool("OCR_PREPROCESS_CROP", False),
+            binarize=_env_bool("OCR_PREPROCESS_BINARIZE", False),
+        )
+
+    def signature(self) -> str:
+        """Representación estable de la configuración (para claves de cache)."""
+        return ",".join(f"{f.name}={getattr(self, f.name)}" for f in fields(self))
+
+PREPROCESS_CONFIG = PreprocessConfig.from_env()
+
+def otsu_threshold(image: Image.Image) -> int:
+    """
+    Calcula el umbral de Otsu de una imagen en escala de grises.
+
+    Args:
+        image: Imagen en modo "L"
+
+    Returns:
+        Umbral entre 0 y 255
+    """
+    histogram = image.histogram()[:256]
+    total = sum(histogram)
+    if total == 0:
+        return 127
+    sum_all = sum(i * count for i, count in enumerate(histogram))
+
+    best_threshold, best_variance = 127, -1.0
+    weight_bg, sum_bg = 0, 0
+    for threshold, count in enumerate(histogram):
+        weight_bg += count
+        if weight_bg == 0:
+            continue
+        weight_fg = total - weight_bg
+        if weight_fg == 0:
+            break
+        sum_bg += threshold * count
+        mean_bg = sum_bg / weight_bg
+        mean_fg = (sum_all - sum_bg) / weight_fg
+        variance = weight_bg * weight_fg * (mean_bg - mean_fg) ** 2
+        if variance > best_variance:
+            best_threshold, best_variance = threshold, variance
+    return best_threshold
+
+def _target_size(image: Image.Image, config: PreprocessConfig, dpi_ratio: float = 1.0) -> tuple[int, int]:
+    """
+    Tamaño final según el lado máximo y el DPI objetivo.
+
+    `dpi_ratio` corrige el DPI declarado cuando la imagen ya se decodificó
+    reducida con `draft`.
+    """
+    width, height = image.size
+    scale = 1.0
+    if config.max_dimension and max(width, height) > config.max_dimension:
+        scale = config.max_dimension / max(width, height)
+
+    dpi = image.info.get("dpi")
+    if config.target_dpi and dpi:
+        current_dpi = max(float(dpi[0]), float(dpi[1])) * dpi_ratio
+        if current_dpi > config.target_dpi:
+            scale = min(scale, config.target_dpi / current_dpi)
+
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+def preprocess_image(image: Image.Image, config: PreprocessConfig = PREPROCESS_CONFIG) -> tuple[Image.Image, dict]:
+    """
+    Normaliza una imagen de recibo para OCR.
+
+    Aplica, según la configuración: decodificación reducida (JPEG), rotación
+    EXIF, escala de grises, reducción de tamaño, recorte al recibo y
+    binarización.
+
+    Args:
+        image: Imagen abierta con PIL (sin cargar aún, para aprovechar `draft`)
+        config: Pasos a aplicar
+
+    Returns:
+        Tupla con (imagen procesada, segundos por paso)
+    """
+    from PIL import Image, ImageOps
+
+    timings = {}
+    if not config.enabled:
+        return image, timings
+
+    def timed(step, fn):
+        start = time.perf_counter()
+        result = fn()
+        timings[step] = time.perf_counter() - start
+        return result
+
+    original_width = image.size[0]
+
+    # JPEG puede decodificarse directamente en grises y a 1/2, 1/4 o 1/8 de
+    # escala, lo que evita cargar la foto completa en memoria
+    if image.format == "JPEG" and (config.grayscale or config.max_dimension):
+        mode = "L" if config.grayscale else image.mode
+        request = (config.max_dimension, config.max_dimension) if config.max_dimension else image.size
+        timed("draft", lambda: image.draft(mode, request))
+
+    timed("decode", image.load)
+    dpi_ratio = image.size[0] / original_width
+
+    if config.exif_rotate:
+        image = timed("exif_rotate", lambda: ImageOps.exif_transpose(image))
+
+    if config.grayscale and image.mode != "L":
+        image = timed("grayscale", lambda: image.convert("L"))
+
+    size = _target_size(image, config, dpi_ratio)
+    if size != image.size:
+        image = timed("downscale", lambda: image.resize(size, Image.Resampling.LANCZOS))
+
+    threshold = None
+    if (config.crop or config.binarize) and image.mode == "L":
+        threshold = timed("threshold", lambda: otsu_threshold(image))
+
+    if config.crop and threshold is not None:
+        image = timed("crop", lambda: _crop_to_receipt(image, threshold))
+
+    if config.binarize and threshold is not None:
+        image = timed("binarize", lambda: image.point(lambda p: 255 if p > threshold else 0))
+
+    return image, timings
+
+def _crop_to_receipt(image: Image.Image, threshold: int) -> Image.Image:
+    """
+    Recorta al rectángulo que contiene la zona clara (el papel del recibo).
+
+    Si la zona clara ocupa casi toda la imagen o es demasiado pequeña, se
+    devuelve la imagen sin cambios.
+    """
+    mask = image.point(lambda p: 255 if p > threshold else 0)
+    bbox = mask.getbbox()
+    if not bbox:
+        return image
+
+    width, height = image.size
+    box_area = (bbox[2] - bbox[0]) * (bbox[3] - bbox[1])
+    if box_area < 0.2 * width * height or box_area > 0.95 * width * height:
+        return image
+    return image.crop(bbox)
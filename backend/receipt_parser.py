@@ -0,0 +1,160 @@
+import re
+import logging
+from datetime import date
+
+logger = logging.getLogger(__name__)
+
+# Patrones precompilados (mismas expresiones que el parser original)
+_DIGIT_RE = re.compile(r'\d')
+_TOTAL_RE = re.compile(r'TOTAL\s*[:]?[\$]?\s*(\d{1,3}(?:[.,]\d{3})*(?:[.,]\d{2,3})?)', re.IGNORECASE)
+_TOTAL_FALLBACK_RE = re.compile(
+    r'(TOTAL|Total|Importe|Monto|Amount|Sum)\s*[:]?[\$]?\s*(\d{1,3}(?:[.,]\d{3})*(?:[.,]\d{2,3})?)',
+    re.IGNORECASE
+)
+_HEADER_RE = re.compile(r'DESCRIPCION|DESCRIPCIÓN|DESCRIPTION', re.IGNORECASE)
+_DATE_DMY_RE = re.compile(r'(\d{1,2})[/-](\d{1,2})[/-](\d{2,4})')
+_DATE_YMD_RE = re.compile(r'(\d{4})[/-](\d{1,2})[/-](\d{1,2})')
+_DATE_FALLBACK_RE = re.compile(r'(\d{2,4})[/-](\d{1,2})[/-](\d{1,2})')
+
+# Palabras que deben aparecer (en mayúsculas) para que _TOTAL_FALLBACK_RE pueda coincidir
+_FALLBACK_KEYWORDS = ('TOTAL', 'IMPORTE', 'MONTO', 'AMOUNT', 'SUM')
+
+# El comercio se busca solo en las primeras líneas
+_MERCHANT_LINES = 8
+
+def _parse_amount(raw: str) -> float:
+    """Convierte '1.234,56' / '135.63' al formato del parser original (puede lanzar ValueError)."""
+    return float(raw.replace('.', '').replace(',', '.'))
+
+def _parse_date(year: str, month: str, day: str) -> date:
+    """Construye la fecha completando años de 2 dígitos (puede lanzar ValueError)."""
+    if len(year) == 2:
+        year = '20' + year
+    return date(int(year), int(month), int(day))
+
+def parse_boleta_text(text: str) -> dict:
+    """
+    Parsea el texto extraído por OCR para obtener información estructurada.
+
+    Recorre las líneas una sola vez con patrones precompilados. Cada campo
+    conserva la prioridad del parser original: el total de una línea
+    'TOTAL' antes que otras palabras clave, y las fechas día/mes/año antes
+    que año/mes/día.
+
+    Args:
+        text: Texto extraído por OCR
+
+    Returns:
+        Diccionario con información parseada
+    """
+    try:
+        lines = text.split('\n')
+
+        merchant = None
+        total_amount = None
+        fallback_amount = None
+        fallback_found = False
+        description_lines = []
+        description_started = False
+        description_open = True
+        dmy_date = None
+        ymd_date = None
+        fallback_date = None
+
+        for index, line in enumerate(lines):
+            upper = line.upper()
+            if 'İ' in upper:
+                # Con IGNORECASE los patrones tratan 'İ' como 'I'; upper() no
+                upper = upper.replace('İ', 'I')
+            has_total = 'TOTAL' in upper
+
+            # Comercio: primera línea sin números (primeras 8 líneas)
+            if merchant is None and index < _MERCHANT_LINES:
+                line_clean = line.strip()
+                if len(line_clean) > 3 and not _DIGIT_RE.search(line_clean):
+                    merchant = line_clean
+
+            # Total: primera línea con 'TOTAL' cuyo monto sea válido
+            if total_amount is None and has_total:
+                match = _TOTAL_RE.search(line)
+                if match:
+                    try:
+                        total_amount = _parse_amount(match.group(1))
+                    except ValueError:
+                        pass
+
+            # Total alternativo (Importe, Monto...), usado si no hubo total
+            if not fallback_found and not total_amount and any(k in upper for k in _FALLBACK_KEYWORDS):
+                match = _TOTAL_FALLBACK_RE.search(line)
+                if match:
+                    try:
+                        fallback_amount = _parse_amount(match.group(2))
+                        fallback_found = True
+                    except ValueError:
+                        pass
+
+            # Descripción: líneas entre el encabezado y la primera línea con 'TOTAL'
+            if description_open:
+                if 'DESCRIP' in upper and _HEADER_RE.search(line):
+                    description_started = True
+                elif has_total:
+                    description_open = False
+                elif description_started:
+                    line_clean = line.strip()
+                    if line_clean:
+                        description_lines.append(line_clean)
+
+            # Fechas: cada formato guarda su primera coincidencia válida
+            if dmy_date is None and ('/' in line or '-' in line):
+                match = _DATE_DMY_RE.search(line)
+                if match:
+                    day, month, year = match.groups()
+                    try:
+                        dmy_date = _parse_date(year, month, day)
+                    except ValueError:
+                        pass
+
+                if dmy_date is None and ymd_date is None:
+                    match = _DATE_YMD_RE.search(line)
+                    if match:
+                        try:
+                            ymd_date = _parse_date(*match.groups())
+                        except ValueError:
+                            pass
+
+                if dmy_date is None and ymd_date is None and fallback_date is None:
+                    match = _DATE_FALLBACK_RE.search(line)
+                    if match:
+                        try:
+                            fallback_date = _parse_date(*match.groups())
+                        except ValueError:
+                            pass
+
+            # Cortar en cuanto ningún campo pendiente puede cambiar
+            if (
+                (merchant is not None or index >= _MERCHANT_LINES - 1)
+                and total_amount
+                and not description_open
+                and dmy_date is not None
+            ):
+                break
+
+        if not total_amount and fallback_found:
+            total_amount = fallback_amount
+        detected_date = dmy_date or ymd_date or fallback_date
+
+        return {
+            "merchant": merchant,
+            "total_amount": total_amount,
+            "date": detected_date,
+            "description": ' '.join(description_lines) if description_lines else None,
+            "confidence": 0.85  # Valor por defecto
+        }
+    except Exception as e:
+        logger.error(f"Error parseando texto OCR: {e}")
+        return {
+            "merchant": None,
+            "total_amount": None,
+            "date": None,
+            "confidence": 0.0
+        }
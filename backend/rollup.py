@@ -0,0 +1,341 @@
+import sys
+import logging
+import argparse
+from typing import Iterable, Optional
+from dotenv import load_dotenv
+
+# Cargar variables de entorno (también se usa como script)
+load_dotenv()
+
+from sqlalchemy import event, delete, insert, select, func, extract
+from sqlalchemy.orm import Session
+
+from db import SessionLocal
+from models import Boleta, BoletaStatsRollup
+import versions
+
+logger = logging.getLogger(__name__)
+
+# Dimensiones de los agregados
+ALL = "all"
+MONTH = "month"
+MERCHANT = "merchant"
+# Marca de agregados completos: fila (usuario, 'built', '') que escribe
+# rebuild_rollups. Hasta entonces las filas pueden tener solo lo creado
+# después del deploy y /boletas/stats consulta boletas directamente.
+BUILT = "built"
+# Usuario de la marca que deja una reconstrucción completa (UUID nulo, no es
+# un usuario de Supabase): desde ahí los agregados de todos están al día
+ALL_USERS = "00000000-0000-0000-0000-000000000000"
+
+_rollup = BoletaStatsRollup.__table__
+
+# Los agregados los mantienen triggers sobre `boletas` (sql/003 en Postgres,
+# SQLITE_ROLLUP_TRIGGERS en SQLite), así también cuentan las boletas que el
+# dashboard escribe directo en Supabase. Este módulo los lee y reconstruye.
+
+def _sqlite_buckets(row: str) -> tuple:
+    """(kind, bucket) de una boleta ('new' u 'old') como expresiones de un trigger de SQLite."""
+    return (
+        (f"'{ALL}'", "''"),
+        (f"'{MONTH}'", f"coalesce(strftime('%Y-%m', {row}.date), '')"),
+        (f"'{MERCHANT}'", f"coalesce({row}.merchant, '')"),
+    )
+
+def _sqlite_add(row: str) -> str:
+    """Suma una boleta a sus tres agregados."""
+    values = ", ".join(
+        f"({row}.user_id, {kind}, {bucket}, 1, {row}.total_amount IS NOT NULL, coalesce({row}.total_amount, 0), "
+        f"{row}.total_amount, {row}.total_amount, {row}.confidence IS NOT NULL, coalesce({row}.confidence, 0))"
+        for kind, bucket in _sqlite_buckets(row)
+    )
+    # min()/max() escalares de SQLite devuelven NULL si algún argumento es NULL
+    return (
+        "INSERT INTO boleta_stats_rollup (user_id, kind, bucket, count, amount_count, amount_sum, "
+        f"amount_min, amount_max, confidence_count, confidence_sum) VALUES {values} "
+        "ON CONFLICT(user_id, kind, bucket) DO UPDATE SET "
+        "count = count + excluded.count, "
+        "amount_count = amount_count + excluded.amount_count, "
+        "amount_sum = amount_sum + excluded.amount_sum, "
+        "amount_min = min(coalesce(amount_min, excluded.amount_min), coalesce(excluded.amount_min, amount_min)), "
+        "amount_max = max(coalesce(amount_max, excluded.amount_max), coalesce(excluded.amount_max, amount_max)), "
+        "confidence_count = confidence_count + excluded.confidence_count, "
+        "confidence_sum = confidence_sum + excluded.confidence_sum;"
+    )
+
+def _sqlite_remove(row: str) -> str:
+    """Descuenta una boleta y recalcula mínimo y máximo desde las boletas que quedan."""
+    buckets = ", ".join(f"({kind}, {bucket})" for kind, bucket in _sqlite_buckets(row))
+    where = f"WHERE user_id = {row}.user_id AND (kind, bucket) IN (VALUES {buckets})"
+    in_bucket = (
+        "b.user_id = boleta_stats_rollup.user_id AND ("
+        f"boleta_stats_rollup.kind = '{ALL}' "
+        f"OR (boleta_stats_rollup.kind = '{MONTH}' AND coalesce(strftime('%Y-%m', b.date), '') = boleta_stats_rollup.bucket) "
+        f"OR (boleta_stats_rollup.kind = '{MERCHANT}' AND coalesce(b.merchant, '') = boleta_stats_rollup.bucket))"
+    )
+    return (
+        "UPDATE boleta_stats_rollup SET count = count - 1, "
+        f"amount_count = amount_count - ({row}.total_amount IS NOT NULL), "
+        f"amount_sum = amount_sum - coalesce({row}.total_amount, 0), "
+        f"confidence_count = confidence_count - ({row}.confidence IS NOT NULL), "
+        f"confidence_sum = confidence_sum - coalesce({row}.confidence, 0) {where}; "
+        "UPDATE boleta_stats_rollup SET "
+        f"amount_min = (SELECT min(b.total_amount) FROM boletas b WHERE {in_bucket}), "
+        f"amount_max = (SELECT max(b.total_amount) FROM boletas b WHERE {in_bucket}) "
+        f"{where} AND {row}.total_amount IS NOT NULL; "
+        f"DELETE FROM boleta_stats_rollup WHERE user_id = {row}.user_id AND kind != '{BUILT}' AND count <= 0;"
+    )
+
+# Triggers por fila de SQLite (desarrollo y tests); un UPDATE quita la boleta
+# anterior y suma la nueva
+SQLITE_ROLLUP_TRIGGERS = (
+    "CREATE TRIGGER IF NOT EXISTS boleta_stats_rollup_ai AFTER INSERT ON boletas BEGIN "
+    + _sqlite_add("new") + " END",
+    "CREATE TRIGGER IF NOT EXISTS boleta_stats_rollup_au AFTER UPDATE OF "
+    "user_id, merchant, total_amount, date, confidence ON boletas BEGIN "
+    + _sqlite_remove("old") + " " + _sqlite_add("new") + " END",
+    "CREATE TRIGGER IF NOT EXISTS boleta_stats_rollup_ad AFTER DELETE ON boletas BEGIN "
+    + _sqlite_remove("old") + " END",
+)
+
+@event.listens_for(Boleta.__table__, "after_create")
+def create_sqlite_rollup_triggers(target, connection, **kw):
+    """Crea los triggers de agregados al crear `boletas` en SQLite."""
+    if connection.dialect.name != "sqlite":
+        return
+    for statement in SQLITE_ROLLUP_TRIGGERS:
+        connection.exec_driver_sql(statement)
+
+def _new_delta() -> dict:
+    return {
+        "count": 0,
+        "amount_count": 0,
+        "amount_sum": 0.0,
+        "amount_min": None,
+        "amount_max": None,
+        "confidence_count": 0,
+        "confidence_sum": 0.0
+    }
+
+def _merge(delta: dict, count: int, amount_count: int, amount_sum, amount_min, amount_max,
+           confidence_count: int, confidence_sum):
+    delta["count"] += count
+    delta["amount_count"] += amount_count
+    delta["amount_sum"] += float(amount_sum or 0)
+    delta["confidence_count"] += confidence_count
+    delta["confidence_sum"] += float(confidence_sum or 0)
+    if amount_min is not None:
+        low, high = float(amount_min), float(amount_max)
+        delta["amount_min"] = low if delta["amount_min"] is None else min(delta["amount_min"], low)
+        delta["amount_max"] = high if delta["amount_max"] is None else max(delta["amount_max"], high)
+
+def stats_groups_statement():
+    """
+    Consulta agregada de boletas agrupada por (usuario, año, mes, comercio).
+
+    Es la base tanto de /boletas/stats sin agregados como de la
+    reconstrucción de `boleta_stats_rollup`; los llamadores agregan filtros
+    con `.where()` y la ejecutan con una sesión sync o async.
+    """
+    year = extract("year", Boleta.date)
+    month = extract("month", Boleta.date)
+    return select(
+        Boleta.user_id,
+        year.label("year"),
+        month.label("month"),
+        Boleta.merchant,
+        func.count().label("count"),
+        func.count(Boleta.total_amount).label("amount_count"),
+        func.sum(Boleta.total_amount).label("amount_sum"),
+        func.min(Boleta.total_amount).label("amount_min"),
+        func.max(Boleta.total_amount).label("amount_max"),
+        func.count(Boleta.confidence).label("confidence_count"),
+        func.sum(Boleta.confidence).label("confidence_sum")
+    ).group_by(Boleta.user_id, year, month, Boleta.merchant)
+
+def deltas_from_groups(groups: Iterable) -> dict:
+    """
+    Combina filas de `stats_groups_statement` en agregados por dimensión.
+
+    Returns:
+        Diccionario {(user_id, kind, bucket): agregado}
+    """
+    deltas: dict = {}
+    for group in groups:
+        month = f"{int(group.year):04d}-{int(group.month):02d}" if group.year is not None else ""
+        for kind, bucket in ((ALL, ""), (MONTH, month), (MERCHANT, group.merchant or "")):
+            delta = deltas.setdefault((group.user_id, kind, bucket), _new_delta())
+            _merge(
+                delta, group.count, group.amount_count, group.amount_sum,
+                group.amount_min, group.amount_max,
+                group.confidence_count, group.confidence_sum
+            )
+    return deltas
+
+def format_stats(deltas: dict, top_merchants: int) -> dict:
+    """
+    Arma la respuesta de /boletas/stats a partir de los agregados de un usuario.
+
+    Args:
+        deltas: Diccionario {(kind, bucket): agregado}
+        top_merchants: Cantidad de comercios en el desglose
+    """
+    total = deltas.get((ALL, ""), _new_delta())
+    stats = {
+        "total_boletas": total["count"],
+        "total_amount": round(total["amount_sum"], 2),
+        "avg_confidence": 0.0,
+        "avg_amount": None,
+        "min_amount": total["amount_min"],
+        "max_amount": total["amount_max"],
+        "by_month": [],
+        "by_merchant": []
+    }
+    if total["amount_count"]:
+        stats["avg_amount"] = round(total["amount_sum"] / total["amount_count"], 2)
+    if total["confidence_count"]:
+        stats["avg_confidence"] = round(total["confidence_sum"] / total["confidence_count"], 3)
+
+    months = [(bucket, d) for (kind, bucket), d in deltas.items() if kind == MONTH]
+    merchants = [(bucket, d) for (kind, bucket), d in deltas.items() if kind == MERCHANT]
+
+    # Meses en orden cronológico (sin fecha al final); comercios por monto
+    stats["by_month"] = [
+        {"month": bucket or None, "count": d["count"], "total_amount": round(d["amount_sum"], 2)}
+        for bucket, d in sorted(months, key=lambda item: (item[0] == "", item[0]))
+    ]
+    stats["by_merchant"] = [
+        {"merchant": bucket or None, "count": d["count"], "total_amount": round(d["amount_sum"], 2)}
+        for bucket, d in sorted(merchants, key=lambda item: item[1]["amount_sum"], reverse=True)
+    ][:top_merchants]
+    return stats
+
+def upsert_statement(dialect_name: str, deltas: dict):
+    """
+    INSERT ... ON CONFLICT que suma `deltas` a `boleta_stats_rollup`.
+
+    Args:
+        dialect_name: Dialecto de la conexión ('postgresql' o 'sqlite')
+        deltas: Diccionario {(user_id, kind, bucket): agregado}
+    """
+    if dialect_name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+        least, greatest = func.least, func.greatest
+    elif dialect_name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+        # min()/max() escalares de SQLite devuelven NULL si algún argumento es NULL
+        least = lambda a, b: func.min(func.coalesce(a, b), func.coalesce(b, a))
+        greatest = lambda a, b: func.max(func.coalesce(a, b), func.coalesce(b, a))
+    else:
+        raise NotImplementedError(f"Dialecto no soportado para agregados: {dialect_name}")
+
+    rows = [
+        {"user_id": user_id, "kind": kind, "bucket": bucket, **delta}
+        for (user_id, kind, bucket), delta in deltas.items()
+    ]
+    stmt = insert(_rollup).values(rows)
+    excluded = stmt.excluded
+    summed = ("count", "amount_count", "amount_sum", "confidence_count", "confidence_sum")
+    return stmt.on_conflict_do_update(
+        index_elements=["user_id", "kind", "bucket"],
+        set_={
+            **{name: _rollup.c[name] + excluded[name] for name in summed},
+            "amount_min": least(_rollup.c["amount_min"], excluded["amount_min"]),
+            "amount_max": greatest(_rollup.c["amount_max"], excluded["amount_max"]),
+        }
+    )
+
+def rollup_rows_statement(user_id: str):
+    """Filas de `boleta_stats_rollup` de un usuario y la marca global (ver `stats_from_rollup_rows`)."""
+    return select(BoletaStatsRollup).where(BoletaStatsRollup.user_id.in_((user_id, ALL_USERS)))
+
+def built_marker_statement(user_id: str):
+    """INSERT de la marca de agregados completos de un usuario (o de ALL_USERS)."""
+    return insert(_rollup).values(user_id=user_id, kind=BUILT, bucket="")
+
+def stats_from_rollup_rows(rows: Iterable[BoletaStatsRollup], top_merchants: int = 10) -> Optional[dict]:
+    """
+    Arma las estadísticas de un usuario desde sus filas de agregados.
+
+    Returns:
+        Estadísticas, o None si los agregados del usuario aún no se
+        reconstruyeron (sin marca BUILT propia ni global)
+    """
+    rows = list(rows)
+    if not any(row.kind == BUILT for row in rows):
+        return None
+
+    deltas = {}
+    for row in rows:
+        if row.kind == BUILT:
+            continue
+        delta = _new_delta()
+        _merge(
+            delta, row.count, row.amount_count, row.amount_sum, row.amount_min, row.amount_max,
+            row.confidence_count, row.confidence_sum
+        )
+        deltas[(row.kind, row.bucket)] = delta
+    return format_stats(deltas, top_merchants)
+
+def read_rollup_stats(db: Session, user_id: str, top_merchants: int = 10) -> Optional[dict]:
+    """Lee las estadísticas de un usuario desde `boleta_stats_rollup` (None si no están completas)."""
+    return stats_from_rollup_rows(db.scalars(rollup_rows_statement(user_id)), top_merchants)
+
+def rebuild_rollups(db: Session, user_id: Optional[str] = None) -> int:
+    """
+    Reconstruye `boleta_stats_rollup` desde `boletas` (backfill o reparación).
+
+    Cada usuario reconstruido recibe su marca BUILT; una reconstrucción
+    completa deja además la marca de ALL_USERS, que cubre a los usuarios
+    que aún no tienen boletas.
+
+    Args:
+        db: Sesión de base de datos
+        user_id: Usuario a reconstruir; None para todos
+
+    Returns:
+        Cantidad de usuarios reconstruidos
+    """
+    dialect_name = db.get_bind().dialect.name
+    if user_id is not None:
+        user_ids = [user_id]
+    else:
+        user_ids = [row[0] for row in db.query(Boleta.user_id).distinct()]
+        # Sin marca BUILT (la global se borra acá), /boletas/stats consulta boletas directamente
+        db.execute(delete(_rollup))
+        db.commit()
+
+    for uid in user_ids:
+        db.execute(delete(_rollup).where(_rollup.c.user_id == uid))
+        deltas = deltas_from_groups(db.execute(stats_groups_statement().where(Boleta.user_id == uid)))
+        if deltas:
+            db.execute(upsert_statement(dialect_name, deltas))
+        db.execute(built_marker_statement(uid))
+        # Las estadísticas pueden cambiar: invalidar ETags y respuestas en cache
+        db.execute(versions.bump_statement(dialect_name, [uid]))
+        db.commit()
+        logger.info(f"Agregados reconstruidos para usuario {uid}")
+
+    if user_id is None:
+        db.execute(built_marker_statement(ALL_USERS))
+        db.commit()
+    return len(user_ids)
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Mantenimiento de boleta_stats_rollup")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    rebuild = subcommands.add_parser("rebuild", help="Reconstruir agregados desde boletas")
+    rebuild.add_argument("--user-id", help="Reconstruir solo este usuario")
+    args = parser.parse_args(argv)
+
+    db = SessionLocal()
+    try:
+        users = rebuild_rollups(db, args.user_id)
+        print(f"Agregados reconstruidos para {users} usuarios")
+        return 0
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from datetime import date, datetime
+from datetime import date as date_type, datetime
 from typing import Optional, List
 
 class BoletaBase(BaseModel):
@@ -19,18 +19,66 @@ class BoletaCreate(BoletaBase):
 class BoletaOut(BoletaBase):
     """Esquema para respuesta de boleta"""
     id: int = Field(..., description="ID único de la boleta")
-    fecha: Optional[str] = Field(None, description="Fecha de creación del registro (ISO)")
+    date: Optional[date_type] = Field(None, description="Fecha de la boleta (YYYY-MM-DD)")
+    fecha: Optional[datetime] = Field(None, description="Fecha de creación del registro (ISO)")
+    duplicate: Optional[str] = Field(
+        None, description="'image' o 'fingerprint' si la boleta ya existía y no se volvió a guardar"
+    )
+    
+    class Config:
+        from_attributes = True
+
+class BoletaSummary(BaseModel):
+    """Esquema de boleta para listados (sin el texto OCR)"""
+    id: int = Field(..., description="ID único de la boleta")
+    nombre_archivo: str = Field(..., description="Nombre del archivo de imagen")
+    merchant: Optional[str] = Field(None, description="Nombre del comercio")
+    total_amount: Optional[float] = Field(None, description="Monto total de la boleta")
+    date: Optional[date_type] = Field(None, description="Fecha de la boleta (YYYY-MM-DD)")
+    confidence: Optional[float] = Field(None, description="Nivel de confianza del OCR")
+    fecha: Optional[datetime] = Field(None, description="Fecha de creación del registro (ISO)")
     
     class Config:
         from_attributes = True
 
 class BoletaListResponse(BaseModel):
     """Esquema para respuesta paginada de boletas"""
-    items: List[BoletaOut] = Field(..., description="Lista de boletas")
-    total: int = Field(..., description="Total de boletas")
-    page: int = Field(..., description="Página actual")
+    items: List[BoletaOut | BoletaSummary] = Field(..., description="Lista de boletas (sin texto si include_text=false)")
+    total: Optional[int] = Field(None, description="Total de boletas (None si no se pidió)")
+    page: Optional[int] = Field(None, description="Página actual (None en modo cursor)")
     limit: int = Field(..., description="Límite de items por página")
-    pages: int = Field(..., description="Total de páginas")
+    pages: Optional[int] = Field(None, description="Total de páginas (None si no se pidió el total)")
+    next_cursor: Optional[str] = Field(None, description="Cursor para pedir la página siguiente")
+
+class BoletaSearchResponse(BaseModel):
+    """Esquema para resultados de búsqueda de boletas"""
+    items: List[BoletaSummary] = Field(..., description="Boletas encontradas (por relevancia si hay 'q')")
+    limit: int = Field(..., description="Límite de resultados")
+    offset: int = Field(..., description="Resultados saltados")
+    next_offset: Optional[int] = Field(None, description="Offset de la página siguiente (None si no hay más)")
+
+class MonthStats(BaseModel):
+    """Desglose de estadísticas por mes"""
+    month: Optional[str] = Field(None, description="Mes de la boleta (YYYY-MM); None si no tiene fecha")
+    count: int = Field(..., description="Cantidad de boletas")
+    total_amount: float = Field(..., description="Suma de montos")
+
+class MerchantStats(BaseModel):
+    """Desglose de estadísticas por comercio"""
+    merchant: Optional[str] = Field(None, description="Comercio; None si no se detectó")
+    count: int = Field(..., description="Cantidad de boletas")
+    total_amount: float = Field(..., description="Suma de montos")
+
+class BoletaStats(BaseModel):
+    """Esquema para estadísticas de boletas"""
+    total_boletas: int = Field(..., description="Cantidad de boletas")
+    total_amount: float = Field(..., description="Suma de montos")
+    avg_confidence: float = Field(..., description="Confianza promedio del OCR")
+    avg_amount: Optional[float] = Field(None, description="Monto promedio")
+    min_amount: Optional[float] = Field(None, description="Monto mínimo")
+    max_amount: Optional[float] = Field(None, description="Monto máximo")
+    by_month: List[MonthStats] = Field(default_factory=list, description="Desglose por mes")
+    by_merchant: List[MerchantStats] = Field(default_factory=list, description="Comercios con mayor monto")
 
 class OCRFromStorageRequest(BaseModel):
     """Esquema para request de OCR desde storage"""
@@ -47,3 +95,32 @@ class OCRResponse(BaseModel):
     success: bool = Field(..., description="Indica si el OCR fue exitoso")
     boleta: Optional[BoletaOut] = Field(None, description="Boleta creada")
     error: Optional[str] = Field(None, description="Mensaje de error si falló")
+
+class OCRJobOut(BaseModel):
+    """Esquema para el estado de un trabajo de OCR en segundo plano"""
+    id: str = Field(..., description="ID del trabajo")
+    status: str = Field(..., description="Estado: pending, running, done o failed")
+    nombre_archivo: str = Field(..., description="Nombre del archivo")
+    attempts: int = Field(0, description="Intentos de procesamiento realizados")
+    boleta_id: Optional[int] = Field(None, description="ID de la boleta creada")
+    boleta: Optional[BoletaOut] = Field(None, description="Boleta creada (cuando status es done)")
+    error: Optional[str] = Field(None, description="Mensaje de error si falló")
+    created_at: datetime = Field(..., description="Fecha de encolado")
+    updated_at: datetime = Field(..., description="Última actualización de estado")
+    
+    class Config:
+        from_attributes = True
+
+class OCRBatchItem(BaseModel):
+    """Resultado de OCR para un archivo de un lote"""
+    nombre_archivo: str = Field(..., description="Nombre del archivo")
+    success: bool = Field(..., description="Indica si el archivo se procesó y guardó")
+    boleta: Optional[BoletaOut] = Field(None, description="Boleta creada")
+    error: Optional[str] = Field(None, description="Mensaje de error si falló")
+
+class OCRBatchResponse(BaseModel):
+    """Esquema para respuesta de OCR por lote"""
+    items: List[OCRBatchItem] = Field(..., description="Resultado por archivo, en el orden recibido")
+    total: int = Field(..., description="Archivos recibidos")
+    succeeded: int = Field(..., description="Archivos procesados correctamente")
+    failed: int = Field(..., description="Archivos con error")
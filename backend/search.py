@@ -0,0 +1,110 @@
+import logging
+from datetime import date
+from typing import Optional
+
+from sqlalchemy import event, select, desc, func, literal_column, table, column
+
+from models import Boleta, BoletaText
+
+logger = logging.getLogger(__name__)
+
+# El texto OCR está comprimido en boleta_texts, así que el documento de
+# búsqueda (comercio + texto) se calcula al guardar la boleta (ver
+# boleta_texts.insert_statements): en Postgres en `boleta_texts.search_vector`
+# (índice GIN de sql/007_boleta_texts.sql), en SQLite en la tabla FTS5.
+_PG_SEARCH_CONFIG = literal_column("'spanish'::regconfig")
+
+# Índice FTS5 para SQLite (desarrollo y tests), con su propia copia del texto
+SQLITE_FTS_DDL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS boletas_fts USING fts5("
+    "merchant, text, tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS boletas_fts_ad AFTER DELETE ON boletas BEGIN "
+    "DELETE FROM boletas_fts WHERE rowid = old.id; END",
+)
+sqlite_fts = table("boletas_fts", column("rowid"), column("merchant"), column("text"))
+
+def search_document(merchant: Optional[str], text: Optional[str]) -> str:
+    """Texto indexado para /boletas/search: comercio y texto OCR."""
+    return f"{merchant or ''} {text or ''}"
+
+def pg_search_vector(merchant: Optional[str], text: Optional[str]):
+    """Expresión tsvector de `boleta_texts.search_vector` en Postgres."""
+    return func.to_tsvector(_PG_SEARCH_CONFIG, search_document(merchant, text))
+
+@event.listens_for(Boleta.__table__, "after_create")
+def create_sqlite_fts(target, connection, **kw):
+    """Crea el índice FTS5 al crear `boletas` en SQLite."""
+    if connection.dialect.name != "sqlite":
+        return
+    for statement in SQLITE_FTS_DDL:
+        connection.exec_driver_sql(statement)
+
+def fts5_query(q: str) -> str:
+    """Convierte texto libre en una consulta FTS5 segura: todas las palabras, entre comillas."""
+    return " ".join('"' + word.replace('"', '""') + '"' for word in q.split())
+
+def _like_prefix(value: str) -> str:
+    """Patrón LIKE de prefijo, con comodines escapados."""
+    escaped = value.lower().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return escaped + "%"
+
+def search_statement(
+    dialect_name: str,
+    user_id: str,
+    columns: tuple,
+    q: Optional[str] = None,
+    merchant: Optional[str] = None,
+    min_amount: Optional[float] = None,
+    max_amount: Optional[float] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None
+):
+    """
+    SELECT de búsqueda de boletas de un usuario.
+    
+    Con `q` los resultados se ordenan por relevancia (ts_rank en Postgres,
+    bm25 en SQLite); sin `q`, por fecha de creación descendente.
+    
+    Args:
+        dialect_name: Dialecto de la conexión ('postgresql' o 'sqlite')
+        user_id: ID del usuario
+        columns: Columnas o entidades a seleccionar
+        q: Palabras a buscar en comercio y texto OCR
+        merchant: Prefijo del comercio (sin distinguir mayúsculas)
+        min_amount: Monto mínimo (inclusive)
+        max_amount: Monto máximo (inclusive)
+        date_from: Fecha de boleta mínima (inclusive)
+        date_to: Fecha de boleta máxima (inclusive)
+    """
+    statement = select(*columns).where(Boleta.user_id == user_id)
+    
+    if merchant:
+        # Postgres usa '\' como escape por defecto; SQLite necesita ESCAPE explícito
+        escape = "\\" if dialect_name == "sqlite" else None
+        statement = statement.where(func.lower(Boleta.merchant).like(_like_prefix(merchant), escape=escape))
+    if min_amount is not None:
+        statement = statement.where(Boleta.total_amount >= min_amount)
+    if max_amount is not None:
+        statement = statement.where(Boleta.total_amount <= max_amount)
+    if date_from is not None:
+        statement = statement.where(Boleta.date >= date_from)
+    if date_to is not None:
+        statement = statement.where(Boleta.date <= date_to)
+    
+    order = [desc(Boleta.fecha), desc(Boleta.id)]
+    if q and q.strip():
+        if dialect_name == "postgresql":
+            query = func.websearch_to_tsquery(_PG_SEARCH_CONFIG, q)
+            statement = statement.join(BoletaText, BoletaText.boleta_id == Boleta.id).where(
+                BoletaText.search_vector.op("@@")(query)
+            )
+            order.insert(0, desc(func.ts_rank(BoletaText.search_vector, query)))
+        elif dialect_name == "sqlite":
+            statement = statement.join(sqlite_fts, sqlite_fts.c.rowid == Boleta.id).where(
+                literal_column("boletas_fts").op("MATCH")(fts5_query(q))
+            )
+            order.insert(0, func.bm25(literal_column("boletas_fts")))
+        else:
+            raise NotImplementedError(f"Dialecto no soportado para búsqueda: {dialect_name}")
+    
+    return statement.order_by(*order)
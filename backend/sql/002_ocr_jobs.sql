@@ -0,0 +1,33 @@
+-- Cola persistente de trabajos de OCR (POST /ocr/jobs)
+create table if not exists public.ocr_jobs (
+  id varchar(32) primary key,
+  user_id uuid not null,
+  nombre_archivo text not null,
+  status varchar(16) default 'pending' not null,
+  image bytea,
+  boleta_id bigint references public.boletas (id) on delete set null,
+  error text,
+  attempts integer default 0 not null,
+  created_at timestamptz default now() not null,
+  updated_at timestamptz default now() not null
+);
+
+-- Habilitar Row Level Security
+alter table public.ocr_jobs enable row level security;
+
+do $$
+begin
+  if not exists (
+    select 1 from pg_policies
+    where polname = 'own-jobs-only' and tablename = 'ocr_jobs'
+  ) then
+    create policy "own-jobs-only"
+    on public.ocr_jobs for all
+    to authenticated
+    using (auth.uid() = user_id)
+    with check (auth.uid() = user_id);
+  end if;
+end$$;
+
+-- Los workers toman el trabajo pendiente más antiguo
+create index if not exists ocr_jobs_status_created_idx on public.ocr_jobs (status, created_at);
@@ -0,0 +1,145 @@
+-- Agregados por usuario para /boletas/stats, mantenidos por triggers en
+-- cada INSERT, UPDATE o DELETE sobre boletas (API o dashboard). Tras crear
+-- la tabla y los triggers, poblarla con:
+--   python rollup.py rebuild
+-- (hasta que termine, /boletas/stats calcula desde boletas; ver rollup.BUILT)
+create table if not exists public.boleta_stats_rollup (
+  user_id uuid not null,
+  kind varchar(16) not null,          -- 'all', 'month', 'merchant' o 'built'
+  bucket text not null,               -- '' / 'YYYY-MM' / comercio
+  count integer default 0 not null,
+  amount_count integer default 0 not null,
+  amount_sum numeric(14,2) default 0 not null,
+  amount_min numeric(12,2),
+  amount_max numeric(12,2),
+  confidence_count integer default 0 not null,
+  confidence_sum numeric(14,3) default 0 not null,
+  primary key (user_id, kind, bucket)
+);
+
+-- Habilitar Row Level Security
+alter table public.boleta_stats_rollup enable row level security;
+
+do $$
+begin
+  if not exists (
+    select 1 from pg_policies
+    where polname = 'own-stats-only' and tablename = 'boleta_stats_rollup'
+  ) then
+    create policy "own-stats-only"
+    on public.boleta_stats_rollup for select
+    to authenticated
+    using (auth.uid() = user_id);
+  end if;
+end$$;
+
+-- Mantener los agregados desde boletas, una vez por sentencia: un UPDATE
+-- descuenta las filas anteriores y suma las nuevas. Los buckets deben
+-- coincidir con rollup.stats_groups_statement / deltas_from_groups.
+create or replace function public.sync_boleta_stats_rollup()
+returns trigger
+language plpgsql
+security definer               -- boleta_stats_rollup solo es legible para authenticated
+set search_path = public
+as $$
+begin
+  if tg_op in ('UPDATE', 'DELETE') then
+    update public.boleta_stats_rollup r set
+      count = r.count - d.count,
+      amount_count = r.amount_count - d.amount_count,
+      amount_sum = r.amount_sum - d.amount_sum,
+      confidence_count = r.confidence_count - d.confidence_count,
+      confidence_sum = r.confidence_sum - d.confidence_sum
+    from (
+      select o.user_id, k.kind, k.bucket,
+             count(*) as count,
+             count(o.total_amount) as amount_count,
+             coalesce(sum(o.total_amount), 0) as amount_sum,
+             count(o.confidence) as confidence_count,
+             coalesce(sum(o.confidence), 0) as confidence_sum
+      from old_rows o
+      cross join lateral (values
+        ('all', ''),
+        ('month', coalesce(to_char(o."date", 'YYYY-MM'), '')),
+        ('merchant', coalesce(o.merchant, ''))
+      ) as k (kind, bucket)
+      group by o.user_id, k.kind, k.bucket
+    ) d
+    where r.user_id = d.user_id and r.kind = d.kind and r.bucket = d.bucket;
+  end if;
+
+  if tg_op in ('INSERT', 'UPDATE') then
+    insert into public.boleta_stats_rollup as r (
+      user_id, kind, bucket, count, amount_count, amount_sum,
+      amount_min, amount_max, confidence_count, confidence_sum
+    )
+    select n.user_id, k.kind, k.bucket,
+           count(*),
+           count(n.total_amount),
+           coalesce(sum(n.total_amount), 0),
+           min(n.total_amount),
+           max(n.total_amount),
+           count(n.confidence),
+           coalesce(sum(n.confidence), 0)
+    from new_rows n
+    cross join lateral (values
+      ('all', ''),
+      ('month', coalesce(to_char(n."date", 'YYYY-MM'), '')),
+      ('merchant', coalesce(n.merchant, ''))
+    ) as k (kind, bucket)
+    group by n.user_id, k.kind, k.bucket
+    order by 1, 2, 3               -- mismo orden de bloqueo en todas las transacciones
+    on conflict (user_id, kind, bucket) do update set
+      count = r.count + excluded.count,
+      amount_count = r.amount_count + excluded.amount_count,
+      amount_sum = r.amount_sum + excluded.amount_sum,
+      amount_min = least(r.amount_min, excluded.amount_min),
+      amount_max = greatest(r.amount_max, excluded.amount_max),
+      confidence_count = r.confidence_count + excluded.confidence_count,
+      confidence_sum = r.confidence_sum + excluded.confidence_sum;
+  end if;
+
+  if tg_op in ('UPDATE', 'DELETE') then
+    -- Mínimo y máximo de los buckets que perdieron un monto, desde las boletas que quedan
+    update public.boleta_stats_rollup r set (amount_min, amount_max) = (
+      select min(b.total_amount), max(b.total_amount)
+      from public.boletas b
+      where b.user_id = r.user_id
+        and (r.kind = 'all'
+          or (r.kind = 'month' and coalesce(to_char(b."date", 'YYYY-MM'), '') = r.bucket)
+          or (r.kind = 'merchant' and coalesce(b.merchant, '') = r.bucket))
+    )
+    where (r.user_id, r.kind, r.bucket) in (
+      select o.user_id, k.kind, k.bucket
+      from old_rows o
+      cross join lateral (values
+        ('all', ''),
+        ('month', coalesce(to_char(o."date", 'YYYY-MM'), '')),
+        ('merchant', coalesce(o.merchant, ''))
+      ) as k (kind, bucket)
+      where o.total_amount is not null
+    );
+
+    -- Buckets vacíos (la marca 'built' de rollup.py no se toca)
+    delete from public.boleta_stats_rollup r
+    where r.user_id in (select user_id from old_rows)
+      and r.kind <> 'built'
+      and r.count <= 0;
+  end if;
+  return null;
+end$$;
+
+drop trigger if exists boleta_stats_rollup_ai on public.boletas;
+create trigger boleta_stats_rollup_ai after insert on public.boletas
+  referencing new table as new_rows
+  for each statement execute function public.sync_boleta_stats_rollup();
+
+drop trigger if exists boleta_stats_rollup_au on public.boletas;
+create trigger boleta_stats_rollup_au after update on public.boletas
+  referencing old table as old_rows new table as new_rows
+  for each statement execute function public.sync_boleta_stats_rollup();
+
+drop trigger if exists boleta_stats_rollup_ad on public.boletas;
+create trigger boleta_stats_rollup_ad after delete on public.boletas
+  referencing old table as old_rows
+  for each statement execute function public.sync_boleta_stats_rollup();
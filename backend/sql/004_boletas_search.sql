@@ -0,0 +1,13 @@
+-- Búsqueda de boletas (GET /boletas/search)
+
+-- Texto completo sobre comercio + texto OCR. La expresión debe ser idéntica
+-- a search.PG_SEARCH_DOCUMENT para que el planner use el índice.
+create index if not exists boletas_search_idx on public.boletas
+  using gin (to_tsvector('spanish'::regconfig, coalesce(merchant, '') || ' ' || coalesce("text", '')));
+
+-- Filtros por rango de fecha y monto dentro de las boletas de un usuario
+create index if not exists boletas_user_date_idx on public.boletas (user_id, "date" desc);
+create index if not exists boletas_user_amount_idx on public.boletas (user_id, total_amount);
+
+-- Prefijo de comercio sin distinguir mayúsculas (lower(merchant) like 'abc%')
+create index if not exists boletas_user_merchant_idx on public.boletas (user_id, lower(merchant) text_pattern_ops);
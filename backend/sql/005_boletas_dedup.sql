@@ -0,0 +1,12 @@
+-- Detección de boletas duplicadas al ingresar
+alter table public.boletas add column if not exists image_hash text;
+alter table public.boletas add column if not exists fingerprint text;
+
+-- Misma imagen del mismo usuario: una sola boleta (los NULL no chocan)
+create unique index if not exists boletas_user_image_hash_idx on public.boletas (user_id, image_hash);
+
+-- Misma compra (comercio + monto + fecha normalizados)
+create index if not exists boletas_user_fingerprint_idx on public.boletas (user_id, fingerprint);
+
+-- Calcular la huella de las boletas existentes:
+--   python dedup.py backfill
@@ -0,0 +1,64 @@
+-- Versión de las boletas de cada usuario (ETag de GET /boletas y
+-- /boletas/stats), incrementada por triggers en cada INSERT, UPDATE o
+-- DELETE sobre boletas, vengan de la API o del dashboard (Supabase)
+create table if not exists public.boleta_versions (
+  user_id uuid primary key,
+  version bigint default 0 not null
+);
+
+-- Habilitar Row Level Security
+alter table public.boleta_versions enable row level security;
+
+do $$
+begin
+  if not exists (
+    select 1 from pg_policies
+    where polname = 'own-version-only' and tablename = 'boleta_versions'
+  ) then
+    create policy "own-version-only"
+    on public.boleta_versions for select
+    to authenticated
+    using (auth.uid() = user_id);
+  end if;
+end$$;
+
+-- Una vez por sentencia y usuario afectado (un lote de 100 boletas suma 1)
+create or replace function public.bump_boleta_versions()
+returns trigger
+language plpgsql
+security definer               -- boleta_versions solo es legible para authenticated
+set search_path = public
+as $$
+declare
+  users uuid[];
+begin
+  if tg_op = 'INSERT' then
+    select array_agg(distinct user_id) into users from new_rows;
+  elsif tg_op = 'DELETE' then
+    select array_agg(distinct user_id) into users from old_rows;
+  else
+    select array_agg(distinct user_id) into users
+    from (select user_id from new_rows union select user_id from old_rows) changed;
+  end if;
+
+  -- array_agg(distinct) viene ordenado: las transacciones bloquean en el mismo orden
+  insert into public.boleta_versions as v (user_id, version)
+  select unnest(users), 1
+  on conflict (user_id) do update set version = v.version + 1;
+  return null;
+end$$;
+
+drop trigger if exists boleta_versions_ai on public.boletas;
+create trigger boleta_versions_ai after insert on public.boletas
+  referencing new table as new_rows
+  for each statement execute function public.bump_boleta_versions();
+
+drop trigger if exists boleta_versions_au on public.boletas;
+create trigger boleta_versions_au after update on public.boletas
+  referencing old table as old_rows new table as new_rows
+  for each statement execute function public.bump_boleta_versions();
+
+drop trigger if exists boleta_versions_ad on public.boletas;
+create trigger boleta_versions_ad after delete on public.boletas
+  referencing old table as old_rows
+  for each statement execute function public.bump_boleta_versions();
@@ -0,0 +1,78 @@
+-- Texto OCR fuera de la tabla de boletas, comprimido con zlib por la API
+-- (models.CompressedText). `boletas` queda con columnas chicas para las
+-- listas y estadísticas; el texto se lee solo en el detalle y la exportación.
+create table if not exists public.boleta_texts (
+  boleta_id bigint primary key
+    references public.boletas (id) on delete cascade
+    deferrable initially deferred,     -- el trigger de abajo escribe antes que la boleta
+  text bytea,                          -- zlib (UTF-8 si lo escribió el trigger); NULL sin texto
+  text_size integer default 0 not null, -- bytes UTF-8 sin comprimir
+  search_vector tsvector               -- comercio + texto (ver search.pg_search_vector)
+);
+
+-- Ya viene comprimido: guardarlo fuera de línea sin volver a comprimirlo
+alter table public.boleta_texts alter column text set storage external;
+
+-- Búsqueda de texto completo (reemplaza boletas_search_idx de sql/004)
+create index if not exists boleta_texts_search_idx on public.boleta_texts using gin (search_vector);
+
+-- Habilitar Row Level Security
+alter table public.boleta_texts enable row level security;
+
+do $$
+begin
+  if not exists (
+    select 1 from pg_policies
+    where polname = 'own-texts-only' and tablename = 'boleta_texts'
+  ) then
+    create policy "own-texts-only"
+    on public.boleta_texts for select
+    to authenticated
+    using (exists (
+      select 1 from public.boletas b where b.id = boleta_id and b.user_id = auth.uid()
+    ));
+  end if;
+end$$;
+
+-- El dashboard inserta boletas (con `text`) directo en Supabase: mover ese
+-- texto a boleta_texts en la misma fila y dejar `boletas.text` en NULL.
+-- También crea el registro de las boletas sin texto (búsqueda por comercio);
+-- la API escribe el suyo después y lo reemplaza (boleta_texts.insert_statements).
+create or replace function public.move_boleta_text()
+returns trigger
+language plpgsql
+security definer
+set search_path = public
+as $$
+begin
+  insert into public.boleta_texts (boleta_id, text, text_size, search_vector)
+  values (
+    new.id,
+    convert_to(new.text, 'UTF8'),
+    coalesce(octet_length(new.text), 0),
+    to_tsvector('spanish'::regconfig, coalesce(new.merchant, '') || ' ' || coalesce(new.text, ''))
+  )
+  on conflict (boleta_id) do update
+    set text = excluded.text,
+        text_size = excluded.text_size,
+        search_vector = excluded.search_vector;
+  new.text := null;
+  return new;
+end;
+$$;
+
+drop trigger if exists boleta_texts_move_bi on public.boletas;
+create trigger boleta_texts_move_bi
+before insert on public.boletas
+for each row execute function public.move_boleta_text();
+
+drop trigger if exists boleta_texts_move_bu on public.boletas;
+create trigger boleta_texts_move_bu
+before update of text on public.boletas
+for each row when (new.text is not null)
+execute function public.move_boleta_text();
+
+-- Aplicar junto con el despliegue de la API nueva y luego copiar el texto
+-- de las boletas existentes:
+--   python boleta_texts.py migrate
+-- y por último aplicar sql/008_boletas_clear_text.sql
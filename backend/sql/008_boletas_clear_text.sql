@@ -0,0 +1,25 @@
+-- Vaciar el texto OCR de la tabla de boletas, una vez ejecutado
+-- `python boleta_texts.py migrate` (ver sql/007_boleta_texts.sql).
+--
+-- La columna `text` se mantiene: el dashboard la sigue enviando al insertar
+-- y el trigger boleta_texts_move_bi de sql/007 la mueve a boleta_texts.
+
+-- No seguir si quedan boletas sin migrar (se perdería su texto)
+do $$
+declare
+  missing bigint;
+begin
+  select count(*) into missing
+  from public.boletas b
+  where not exists (select 1 from public.boleta_texts t where t.boleta_id = b.id);
+  if missing > 0 then
+    raise exception '% boletas sin registro en boleta_texts: ejecutar `python boleta_texts.py migrate`', missing;
+  end if;
+end$$;
+
+drop index if exists public.boletas_search_idx;
+update public.boletas set text = null where text is not null;
+
+-- El espacio se recupera a medida que se actualizan las filas; para
+-- recuperarlo de inmediato (bloquea la tabla, fuera de una transacción):
+--   vacuum full public.boletas;
@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+import io
+import os
+import logging
+from typing import TYPE_CHECKING
+
+# httpx se importa con la primera descarga (solo lo usa /ocr/from-storage)
+if TYPE_CHECKING:
+    import httpx
+
+logger = logging.getLogger(__name__)
+
+# Configuración de descargas desde Supabase Storage
+STORAGE_MAX_BYTES = 10 * 1024 * 1024  # mismo límite que las subidas a /ocr
+STORAGE_TIMEOUT_SECONDS = float(os.getenv("STORAGE_TIMEOUT_SECONDS", "30"))
+STORAGE_CONNECT_TIMEOUT_SECONDS = float(os.getenv("STORAGE_CONNECT_TIMEOUT_SECONDS", "5"))
+STORAGE_MAX_CONNECTIONS = int(os.getenv("STORAGE_MAX_CONNECTIONS", "20"))
+
+class DownloadTooLarge(Exception):
+    """La descarga supera el tamaño máximo permitido."""
+
+class DownloadFailed(Exception):
+    """La descarga falló (error de red, timeout o respuesta HTTP de error)."""
+
+_client: httpx.AsyncClient | None = None
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    Cliente HTTP compartido durante la vida de la aplicación.
+
+    Reutiliza conexiones y sesiones TLS hacia Storage entre requests.
+    """
+    import httpx
+
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            timeout=httpx.Timeout(STORAGE_TIMEOUT_SECONDS, connect=STORAGE_CONNECT_TIMEOUT_SECONDS),
+            limits=httpx.Limits(
+                max_connections=STORAGE_MAX_CONNECTIONS,
+                max_keepalive_connections=STORAGE_MAX_CONNECTIONS
+            )
+        )
+    return _client
+
+async def close_http_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+async def download_image(
+    url: str,
+    max_bytes: int = STORAGE_MAX_BYTES,
+    client: httpx.AsyncClient | None = None
+) -> bytes:
+    """
+    Descarga una imagen por streaming, cortando si supera `max_bytes`.
+
+    Args:
+        url: URL (firmada) de la imagen
+        max_bytes: Tamaño máximo aceptado
+        client: Cliente HTTP a usar (por defecto el compartido)
+
+    Returns:
+        Bytes de la imagen
+
+    Raises:
+        DownloadTooLarge: Si la imagen supera `max_bytes`
+        DownloadFailed: Si la descarga falla
+    """
+    import httpx
+
+    client = client or get_http_client()
+    try:
+        async with client.stream("GET", url) as response:
+            response.raise_for_status()
+
+            declared = response.headers.get("content-length")
+            if declared and declared.isdigit() and int(declared) > max_bytes:
+                raise DownloadTooLarge(f"Content-Length {declared} supera {max_bytes} bytes")
+
+            buffer = io.BytesIO()
+            async for chunk in response.aiter_bytes():
+                if buffer.tell() + len(chunk) > max_bytes:
+                    raise DownloadTooLarge(f"La descarga supera {max_bytes} bytes")
+                buffer.write(chunk)
+    except httpx.HTTPError as e:
+        raise DownloadFailed(str(e)) from e
+
+    # getvalue() entrega el buffer interno sin copiarlo
+    return buffer.getvalue()
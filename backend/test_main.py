@@ -4,7 +4,7 @@ from httpx import AsyncClient
 from fastapi.testclient import TestClient
 from unittest.mock import patch, MagicMock
 from main_clean import app
-from db import get_db
+from db import get_db, get_session_factory
 from models import Base
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
@@ -22,6 +22,7 @@ def override_get_db():
         db.close()
 
 app.dependency_overrides[get_db] = override_get_db
+app.dependency_overrides[get_session_factory] = lambda: TestingSessionLocal
 
 # Crear tablas de prueba
 Base.metadata.create_all(bind=engine)
@@ -35,6 +36,42 @@ async def async_client():
     async with AsyncClient(app=app, base_url="http://test") as ac:
         yield ac
 
+@pytest.fixture(autouse=True)
+def clear_ocr_cache():
+    """Evita que resultados de OCR cacheados se filtren entre tests"""
+    from ocr_cache import ocr_cache
+    ocr_cache.clear()
+
+@pytest.fixture
+def db_session():
+    db = TestingSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+@pytest.fixture
+def clean_boletas(db_session):
+    """Elimina las boletas (y sus agregados y versiones) de los usuarios de prueba"""
+    from models import Boleta, BoletaStatsRollup, BoletaVersion
+    from http_cache import response_cache
+    users = ("test-user-id", "other-user-id")
+    db_session.query(Boleta).filter(Boleta.user_id.in_(users)).delete()
+    db_session.query(BoletaStatsRollup).filter(BoletaStatsRollup.user_id.in_(users)).delete()
+    db_session.query(BoletaVersion).filter(BoletaVersion.user_id.in_(users)).delete()
+    db_session.commit()
+    # Las versiones vuelven a 0: descartar respuestas guardadas con esas versiones
+    response_cache.clear()
+
+@pytest.fixture
+def auth_user():
+    """Autentica las requests como un usuario de prueba"""
+    from deps import get_current_user
+    
+    app.dependency_overrides[get_current_user] = lambda: {"sub": "test-user-id"}
+    yield {"sub": "test-user-id"}
+    app.dependency_overrides.pop(get_current_user, None)
+
 @pytest.fixture
 def mock_user():
     return {"sub": "test-user-id"}
@@ -180,5 +217,1721 @@ class TestParsing:
         assert result["date"].month == 12
         assert result["date"].day == 20
 
+class TestOCRPool:
+    """Tests para el pool de procesos de OCR"""
+    
+    def test_run_in_worker_process(self):
+        """Test de ejecución en un proceso del pool"""
+        from ocr import OCRPool
+        
+        pool = OCRPool(max_workers=1, queue_size=0)
+        try:
+            assert asyncio.run(pool.run(len, b"abc")) == 3
+            assert pool.pending == 0
+        finally:
+            pool.shutdown()
+    
+    def test_pool_saturated(self):
+        """Test de rechazo cuando la cola está llena"""
+        import time
+        from ocr import OCRPool, OCRPoolSaturated
+        
+        pool = OCRPool(max_workers=1, queue_size=0)
+        
+        async def submit_two():
+            first = asyncio.ensure_future(pool.run(time.sleep, 0.2))
+            await asyncio.sleep(0)
+            try:
+                with pytest.raises(OCRPoolSaturated):
+                    await pool.run(time.sleep, 0)
+            finally:
+                await first
+        
+        try:
+            asyncio.run(submit_two())
+        finally:
+            pool.shutdown()
+    
+    def test_ocr_endpoint_saturated(self, client, auth_user):
+        """Test de respuesta 503 cuando el pool está saturado"""
+        from ocr import OCRPoolSaturated
+        
+        with patch('main_clean.ocr_pool.image_to_string', side_effect=OCRPoolSaturated("lleno")):
+            files = {"file": ("test.jpg", b"fake image content", "image/jpeg")}
+            response = client.post("/ocr", files=files)
+        
+        assert response.status_code == 503
+
+class TestOCRJobs:
+    """Tests para la cola de trabajos de OCR"""
+    
+    @pytest.fixture(autouse=True)
+    def clean_jobs(self, db_session):
+        from models import OCRJob
+        db_session.query(OCRJob).delete()
+        db_session.commit()
+    
+    def test_submit_and_poll_job(self, client, auth_user):
+        """Test de encolado y consulta de estado"""
+        files = {"file": ("test.jpg", b"fake image content", "image/jpeg")}
+        response = client.post("/ocr/jobs", files=files)
+        assert response.status_code == 202
+        job = response.json()
+        assert job["status"] == "pending"
+        
+        response = client.get(f"/ocr/jobs/{job['id']}")
+        assert response.status_code == 200
+        assert response.json()["nombre_archivo"] == "test.jpg"
+    
+    def test_job_of_other_user_not_found(self, client, auth_user, db_session):
+        """Test de aislamiento de trabajos entre usuarios"""
+        from crud import create_ocr_job
+        
+        job = create_ocr_job(db_session, "other-user-id", "ajena.jpg", b"img")
+        response = client.get(f"/ocr/jobs/{job.id}")
+        assert response.status_code == 404
+    
+    def test_runner_processes_job(self, db_session):
+        """Test del worker: OCR, parseo y creación de boleta"""
+        from unittest.mock import AsyncMock
+        from crud import create_ocr_job
+        from jobs import OCRJobRunner
+        from main_clean import process_ocr_job
+        from models import Boleta
+        
+        job = create_ocr_job(db_session, "test-user-id", "boleta.jpg", b"img")
+        runner = OCRJobRunner(process_ocr_job, session_factory=TestingSessionLocal)
+        
+        ocr_text = "SUPERMERCADO ABC\nTOTAL 1.500"
+        with patch('main_clean.ocr_pool.image_to_string', new=AsyncMock(return_value=ocr_text)):
+            assert asyncio.run(runner.run_once()) is True
+        
+        db_session.refresh(job)
+        assert job.status == "done"
+        assert job.image is None
+        boleta = db_session.get(Boleta, job.boleta_id)
+        assert boleta.merchant == "SUPERMERCADO ABC"
+        assert asyncio.run(runner.run_once()) is False
+    
+    def test_saturated_job_does_not_spend_attempts(self, db_session):
+        """Test de OCR saturado: el trabajo se reencola sin gastar intentos"""
+        from unittest.mock import AsyncMock
+        from crud import create_ocr_job
+        from jobs import OCRJobRunner
+        from main_clean import process_ocr_job
+        from ocr import OCRPoolSaturated
+        
+        job = create_ocr_job(db_session, "test-user-id", "boleta.jpg", b"img-saturada")
+        runner = OCRJobRunner(process_ocr_job, session_factory=TestingSessionLocal, max_attempts=3)
+        
+        saturated = AsyncMock(side_effect=OCRPoolSaturated("saturado"))
+        with patch('main_clean.ocr_pool.image_to_string', new=saturated):
+            for _ in range(5):
+                assert asyncio.run(runner.run_once()) is False
+        db_session.refresh(job)
+        assert (job.status, job.attempts) == ("pending", 0)
+        
+        with patch('main_clean.ocr_pool.image_to_string', new=AsyncMock(return_value="TIENDA\nTOTAL 1.000")):
+            assert asyncio.run(runner.run_once()) is True
+        db_session.refresh(job)
+        assert (job.status, job.attempts) == ("done", 1)
+    
+    def test_runner_uses_admission_slot(self, db_session):
+        """Test del worker: ocupa un cupo global de OCR y reencola si no hay"""
+        from unittest.mock import AsyncMock
+        from admission import AdmissionController
+        from crud import create_ocr_job
+        from jobs import OCRJobRunner
+        from main_clean import process_ocr_job
+        
+        job = create_ocr_job(db_session, "test-user-id", "boleta.jpg", b"img-admision")
+        runner = OCRJobRunner(process_ocr_job, session_factory=TestingSessionLocal)
+        controller = AdmissionController(max_in_flight=1, max_waiting=0)
+        ocr = AsyncMock(return_value="TIENDA\nTOTAL 1.000")
+        
+        async def with_slot_taken():
+            async with controller.slot():
+                return await runner.run_once()
+        
+        with patch("main_clean.ocr_admission", controller), \
+                patch('main_clean.ocr_pool.image_to_string', new=ocr):
+            assert asyncio.run(with_slot_taken()) is False
+            ocr.assert_not_called()
+            db_session.refresh(job)
+            assert (job.status, job.attempts) == ("pending", 0)
+            assert asyncio.run(runner.run_once()) is True
+        db_session.refresh(job)
+        assert job.status == "done"
+    
+    def test_stale_running_job_is_reclaimed(self, db_session):
+        """Test de recuperación de trabajos con lease vencido"""
+        from datetime import datetime, timedelta
+        from crud import create_ocr_job, claim_ocr_job
+        
+        job = create_ocr_job(db_session, "test-user-id", "boleta.jpg", b"img")
+        job.status = "running"
+        job.attempts = 1
+        job.updated_at = datetime.utcnow() - timedelta(hours=1)
+        db_session.commit()
+        
+        claimed = claim_ocr_job(db_session, lease_seconds=300, max_attempts=3)
+        assert claimed.id == job.id
+        assert claimed.attempts == 2
+        assert claim_ocr_job(db_session, lease_seconds=300, max_attempts=3) is None
+
+class TestOCRBatch:
+    """Tests para OCR por lote"""
+    
+    def test_batch_partial_failure(self, client, auth_user, db_session):
+        """Test de lote con archivos válidos e inválidos"""
+        from unittest.mock import AsyncMock
+        from models import Boleta
+        
+        async def fake_ocr(data):
+            return "" if data == b"blank" else "TIENDA LOTE\nTOTAL 2.000"
+        
+        files = [
+            ("files", ("a.jpg", b"img-a", "image/jpeg")),
+            ("files", ("nota.txt", b"texto", "text/plain")),
+            ("files", ("blank.jpg", b"blank", "image/jpeg")),
+            ("files", ("b.jpg", b"img-b", "image/jpeg")),
+        ]
+        with patch('main_clean.ocr_pool.image_to_string', new=AsyncMock(side_effect=fake_ocr)):
+            response = client.post("/ocr/batch", files=files)
+        
+        assert response.status_code == 200
+        data = response.json()
+        assert data["total"] == 4
+        assert data["succeeded"] == 2
+        assert data["failed"] == 2
+        assert [item["success"] for item in data["items"]] == [True, False, False, True]
+        assert "Archivo debe ser una imagen" in data["items"][1]["error"]
+        
+        ids = [data["items"][0]["boleta"]["id"], data["items"][3]["boleta"]["id"]]
+        stored = db_session.query(Boleta).filter(Boleta.id.in_(ids)).all()
+        assert {b.nombre_archivo for b in stored} == {"a.jpg", "b.jpg"}
+        assert all(b.merchant == "TIENDA LOTE" for b in stored)
+    
+    def test_batch_reads_files_inside_semaphore(self):
+        """Test de lote: un archivo se lee recién cuando obtiene cupo del semáforo"""
+        from types import SimpleNamespace
+        from main_clean import _ocr_batch_file
+        
+        reads = []
+        
+        def upload(name):
+            async def read():
+                reads.append(name)
+                return name.encode()
+            return SimpleNamespace(filename=name, content_type="image/jpeg", size=None, read=read)
+        
+        async def slow_extract(data, image_hash):
+            await asyncio.sleep(0.01)
+            assert reads[-1] == data.decode()   # solo se leyó el archivo en proceso
+            return "TIENDA\nTOTAL 1.000", {}
+        
+        async def scenario():
+            semaphore = asyncio.Semaphore(1)
+            return await asyncio.gather(*(_ocr_batch_file(upload(f"{i}.jpg"), semaphore) for i in range(3)))
+        
+        with patch("main_clean.extract_receipt", slow_extract):
+            results = asyncio.run(scenario())
+        assert [text for text, _, _ in results] == ["TIENDA\nTOTAL 1.000"] * 3
+        assert reads == ["0.jpg", "1.jpg", "2.jpg"]
+    
+    def test_create_boletas_bulk(self, db_session):
+        """Test del insert masivo en una transacción"""
+        from crud import create_boletas_bulk
+        
+        boletas = create_boletas_bulk(db_session, [
+            {"nombre_archivo": f"{i}.jpg", "user_id": "test-user-id", "description": None}
+            for i in range(3)
+        ])
+        assert [b.nombre_archivo for b in boletas] == ["0.jpg", "1.jpg", "2.jpg"]
+        assert all(b.id is not None and b.fecha is not None for b in boletas)
+
+class TestOCRCache:
+    """Tests para el cache de resultados de OCR"""
+    
+    def test_lru_size_eviction(self):
+        """Test de desalojo por tamaño en memoria"""
+        from ocr_cache import OCRCache, _ENTRY_OVERHEAD
+        
+        cache = OCRCache(max_bytes=2 * (_ENTRY_OVERHEAD + 10), disk_dir=None)
+        cache.put("a", "x" * 10, {})
+        cache.put("b", "y" * 10, {})
+        assert cache.get("a") is not None  # "a" pasa a ser el más reciente
+        cache.put("c", "z" * 10, {})
+        
+        assert cache.get("b") is None
+        assert cache.get("a").text == "x" * 10
+        assert cache.get("c").text == "z" * 10
+        assert cache.size_bytes <= cache.max_bytes
+        assert (cache.hits, cache.misses) == (3, 1)
+    
+    def test_disk_tier_roundtrip(self, tmp_path):
+        """Test del nivel en disco, incluida la fecha parseada"""
+        from datetime import date
+        from ocr_cache import OCRCache
+        
+        cache = OCRCache(disk_dir=str(tmp_path))
+        cache.put("k1", "TIENDA", {"merchant": "TIENDA", "date": date(2024, 1, 15)})
+        
+        fresh = OCRCache(disk_dir=str(tmp_path))
+        entry = fresh.get("k1")
+        assert entry.text == "TIENDA"
+        assert entry.parsed["date"] == date(2024, 1, 15)
+    
+    def test_disk_tier_eviction(self, tmp_path):
+        """Test de desalojo por tamaño en disco"""
+        from ocr_cache import OCRCache
+        
+        cache = OCRCache(disk_dir=str(tmp_path), disk_max_bytes=600)
+        for i in range(10):
+            cache.put(f"key{i:02d}", "x" * 100, {})
+        
+        total = sum(f.stat().st_size for f in tmp_path.rglob("*.json"))
+        assert 0 < total <= 600
+    
+    def test_extract_receipt_uses_cache(self):
+        """Test de que una imagen repetida no vuelve a Tesseract"""
+        from unittest.mock import AsyncMock
+        from main_clean import extract_receipt
+        
+        ocr = AsyncMock(return_value="SUPERMERCADO ABC\nTOTAL 1.500")
+        with patch('main_clean.ocr_pool.image_to_string', new=ocr):
+            first = asyncio.run(extract_receipt(b"same image"))
+            second = asyncio.run(extract_receipt(b"same image"))
+        
+        assert ocr.await_count == 1
+        assert first == second
+        assert second[1]["merchant"] == "SUPERMERCADO ABC"
+
+class TestPreprocess:
+    """Tests para el preprocesamiento de imágenes"""
+    
+    def _jpeg(self, size, color="white", orientation=None, dpi=None):
+        import io
+        from PIL import Image
+        
+        image = Image.new("RGB", size, color)
+        exif = Image.Exif()
+        if orientation:
+            exif[0x0112] = orientation
+        buffer = io.BytesIO()
+        image.save(buffer, format="JPEG", exif=exif.tobytes(), dpi=dpi or (72, 72))
+        buffer.seek(0)
+        return Image.open(buffer)
+    
+    def test_rotate_grayscale_downscale(self):
+        """Test de rotación EXIF, grises y tamaño máximo"""
+        from preprocess import PreprocessConfig, preprocess_image
+        
+        image = self._jpeg((4000, 3000), orientation=6)  # rotada 90°
+        processed, timings = preprocess_image(image, PreprocessConfig(max_dimension=1000))
+        
+        assert processed.mode == "L"
+        assert max(processed.size) <= 1000
+        assert processed.size[1] > processed.size[0]  # vertical tras rotar
+        assert {"draft", "decode", "exif_rotate"} <= set(timings)
+    
+    def test_target_dpi(self):
+        """Test de reducción al DPI objetivo"""
+        from preprocess import PreprocessConfig, preprocess_image
+        
+        image = self._jpeg((1200, 600), dpi=(600, 600))
+        processed, _ = preprocess_image(image, PreprocessConfig(max_dimension=0, target_dpi=300))
+        assert processed.size == (600, 300)
+    
+    def test_crop_and_binarize(self):
+        """Test de recorte a la zona del recibo y binarización"""
+        from PIL import Image, ImageDraw
+        from preprocess import PreprocessConfig, preprocess_image
+        
+        image = Image.new("L", (400, 400), 40)
+        draw = ImageDraw.Draw(image)
+        draw.rectangle((100, 50, 299, 349), fill=230)
+        draw.text((120, 100), "TOTAL 1.500", fill=0)
+        
+        processed, timings = preprocess_image(image, PreprocessConfig(crop=True, binarize=True))
+        assert processed.size == (200, 300)
+        assert set(processed.getdata()) <= {0, 255}
+        assert "crop" in timings and "binarize" in timings
+    
+    def test_disabled(self):
+        """Test de preprocesamiento desactivado"""
+        from PIL import Image
+        from preprocess import PreprocessConfig, preprocess_image
+        
+        image = Image.new("RGB", (10, 10))
+        processed, timings = preprocess_image(image, PreprocessConfig(enabled=False))
+        assert processed is image and timings == {}
+
+class TestStorageDownload:
+    """Tests para la descarga de imágenes desde storage"""
+    
+    def _client(self, body, headers=None):
+        import httpx
+        
+        def handler(request):
+            return httpx.Response(200, content=body, headers=headers)
+        return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    
+    def test_download_within_limit(self):
+        """Test de descarga completa bajo el límite"""
+        from storage import download_image
+        
+        async def run():
+            async with self._client(b"x" * 100) as client:
+                return await download_image("https://storage.test/a.jpg", max_bytes=100, client=client)
+        
+        assert asyncio.run(run()) == b"x" * 100
+    
+    def test_download_too_large(self):
+        """Test de corte cuando el contenido supera el límite"""
+        from storage import download_image, DownloadTooLarge
+        
+        async def chunks():
+            for _ in range(10):
+                yield b"x" * 64
+        
+        async def run():
+            async with self._client(chunks()) as client:
+                await download_image("https://storage.test/a.jpg", max_bytes=100, client=client)
+        
+        with pytest.raises(DownloadTooLarge):
+            asyncio.run(run())
+    
+    def test_from_storage_too_large(self, client, auth_user):
+        """Test de respuesta de /ocr/from-storage con imagen demasiado grande"""
+        from storage import DownloadTooLarge
+        
+        with patch('main_clean.download_image', side_effect=DownloadTooLarge("grande")):
+            response = client.post("/ocr/from-storage", json={
+                "signedUrl": "https://storage.test/a.jpg",
+                "nombre_archivo": "a.jpg"
+            })
+        
+        assert response.status_code == 200
+        assert response.json()["success"] is False
+        assert "demasiado grande" in response.json()["error"]
+
+class TestCursorPagination:
+    """Tests para la paginación por cursor de /boletas"""
+    
+    @pytest.fixture
+    def boletas(self, db_session, clean_boletas):
+        from datetime import datetime, timedelta
+        from crud import create_boletas_bulk
+        
+        base = datetime(2024, 1, 1)
+        rows = [
+            {"nombre_archivo": f"{i}.jpg", "user_id": "test-user-id",
+             # Pares de boletas con la misma fecha para probar el desempate por id
+             "fecha": base + timedelta(days=i // 2)}
+            for i in range(7)
+        ]
+        created = create_boletas_bulk(db_session, rows)
+        return sorted(created, key=lambda b: (b.fecha, b.id), reverse=True)
+    
+    def test_walk_all_pages(self, client, auth_user, boletas):
+        """Test de recorrido completo sin duplicados ni saltos"""
+        response = client.get("/boletas?limit=3")
+        data = response.json()
+        assert data["total"] == 7
+        seen = [item["id"] for item in data["items"]]
+        
+        cursor = data["next_cursor"]
+        while cursor:
+            data = client.get(f"/boletas?limit=3&cursor={cursor}").json()
+            assert data["total"] is None and data["page"] is None
+            seen += [item["id"] for item in data["items"]]
+            cursor = data["next_cursor"]
+        
+        assert seen == [b.id for b in boletas]
+    
+    def test_cursor_with_total(self, client, auth_user, boletas):
+        """Test de total opcional en modo cursor"""
+        first = client.get("/boletas?limit=5").json()
+        data = client.get(f"/boletas?limit=5&include_total=true&cursor={first['next_cursor']}").json()
+        assert data["total"] == 7
+        assert len(data["items"]) == 2
+        assert data["next_cursor"] is None
+    
+    def test_invalid_cursor(self, client, auth_user):
+        """Test de cursor inválido"""
+        response = client.get("/boletas?cursor=no-es-un-cursor")
+        assert response.status_code == 400
+    
+    def test_response_error_is_not_cursor_error(self, client, auth_user, boletas):
+        """Test de ValueError al armar la respuesta: 500, no 'Cursor inválido'"""
+        cursor = client.get("/boletas?limit=3").json()["next_cursor"]
+        with patch("main_clean.BoletaListResponse", side_effect=ValueError("respuesta inválida")):
+            response = client.get(f"/boletas?limit=3&cursor={cursor}")
+        assert response.status_code == 500
+
+class TestStats:
+    """Tests para /boletas/stats"""
+    
+    @pytest.fixture
+    def boletas(self, db_session, clean_boletas):
+        from datetime import date
+        from crud import create_boletas_bulk
+        
+        return create_boletas_bulk(db_session, [
+            {"nombre_archivo": "1.jpg", "user_id": "test-user-id", "merchant": "LIDER",
+             "total_amount": 100, "confidence": 0.8, "date": date(2024, 1, 10)},
+            {"nombre_archivo": "2.jpg", "user_id": "test-user-id", "merchant": "LIDER",
+             "total_amount": 50, "confidence": 0.6, "date": date(2024, 2, 5)},
+            {"nombre_archivo": "3.jpg", "user_id": "test-user-id", "merchant": "JUMBO",
+             "total_amount": 300, "confidence": 0.9, "date": date(2024, 2, 20)},
+            {"nombre_archivo": "4.jpg", "user_id": "test-user-id", "merchant": None,
+             "total_amount": None, "confidence": None, "date": None},
+            {"nombre_archivo": "5.jpg", "user_id": "other-user-id", "merchant": "LIDER",
+             "total_amount": 999, "confidence": 0.1, "date": date(2024, 1, 1)},
+        ])
+    
+    def test_stats_aggregates(self, client, auth_user, boletas):
+        """Test de totales y desgloses correctos"""
+        data = client.get("/boletas/stats").json()
+        
+        assert data["total_boletas"] == 4
+        assert data["total_amount"] == 450.0
+        assert data["avg_amount"] == 150.0
+        assert data["min_amount"] == 50.0
+        assert data["max_amount"] == 300.0
+        assert data["avg_confidence"] == pytest.approx(0.767, abs=0.001)
+        assert data["by_month"] == [
+            {"month": "2024-01", "count": 1, "total_amount": 100.0},
+            {"month": "2024-02", "count": 2, "total_amount": 350.0},
+            {"month": None, "count": 1, "total_amount": 0.0},
+        ]
+        assert [m["merchant"] for m in data["by_merchant"]] == ["JUMBO", "LIDER", None]
+        assert data["by_merchant"][1] == {"merchant": "LIDER", "count": 2, "total_amount": 150.0}
+    
+    def test_stats_date_range(self, client, auth_user, boletas):
+        """Test de filtro por rango de fechas"""
+        data = client.get("/boletas/stats?date_from=2024-02-01&date_to=2024-02-10").json()
+        assert data["total_boletas"] == 1
+        assert data["total_amount"] == 50.0
+        assert data["by_month"] == [{"month": "2024-02", "count": 1, "total_amount": 50.0}]
+    
+    def test_rollup_matches_aggregate(self, db_session, boletas):
+        """Test de agregados incrementales iguales a la consulta completa"""
+        from crud import get_boletas_stats, create_boleta
+        from rollup import rebuild_rollups, read_rollup_stats
+        
+        rebuild_rollups(db_session, "test-user-id")
+        create_boleta(db_session, {"nombre_archivo": "6.jpg", "user_id": "test-user-id",
+                                   "merchant": "JUMBO", "total_amount": 20, "confidence": 0.5})
+        
+        from_rollup = get_boletas_stats(db_session, "test-user-id")
+        from_query = get_boletas_stats(db_session, "test-user-id", use_rollup=False)
+        assert from_rollup == from_query == read_rollup_stats(db_session, "test-user-id")
+        assert from_rollup["total_boletas"] == 5
+    
+    def test_rollup_after_delete(self, db_session, boletas):
+        """Test de descuento y recálculo de mínimo/máximo al eliminar"""
+        from crud import get_boletas_stats, delete_boleta
+        from rollup import rebuild_rollups, read_rollup_stats
+        
+        rebuild_rollups(db_session, "test-user-id")
+        jumbo = next(b for b in boletas if b.merchant == "JUMBO")
+        assert delete_boleta(db_session, jumbo.id, "test-user-id")
+        
+        stats = get_boletas_stats(db_session, "test-user-id")
+        assert stats == get_boletas_stats(db_session, "test-user-id", use_rollup=False)
+        assert stats == read_rollup_stats(db_session, "test-user-id")
+        assert stats["max_amount"] == 100.0
+        assert stats["total_amount"] == 150.0
+        assert "JUMBO" not in [m["merchant"] for m in stats["by_merchant"]]
+    
+    def test_rollup_follows_direct_writes(self, db_session, boletas):
+        """Test de agregados con escrituras fuera de la API (p.ej. el dashboard vía Supabase)"""
+        from sqlalchemy import text as sql
+        from crud import get_boletas_stats
+        from rollup import rebuild_rollups, read_rollup_stats
+        
+        rebuild_rollups(db_session, "test-user-id")
+        statements = (
+            "INSERT INTO boletas (nombre_archivo, merchant, total_amount, confidence, date, fecha, user_id) "
+            "VALUES ('d.jpg', 'UNIMARC', 300, 0.8, '2024-03-05', '2024-03-05', 'test-user-id')",
+            "UPDATE boletas SET merchant = 'LIDER', total_amount = 5, date = NULL WHERE nombre_archivo = 'd.jpg'",
+            "UPDATE boletas SET total_amount = NULL WHERE merchant = 'JUMBO'",
+            "DELETE FROM boletas WHERE nombre_archivo = 'd.jpg'",
+        )
+        for statement in statements:
+            db_session.execute(sql(statement))
+            db_session.commit()
+            assert read_rollup_stats(db_session, "test-user-id") == \
+                get_boletas_stats(db_session, "test-user-id", use_rollup=False), statement
+    
+    def test_rebuild_rollups(self, db_session, boletas):
+        """Test de reconstrucción desde boletas"""
+        from crud import get_boletas_stats
+        from models import BoletaStatsRollup
+        from rollup import rebuild_rollups
+        
+        incremental = get_boletas_stats(db_session, "test-user-id")
+        db_session.query(BoletaStatsRollup).filter(BoletaStatsRollup.user_id == "test-user-id").delete()
+        db_session.commit()
+        
+        assert rebuild_rollups(db_session, "test-user-id") == 1
+        assert get_boletas_stats(db_session, "test-user-id") == incremental
+    
+    def test_partial_rollup_falls_back_until_rebuilt(self, db_session, boletas):
+        """Test de agregados creados antes del rebuild: se consulta boletas hasta tener la marca"""
+        from crud import get_boletas_stats, create_boleta
+        from models import BoletaStatsRollup
+        from rollup import rebuild_rollups, read_rollup_stats, ALL_USERS
+        
+        # Como tras el deploy: boletas existentes sin agregados, y una boleta nueva
+        db_session.query(BoletaStatsRollup).filter(BoletaStatsRollup.user_id == "test-user-id").delete()
+        db_session.commit()
+        create_boleta(db_session, {"nombre_archivo": "6.jpg", "user_id": "test-user-id",
+                                   "merchant": "JUMBO", "total_amount": 20, "confidence": 0.5})
+        
+        assert read_rollup_stats(db_session, "test-user-id") is None
+        stats = get_boletas_stats(db_session, "test-user-id")
+        assert stats == get_boletas_stats(db_session, "test-user-id", use_rollup=False)
+        assert stats["total_boletas"] == 5
+        
+        # La reconstrucción completa deja la marca global; cubre también a usuarios sin boletas
+        try:
+            rebuild_rollups(db_session)
+            assert read_rollup_stats(db_session, "test-user-id") == stats
+            assert read_rollup_stats(db_session, "nuevo-user-id")["total_boletas"] == 0
+        finally:
+            db_session.query(BoletaStatsRollup).filter(BoletaStatsRollup.user_id == ALL_USERS).delete()
+            db_session.commit()
+    
+    def test_stats_empty(self, client, auth_user, clean_boletas):
+        """Test de usuario sin boletas"""
+        data = client.get("/boletas/stats").json()
+        assert data["total_boletas"] == 0
+        assert data["avg_amount"] is None
+        assert data["by_month"] == []
+
+class TestParserCorpus:
+    """Tests del parser de una pasada contra el corpus de regresión"""
+
+    def test_corpus_matches_original_parser(self):
+        """Test de salida idéntica al parser original en todo el corpus"""
+        import json
+        from main_clean import parse_boleta_text
+        from benchmarks.parser_corpus import CORPUS_PATH, encode_result
+
+        with open(CORPUS_PATH, "r", encoding="utf-8") as f:
+            cases = json.load(f)
+
+        assert len(cases) > 200
+        for case in cases:
+            assert encode_result(parse_boleta_text(case["text"])) == case["expected"], case["text"]
+
+    def test_total_before_fallback_keywords(self):
+        """Test de prioridad de la línea TOTAL sobre Importe/Monto"""
+        from main_clean import parse_boleta_text
+
+        text = "Comercio XYZ\nImporte 10,00\nTOTAL 25,00"
+        assert parse_boleta_text(text)["total_amount"] == 25.0
+
+        text = "Comercio XYZ\nImporte 10,00\nTOTAL 0"
+        assert parse_boleta_text(text)["total_amount"] == 10.0
+
+    def test_day_month_year_before_year_month_day(self):
+        """Test de prioridad de formatos de fecha en distintas líneas"""
+        from main_clean import parse_boleta_text
+
+        result = parse_boleta_text("Tienda ABC\n1999-05-04\nFecha: 20-12-2023")
+        assert result["date"].isoformat() == "2023-12-20"
+
+class TestTokenCache:
+    """Tests del cache de tokens JWT verificados"""
+
+    @staticmethod
+    def make_token(sub="test-user-id", expires_in=3600):
+        import time
+        from jose import jwt
+        from deps import SUPABASE_JWT_SECRET
+
+        return jwt.encode({"sub": sub, "exp": int(time.time()) + expires_in}, SUPABASE_JWT_SECRET, algorithm="HS256")
+
+    def test_repeat_request_skips_decode(self):
+        """Test de que un token repetido no se vuelve a verificar"""
+        from deps import get_current_user, token_cache
+
+        token_cache.clear()
+        token = self.make_token()
+        hits = token_cache.hits
+
+        assert asyncio.run(get_current_user(f"Bearer {token}")) == {"sub": "test-user-id"}
+        with patch("deps.jwt.decode", side_effect=AssertionError("decode no esperado")):
+            assert asyncio.run(get_current_user(f"Bearer {token}")) == {"sub": "test-user-id"}
+        assert token_cache.hits == hits + 1
+
+    def test_invalid_token_not_cached(self):
+        """Test de que un token inválido no entra al cache"""
+        from fastapi import HTTPException
+        from deps import get_current_user, token_cache
+
+        token_cache.clear()
+        token = self.make_token() + "x"
+        for _ in range(2):
+            with pytest.raises(HTTPException) as exc:
+                asyncio.run(get_current_user(f"Bearer {token}"))
+            assert exc.value.status_code == 401
+        assert len(token_cache) == 0
+
+    def test_expired_entries_evicted(self):
+        """Test de expiración según 'exp'"""
+        import time
+        from deps import TokenCache
+
+        cache = TokenCache(max_entries=10)
+        cache.put("expirado", {"sub": "a"}, exp=time.time() - 1)
+        cache.put("por-expirar", {"sub": "b"}, exp=time.time() + 0.05)
+        assert cache.get("expirado") is None
+        assert cache.get("por-expirar") == {"sub": "b"}
+
+        time.sleep(0.06)
+        assert cache.get("por-expirar") is None
+        assert len(cache) == 0
+
+    def test_lru_bound(self):
+        """Test del límite de entradas"""
+        from deps import TokenCache
+
+        cache = TokenCache(max_entries=2)
+        cache.put("a", {"sub": "a"})
+        cache.put("b", {"sub": "b"})
+        cache.get("a")
+        cache.put("c", {"sub": "c"})
+
+        assert cache.get("b") is None
+        assert cache.get("a") == {"sub": "a"}
+        assert cache.get("c") == {"sub": "c"}
+
+class TestAsyncCrud:
+    """Tests de la capa CRUD async (DB_ASYNC=true)"""
+
+    @staticmethod
+    def run_async(scenario):
+        """Ejecuta `scenario(db)` con una AsyncSession sobre la base de prueba"""
+        from sqlalchemy.ext.asyncio import async_sessionmaker
+        from db import make_async_engine
+
+        async def main():
+            engine = make_async_engine(SQLALCHEMY_DATABASE_URL)
+            try:
+                async with async_sessionmaker(engine, expire_on_commit=False)() as db:
+                    return await scenario(db)
+            finally:
+                await engine.dispose()
+
+        return asyncio.run(main())
+
+    def test_async_database_url(self):
+        """Test de selección del driver async"""
+        from db import async_database_url
+
+        assert async_database_url("postgresql://u:p@host:5432/db") == "postgresql+asyncpg://u:p@host:5432/db"
+        assert async_database_url("postgresql+psycopg://u@host/db") == "postgresql+asyncpg://u@host/db"
+        assert async_database_url("sqlite:///./test.db") == "sqlite+aiosqlite:///./test.db"
+        with pytest.raises(ValueError):
+            async_database_url("mysql://u@host/db")
+
+    def test_create_list_stats_delete(self, db_session, clean_boletas):
+        """Test de que las funciones async coinciden con las sync"""
+        import crud
+        import crud_async
+        from datetime import date
+
+        async def scenario(db):
+            created = []
+            for merchant, amount in (("LIDER", 100.0), ("JUMBO", 50.0), ("LIDER", 20.0)):
+                created.append(await crud_async.create_boleta(db, {
+                    "nombre_archivo": "a.jpg", "user_id": "test-user-id", "merchant": merchant,
+                    "total_amount": amount, "date": date(2024, 3, 1), "confidence": 0.9
+                }))
+            page = await crud_async.list_boletas(db, "test-user-id", 1, 2)
+            after = await crud_async.list_boletas_after(db, "test-user-id", None, 2)
+            stats = await crud_async.get_boletas_stats(db, "test-user-id")
+            return created, page, after, stats
+
+        created, (items, total), (_, next_cursor, _), stats = self.run_async(scenario)
+
+        sync_items, sync_total = crud.list_boletas(db_session, "test-user-id", 1, 2)
+        assert total == sync_total == 3
+        assert [b.id for b in items] == [b.id for b in sync_items]
+        assert next_cursor == crud.encode_cursor(items[-1])
+        assert stats == crud.get_boletas_stats(db_session, "test-user-id", use_rollup=False)
+        assert stats["total_amount"] == 170.0
+
+        async def delete(db):
+            deleted = await crud_async.delete_boleta(db, created[1].id, "test-user-id")
+            return deleted, await crud_async.get_boletas_stats(db, "test-user-id")
+
+        deleted, stats_after = self.run_async(delete)
+        assert deleted
+        assert stats_after == crud.get_boletas_stats(db_session, "test-user-id")
+        assert stats_after == crud.get_boletas_stats(db_session, "test-user-id", use_rollup=False)
+        assert stats_after["max_amount"] == 100.0
+
+    def test_endpoints_with_async_sessions(self, client, auth_user, clean_boletas):
+        """Test de /boletas y /boletas/stats usando AsyncSession"""
+        from unittest.mock import AsyncMock
+        from sqlalchemy.ext.asyncio import async_sessionmaker
+        from db import make_async_engine
+        import main_clean
+
+        async def override_get_async_db():
+            engine = make_async_engine(SQLALCHEMY_DATABASE_URL)
+            async with async_sessionmaker(engine, expire_on_commit=False)() as db:
+                yield db
+            await engine.dispose()
+
+        with patch.object(main_clean, "DB_ASYNC", True):
+            app.dependency_overrides[main_clean.get_boletas_db] = override_get_async_db
+            try:
+                with patch("main_clean.ocr_pool.image_to_string", AsyncMock(return_value="LIDER\nTOTAL 1.500")):
+                    response = client.post("/ocr", files={"file": ("a.jpg", b"async", "image/jpeg")})
+                assert response.status_code == 200
+                assert response.json()["total_amount"] == 1500.0
+
+                listing = client.get("/boletas").json()
+                stats = client.get("/boletas/stats").json()
+            finally:
+                app.dependency_overrides[main_clean.get_boletas_db] = override_get_db
+
+        assert listing["total"] == 1
+        assert listing["items"][0]["merchant"] == "LIDER"
+        assert stats["total_boletas"] == 1
+        assert stats["by_merchant"][0]["merchant"] == "LIDER"
+
+class TestBoletaSummary:
+    """Tests del listado sin texto OCR y del detalle de boleta"""
+
+    @pytest.fixture
+    def boletas(self, db_session, clean_boletas):
+        from crud import create_boleta
+
+        created = [
+            create_boleta(db_session, {
+                "nombre_archivo": f"b{i}.jpg", "user_id": "test-user-id",
+                "text": "LINEA DE OCR\n" * 200, "merchant": "LIDER", "total_amount": 10.0 * i
+            })
+            for i in range(1, 4)
+        ]
+        create_boleta(db_session, {"nombre_archivo": "otra.jpg", "user_id": "other-user-id", "text": "ajena"})
+        return created
+
+    def test_list_omits_text_on_request(self, client, auth_user, boletas):
+        """Test de listado sin texto OCR con include_text=false (por defecto se incluye)"""
+        data = client.get("/boletas", params={"include_text": False}).json()
+        assert data["total"] == 3
+        assert all("text" not in item for item in data["items"])
+        assert data["items"][0]["merchant"] == "LIDER"
+
+        full = client.get("/boletas").json()
+        assert full["items"][0]["text"].startswith("LINEA DE OCR")
+
+        page = client.get("/boletas", params={"limit": 2, "include_text": False}).json()
+        rest = client.get(
+            "/boletas", params={"limit": 2, "include_text": False, "cursor": page["next_cursor"]}
+        ).json()
+        assert "text" not in rest["items"][0]
+        assert len(page["items"]) + len(rest["items"]) == 3
+
+    def test_summary_query_skips_text_column(self, db_session, boletas):
+        """Test de que la proyección no lee la columna text"""
+        from crud import list_boletas, list_boletas_after
+
+        items, _ = list_boletas(db_session, "test-user-id", include_text=False)
+        assert "text" not in items[0]._fields
+        items, _, _ = list_boletas_after(db_session, "test-user-id", include_text=False)
+        assert "text" not in items[0]._fields
+
+    def test_get_boleta_detail(self, client, auth_user, boletas, db_session):
+        """Test del detalle de boleta"""
+        from models import Boleta
+
+        response = client.get(f"/boletas/{boletas[0].id}")
+        assert response.status_code == 200
+        assert response.json()["text"].startswith("LINEA DE OCR")
+
+        other = db_session.query(Boleta).filter(Boleta.user_id == "other-user-id").first()
+        assert client.get(f"/boletas/{other.id}").status_code == 404
+        assert client.get("/boletas/stats").status_code == 200
+
+class TestSearch:
+    """Tests de búsqueda de boletas"""
+
+    @pytest.fixture
+    def boletas(self, db_session, clean_boletas):
+        from datetime import date
+        from crud import create_boleta
+
+        rows = [
+            ("Café Haití", "CAFE HAITI\nCortado 2.500\nTOTAL 2.500", 2500, date(2024, 1, 10)),
+            ("LIDER Express", "LIDER\nLeche entera\nPan amasado\nTOTAL 4.990", 4990, date(2024, 2, 5)),
+            ("Lider", "LIDER\nDetergente\nTOTAL 12.990", 12990, date(2024, 3, 1)),
+            ("Copec", "COPEC\nBencina 93\nTOTAL 30.000", 30000, date(2024, 3, 20)),
+        ]
+        created = [
+            create_boleta(db_session, {
+                "nombre_archivo": "s.jpg", "user_id": "test-user-id", "merchant": merchant,
+                "text": text, "total_amount": amount, "date": day
+            })
+            for merchant, text, amount, day in rows
+        ]
+        create_boleta(db_session, {
+            "nombre_archivo": "x.jpg", "user_id": "other-user-id", "merchant": "Lider", "text": "LIDER leche"
+        })
+        return created
+
+    def search(self, client, **params):
+        response = client.get("/boletas/search", params=params)
+        assert response.status_code == 200
+        return response.json()
+
+    def test_text_search(self, client, auth_user, boletas):
+        """Test de búsqueda de texto completo"""
+        data = self.search(client, q="leche")
+        assert [item["merchant"] for item in data["items"]] == ["LIDER Express"]
+        assert "text" not in data["items"][0]
+
+        # Sin distinguir tildes ni mayúsculas, todas las palabras deben aparecer
+        assert len(self.search(client, q="cafe cortado")["items"]) == 1
+        assert self.search(client, q="cafe bencina")["items"] == []
+        # Caracteres especiales de la sintaxis FTS no rompen la consulta
+        assert self.search(client, q='"leche* OR (')["items"] == []
+
+    def test_filters(self, client, auth_user, boletas):
+        """Test de filtros por comercio, monto y fecha"""
+        lider = self.search(client, merchant="lid")
+        assert {item["merchant"] for item in lider["items"]} == {"LIDER Express", "Lider"}
+        assert self.search(client, merchant="%")["items"] == []
+
+        amounts = self.search(client, min_amount=4000, max_amount=15000)
+        assert sorted(item["total_amount"] for item in amounts["items"]) == [4990.0, 12990.0]
+
+        march = self.search(client, date_from="2024-03-01", date_to="2024-03-31", q="total")
+        assert {item["merchant"] for item in march["items"]} == {"Lider", "Copec"}
+
+    def test_pagination_and_delete(self, client, auth_user, boletas, db_session):
+        """Test de paginación y de sincronización del índice al eliminar"""
+        from crud import delete_boleta
+
+        first = self.search(client, limit=3)
+        assert len(first["items"]) == 3
+        assert first["next_offset"] == 3
+        rest = self.search(client, limit=3, offset=first["next_offset"])
+        assert len(rest["items"]) == 1
+        assert rest["next_offset"] is None
+
+        assert delete_boleta(db_session, boletas[1].id, "test-user-id")
+        assert self.search(client, q="leche")["items"] == []
+
+    def test_postgres_statement_matches_index(self):
+        """Test de que la consulta Postgres usa la misma expresión que el índice GIN"""
+        import os
+        from sqlalchemy.dialects import postgresql
+        from search import search_statement
+        from crud import BOLETA_SUMMARY_COLUMNS
+
+        with open(os.path.join(os.path.dirname(__file__), "sql", "007_boleta_texts.sql")) as f:
+            migration = f.read()
+        assert "using gin (search_vector)" in migration
+
+        sql = str(search_statement("postgresql", "u", BOLETA_SUMMARY_COLUMNS, q="leche").compile(
+            dialect=postgresql.dialect()
+        ))
+        assert "JOIN boleta_texts ON boleta_texts.boleta_id = boletas.id" in sql
+        assert "boleta_texts.search_vector @@ websearch_to_tsquery('spanish'::regconfig" in sql
+        assert "ts_rank" in sql
+
+class TestExport:
+    """Tests de exportación en streaming"""
+
+    @pytest.fixture
+    def boletas(self, db_session, clean_boletas):
+        from datetime import date
+        from crud import create_boletas_bulk
+
+        return create_boletas_bulk(db_session, [
+            {
+                "nombre_archivo": f"e{i}.jpg", "user_id": "test-user-id", "merchant": f"Comercio, {i}",
+                "text": f"linea 1\nlinea \"{i}\"", "total_amount": 100 + i, "date": date(2024, 1, 1 + i),
+                "confidence": 0.9
+            }
+            for i in range(7)
+        ] + [{"nombre_archivo": "x.jpg", "user_id": "other-user-id"}])
+
+    def test_export_csv(self, client, auth_user, boletas):
+        """Test de exportación CSV"""
+        import csv, io
+
+        response = client.get("/boletas/export", params={"format": "csv", "include_text": True})
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/csv")
+        assert 'filename="boletas.csv"' in response.headers["content-disposition"]
+
+        rows = list(csv.DictReader(io.StringIO(response.text)))
+        assert len(rows) == 7
+        assert rows[0]["merchant"] == "Comercio, 6"
+        assert rows[0]["text"] == 'linea 1\nlinea "6"'
+        assert rows[0]["date"] == "2024-01-07"
+        assert float(rows[0]["total_amount"]) == 106.0
+
+    def test_export_ndjson(self, client, auth_user, boletas):
+        """Test de exportación NDJSON sin texto OCR"""
+        import json
+
+        response = client.get("/boletas/export", params={"format": "ndjson"})
+        assert response.status_code == 200
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        assert len(lines) == 7
+        assert "text" not in lines[0]
+        assert lines[-1]["total_amount"] == 100.0
+        assert {line["id"] for line in lines} == {b.id for b in boletas[:7]}
+
+        assert client.get("/boletas/export", params={"format": "xlsx"}).status_code == 422
+
+    def test_stream_is_chunked_and_closes_session(self, boletas):
+        """Test de envío por bloques y cierre de la sesión al terminar"""
+        from export import stream_export
+
+        closed = []
+
+        def session_factory():
+            db = TestingSessionLocal()
+            close = db.close
+            db.close = lambda: (closed.append(True), close())
+            return db
+
+        chunks = stream_export(session_factory, "test-user-id", "csv", chunk_rows=3, batch_size=2)
+        assert next(chunks).startswith(b"id,nombre_archivo")
+        assert not closed
+        assert [chunk.count(b"\n") for chunk in chunks] == [3, 3, 1]
+        assert closed == [True]
+
+class TestImporter:
+    """Tests del importador de volcados JSON"""
+
+    def test_iter_json_records_streams_array_and_ndjson(self):
+        """Test de lectura incremental con bloques pequeños y offsets para reanudar"""
+        import io, json
+        from importer import iter_json_records
+
+        records = [{"id": i, "text": "ñandú ‘comillas’ " * i} for i in range(20)]
+        for data in (json.dumps(records, indent=2, ensure_ascii=False), "\n".join(json.dumps(r) for r in records)):
+            stream = io.BytesIO(b"\xef\xbb\xbf" + data.encode("utf-8"))
+            parsed = list(iter_json_records(stream, read_size=7))
+            assert [record for record, _ in parsed] == records
+
+            _, offset = parsed[11]
+            assert [record for record, _ in iter_json_records(stream, offset, read_size=5)] == records[12:]
+
+    def test_normalize_legacy_record(self):
+        """Test de normalización del formato legado de boletas.json"""
+        import json
+        from datetime import date, datetime
+        from importer import normalize_record, InvalidRecord
+
+        with open("boletas/boletas.json", encoding="utf-8") as f:
+            legacy, current = json.load(f)
+
+        data = normalize_record(legacy, "test-user-id")
+        assert data["text"] == legacy["texto_extraido"]
+        assert data["user_id"] == "test-user-id"
+        assert data["fecha"] == datetime.fromisoformat(legacy["fecha"])
+        assert data["merchant"] == "‘= Mercado"
+        assert "id" not in data
+
+        data = normalize_record(current, "test-user-id")
+        assert data["total_amount"] == 20.0
+        assert data["date"] == date(2025, 8, 10)
+
+        no_fecha = normalize_record({"id": 1754463307, "text": "x"}, "u")
+        assert no_fecha["fecha"] == datetime.utcfromtimestamp(1754463307)
+        with pytest.raises(InvalidRecord):
+            normalize_record({"text": "x"})
+
+    def test_import_and_resume(self, tmp_path, db_session, clean_boletas):
+        """Test de importación en lotes, reanudación y checkpoint completado"""
+        import json
+        from models import Boleta
+        from crud import get_boletas_stats
+        import importer
+
+        dump = tmp_path / "dump.json"
+        records = [{"id": 1754000000 + i, "nombre_archivo": f"{i}.png", "texto_extraido": f"TIENDA\nTOTAL {i},00"}
+                   for i in range(1, 6)]
+        records.insert(2, 42)
+        dump.write_text(json.dumps(records), encoding="utf-8")
+
+        real_bulk = importer.create_boletas_bulk
+        calls = []
+
+        def failing_bulk(db, rows):
+            calls.append(len(rows))
+            if len(calls) == 2:
+                raise RuntimeError("corte simulado")
+            return real_bulk(db, rows)
+
+        with patch("importer.create_boletas_bulk", failing_bulk):
+            with pytest.raises(RuntimeError):
+                importer.import_file(str(dump), "test-user-id", TestingSessionLocal, chunk_size=2)
+        assert db_session.query(Boleta).filter(Boleta.user_id == "test-user-id").count() == 2
+
+        summary = importer.import_file(str(dump), "test-user-id", TestingSessionLocal, chunk_size=2)
+        assert summary["imported_now"] == 3
+        assert summary["imported"] == 5
+        assert summary["skipped"] == 1
+        assert summary["done"]
+
+        boletas = db_session.query(Boleta).filter(Boleta.user_id == "test-user-id").all()
+        assert sorted(float(b.total_amount) for b in boletas) == [1.0, 2.0, 3.0, 4.0, 5.0]
+        assert get_boletas_stats(db_session, "test-user-id")["total_boletas"] == 5
+
+        again = importer.import_file(str(dump), "test-user-id", TestingSessionLocal, chunk_size=2)
+        assert again["imported_now"] == 0
+
+class TestDedup:
+    """Tests de detección de boletas duplicadas"""
+
+    def test_fingerprint_normalization(self):
+        """Test de huella insensible a mayúsculas, tildes, signos y formato del monto"""
+        from datetime import date
+        from decimal import Decimal
+        from dedup import receipt_fingerprint
+
+        base = receipt_fingerprint("Café Haití", 1500, date(2025, 8, 10))
+        assert base == receipt_fingerprint("  CAFE  haiti!", Decimal("1500.00"), "2025-08-10")
+        assert base != receipt_fingerprint("Café Haití", 1500.01, date(2025, 8, 10))
+        assert receipt_fingerprint("Café Haití", None, date(2025, 8, 10)) is None
+        assert receipt_fingerprint("", 1500, date(2025, 8, 10)) is None
+
+    def test_create_boleta_returns_existing(self, db_session, clean_boletas):
+        """Test de create_boleta con la misma imagen y con la misma compra"""
+        from datetime import date
+        from models import Boleta
+        from crud import create_boleta, get_boletas_stats
+
+        data = {"nombre_archivo": "a.jpg", "user_id": "test-user-id", "image_hash": "h1",
+                "merchant": "Jumbo", "total_amount": 990.0, "date": date(2025, 1, 2)}
+        first = create_boleta(db_session, data)
+        assert first.duplicate is None
+
+        same_image = create_boleta(db_session, {**data, "nombre_archivo": "b.jpg", "merchant": "otro"})
+        assert (same_image.id, same_image.duplicate) == (first.id, "image")
+
+        same_purchase = create_boleta(db_session, {**data, "image_hash": "h2", "merchant": "JUMBO."})
+        assert (same_purchase.id, same_purchase.duplicate) == (first.id, "fingerprint")
+
+        other_user = create_boleta(db_session, {**data, "user_id": "other-user-id"})
+        assert other_user.id != first.id and other_user.duplicate is None
+
+        assert db_session.query(Boleta).filter(Boleta.user_id == "test-user-id").count() == 1
+        assert get_boletas_stats(db_session, "test-user-id")["total_boletas"] == 1
+
+    def test_bulk_skips_duplicates(self, db_session, clean_boletas):
+        """Test de insert masivo con duplicadas en la base y dentro del lote"""
+        from models import Boleta
+        from crud import create_boleta, create_boletas_bulk
+
+        existing = create_boleta(db_session, {"nombre_archivo": "x.jpg", "user_id": "test-user-id", "image_hash": "hx"})
+        rows = [
+            {"nombre_archivo": "0.jpg", "user_id": "test-user-id", "image_hash": "h0"},
+            {"nombre_archivo": "1.jpg", "user_id": "test-user-id", "image_hash": "hx"},
+            {"nombre_archivo": "2.jpg", "user_id": "test-user-id", "image_hash": "h0"},
+            {"nombre_archivo": "3.jpg", "user_id": "test-user-id"},
+        ]
+        boletas = create_boletas_bulk(db_session, rows)
+        assert [b.duplicate for b in boletas] == [None, "image", "image", None]
+        assert boletas[1].id == existing.id
+        assert boletas[2].id == boletas[0].id
+        assert db_session.query(Boleta).filter(Boleta.user_id == "test-user-id").count() == 3
+
+    def test_ocr_same_image_skips_ocr(self, client, auth_user, clean_boletas):
+        """Test de /ocr con una imagen ya subida: no repite el OCR"""
+        from unittest.mock import AsyncMock
+
+        ocr = AsyncMock(return_value="TIENDA DEDUP\nTOTAL 3.000")
+        with patch("main_clean.ocr_pool.image_to_string", ocr):
+            first = client.post("/ocr", files={"file": ("a.jpg", b"same-image", "image/jpeg")})
+            second = client.post("/ocr", files={"file": ("b.jpg", b"same-image", "image/jpeg")})
+
+        assert first.status_code == second.status_code == 200
+        assert first.json()["duplicate"] is None
+        assert second.json()["id"] == first.json()["id"]
+        assert second.json()["duplicate"] == "image"
+        assert ocr.await_count == 1
+
+class TestMetrics:
+    """Tests de métricas en formato Prometheus"""
+
+    def test_histogram_and_counter_render(self):
+        """Test del formato de texto de Prometheus"""
+        from metrics import Registry
+
+        registry = Registry()
+        latency = registry.histogram("demo_seconds", "Demo", ("route",), buckets=(0.1, 1.0))
+        latency.observe(0.05, route="/a")
+        latency.observe(0.5, route="/a")
+        latency.observe(5, route="/a")
+        hits = registry.counter("demo_total", "Demo")
+        hits.inc()
+        hits.inc(2)
+        registry.gauge("demo_depth", "Demo", fn=lambda: 7)
+
+        text = registry.render()
+        assert "# TYPE demo_seconds histogram" in text
+        assert 'demo_seconds_bucket{route="/a",le="0.1"} 1' in text
+        assert 'demo_seconds_bucket{route="/a",le="1.0"} 2' in text
+        assert 'demo_seconds_bucket{route="/a",le="+Inf"} 3' in text
+        assert 'demo_seconds_count{route="/a"} 3' in text
+        assert "demo_total 3" in text
+        assert "demo_depth 7" in text
+        with pytest.raises(ValueError):
+            latency.observe(1, path="/a")
+
+    def test_metrics_endpoint(self, client, auth_user, clean_boletas):
+        """Test de /metrics con latencia por ruta, etapas de OCR, pool y caches"""
+        from unittest.mock import AsyncMock
+        from metrics import OCR_STAGE_SECONDS
+
+        parse_before = OCR_STAGE_SECONDS.count(stage="parse")
+        with patch("main_clean.ocr_pool.image_to_string", AsyncMock(return_value="TIENDA METRICAS\nTOTAL 1.000")):
+            assert client.post("/ocr", files={"file": ("m.jpg", b"metrics-image", "image/jpeg")}).status_code == 200
+        assert client.get("/boletas/999999").status_code == 404
+
+        response = client.get("/metrics")
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain")
+        text = response.text
+        assert 'http_request_duration_seconds_count{method="GET",route="/boletas/{boleta_id:int}",status="404"}' in text
+        assert 'route="/ocr",status="200"' in text
+        assert OCR_STAGE_SECONDS.count(stage="parse") == parse_before + 1
+        for stage in ("upload_read", "dedup_lookup", "cache_lookup", "db_commit"):
+            assert f'ocr_stage_duration_seconds_count{{stage="{stage}"}}' in text
+        for name in ("db_pool_checkout_wait_seconds_count", 'db_pool_connections{state="checked_out"}',
+                     "ocr_pool_pending", "ocr_cache_hit_ratio", "auth_token_cache_hits_total"):
+            assert name in text
+
+class TestBenchmarkSuite:
+    """Tests de la comparación de la suite de benchmarks con su línea base"""
+
+    def test_compare_results_flags_regressions(self):
+        """Test de regresiones por encima de la tolerancia, ignorando casos omitidos o nuevos"""
+        from benchmarks.suite import compare_results
+
+        baseline = {"results": {"parser": {"value": 10.0}, "stats[10]": {"value": 4.0}, "ocr": {"value": 100.0}}}
+        current = {"results": {
+            "parser": {"value": 12.0},
+            "stats[10]": {"value": 6.0},
+            "ocr": {"skipped": "sin tesseract"},
+            "boletas[10]": {"value": 1.0},
+        }}
+        regressions = compare_results(current, baseline, tolerance=0.3)
+        assert [(name, base, value) for name, base, value, _ in regressions] == [("stats[10]", 4.0, 6.0)]
+
+class TestStartup:
+    """Tests del arranque de la API"""
+
+    def test_import_without_db_or_ocr_modules(self):
+        """Test de import de main_clean sin tocar la base ni cargar pytesseract/PIL/httpx"""
+        import os, sys, subprocess
+        from benchmarks.suite import STARTUP_SCRIPT
+
+        env = {**os.environ, "DATABASE_URL": "sqlite:////nonexistent-dir/boletas.db", "DB_CREATE_SCHEMA": "false"}
+        result = subprocess.run([sys.executable, "-c", STARTUP_SCRIPT], env=env, capture_output=True, text=True)
+        assert result.returncode == 0, result.stderr
+        assert result.stdout.splitlines()[1:] in ([], [""])
+
+    def test_create_schema(self, tmp_path):
+        """Test de create_schema (paso explícito de DB_CREATE_SCHEMA en el lifespan)"""
+        from sqlalchemy import create_engine, inspect
+        import db
+
+        engine = create_engine(f"sqlite:///{tmp_path / 'schema.db'}")
+        db.create_schema(engine)
+        tables = set(inspect(engine).get_table_names())
+        assert {"boletas", "ocr_jobs", "boleta_stats_rollup", "boletas_fts", "boleta_texts"} <= tables
+
+class TestPDF:
+    """Tests de recibos en PDF de varias páginas"""
+
+    def _pdf(self, pages=3):
+        import io
+        from PIL import Image
+
+        images = [Image.new("L", (200 + 10 * i, 300), 255) for i in range(pages)]
+        buffer = io.BytesIO()
+        images[0].save(buffer, format="PDF", save_all=True, append_images=images[1:])
+        return buffer.getvalue()
+
+    def test_ocr_pdf_page_renders_one_page(self, tmp_path):
+        """Test de rasterizado de una página a DPI controlado y limitado por max_dimension"""
+        from ocr import ocr_pdf_page
+        from pdf import render_page
+
+        path = tmp_path / "r.pdf"
+        path.write_bytes(self._pdf())
+        image, _ = render_page(str(path), 1, dpi=144)
+        assert (image.mode, image.size) == ("L", (420, 600))
+        image, _ = render_page(str(path), 1, dpi=144, max_dimension=300)
+        assert max(image.size) == 300
+
+        with patch("pytesseract.image_to_string", side_effect=lambda image, **_: f"ancho {image.size[0]}"):
+            text, timings = ocr_pdf_page(str(path), 2, dpi=72)
+        assert text == "ancho 220"
+        assert "pdf_render" in timings and "tesseract" in timings
+
+    def test_pdf_to_string_bounded_concurrency(self):
+        """Test de páginas en paralelo (a lo sumo una por proceso) unidas en orden"""
+        from ocr import OCRPool
+
+        pool = OCRPool(max_workers=2)
+        active = peak = 0
+
+        async def fake_run(fn, *args):
+            nonlocal active, peak
+            active += 1
+            peak = max(peak, active)
+            await asyncio.sleep(0.01)
+            active -= 1
+            if fn.__name__ == "ocr_pdf_page":
+                return f"pagina {args[1]}", {}
+            return fn(*args)
+
+        with patch.object(pool, "run", fake_run):
+            text = asyncio.run(pool.pdf_to_string(self._pdf(pages=5)))
+        assert text == "\n".join(f"pagina {i}" for i in range(5))
+        assert peak == 2
+
+    def test_concurrent_pdfs_share_page_slots(self):
+        """Test de varios PDFs admitidos a la vez: sus páginas no llenan la cola del pool"""
+        from ocr import OCRPool, OCRPoolSaturated
+
+        # Admisión deja pasar 2 × max_workers requests; el pool acepta 3 × max_workers tareas
+        pool = OCRPool(max_workers=3, queue_size=6)
+        pending = pages = peak_pages = 0
+
+        async def bounded_run(fn, *args):
+            nonlocal pending, pages, peak_pages
+            if pending >= pool.capacity:
+                raise OCRPoolSaturated("saturado")
+            is_page = fn.__name__ == "ocr_pdf_page"
+            pending += 1
+            pages += is_page
+            peak_pages = max(peak_pages, pages)
+            try:
+                await asyncio.sleep(0.01)
+                return (f"pagina {args[1]}", {}) if is_page else fn(*args)
+            finally:
+                pending -= 1
+                pages -= is_page
+
+        async def scenario():
+            data = self._pdf(pages=4)
+            return await asyncio.gather(*(pool.pdf_to_string(data) for _ in range(6)))
+
+        with patch.object(pool, "run", bounded_run):
+            texts = asyncio.run(scenario())
+        assert texts == ["\n".join(f"pagina {i}" for i in range(4))] * 6
+        assert peak_pages == 3
+
+    def test_invalid_or_long_pdf(self):
+        """Test de PDF dañado o con más páginas que PDF_MAX_PAGES"""
+        from ocr import OCRPool
+        from pdf import InvalidPDF
+
+        pool = OCRPool(max_workers=1)
+
+        async def inline_run(fn, *args):
+            return fn(*args)
+
+        with patch.object(pool, "run", inline_run):
+            with pytest.raises(InvalidPDF):
+                asyncio.run(pool.pdf_to_string(b"%PDF-1.4 roto"))
+            with patch("ocr.PDF_MAX_PAGES", 2), pytest.raises(InvalidPDF):
+                asyncio.run(pool.pdf_to_string(self._pdf(pages=3)))
+
+    def test_ocr_endpoint_accepts_pdf(self, client, auth_user, clean_boletas):
+        """Test de /ocr con un PDF: se procesan sus páginas y se parsea el texto unido"""
+        from unittest.mock import AsyncMock
+        from pdf import InvalidPDF
+
+        pdf_ocr = AsyncMock(return_value="FERRETERIA PDF\nTOTAL 4.500")
+        with patch("main_clean.ocr_pool.pdf_to_string", pdf_ocr):
+            response = client.post("/ocr", files={"file": ("factura.pdf", self._pdf(), "application/pdf")})
+        assert response.status_code == 200
+        assert response.json()["merchant"] == "FERRETERIA PDF"
+        assert pdf_ocr.await_count == 1
+
+        with patch("main_clean.ocr_pool.pdf_to_string", AsyncMock(side_effect=InvalidPDF("PDF inválido"))):
+            response = client.post("/ocr", files={"file": ("mala.pdf", b"%PDF-x", "application/pdf")})
+        assert response.status_code == 400
+
+class TestAdmission:
+    """Tests del control de admisión del OCR"""
+
+    def test_token_bucket_refill(self):
+        """Test de ráfaga, recarga por tiempo y espera informada"""
+        from admission import TokenBucket
+
+        bucket = TokenBucket(rate=1.0, burst=2)
+        assert bucket.take("u", now=0) == 0
+        assert bucket.take("u", now=0) == 0
+        assert bucket.take("u", now=0) == pytest.approx(1.0)
+        assert bucket.take("otro", now=0) == 0
+        assert bucket.take("u", now=1.5) == 0
+        # Un lote más grande que la ráfaga se mide contra la ráfaga
+        assert bucket.take("u", cost=5, now=1.5) == pytest.approx(1.5)
+
+    def test_token_bucket_charges_batch_larger_than_burst(self):
+        """Test de lote más grande que la ráfaga: se cobra entero y el siguiente espera"""
+        from admission import AdmissionController, RateLimited, TokenBucket
+
+        bucket = TokenBucket(rate=1.0, burst=2)
+        assert bucket.take("u", cost=5, now=0) == 0
+        # Debe 3 tokens: necesita 3 + 1 para la próxima imagen
+        assert bucket.take("u", now=0) == pytest.approx(4.0)
+        assert bucket.take("u", now=4) == 0
+
+        controller = AdmissionController(rate_per_minute=60, burst=20)
+        controller.check_rate("v", cost=21)
+        with pytest.raises(RateLimited) as excinfo:
+            controller.check_rate("v", cost=21)
+        assert excinfo.value.status_code == 429 and excinfo.value.retry_after >= 20
+
+    def test_token_bucket_evicts_oldest_user(self):
+        """Test de límite de usuarios en memoria"""
+        from admission import TokenBucket
+
+        bucket = TokenBucket(rate=0.001, burst=1, max_keys=2)
+        for user in ("a", "b", "c"):
+            assert bucket.take(user, now=0) == 0
+        assert bucket.take("a", now=0) == 0      # descartado: vuelve lleno
+        assert bucket.take("c", now=0) > 0
+
+    def test_slot_queue_and_handoff(self):
+        """Test de cupo global: espera en cola, entrega en orden y 503 con la cola llena"""
+        from admission import AdmissionController, Overloaded
+
+        controller = AdmissionController(max_in_flight=1, max_waiting=1, wait_timeout=5)
+        order = []
+
+        async def work(name, seconds):
+            async with controller.slot():
+                order.append(name)
+                await asyncio.sleep(seconds)
+
+        async def scenario():
+            first = asyncio.create_task(work("a", 0.05))
+            await asyncio.sleep(0)
+            second = asyncio.create_task(work("b", 0))
+            await asyncio.sleep(0)
+            assert (controller.in_flight, controller.waiting) == (1, 1)
+            with pytest.raises(Overloaded) as excinfo:
+                await work("c", 0)
+            assert excinfo.value.status_code == 503 and excinfo.value.retry_after >= 1
+            await asyncio.gather(first, second)
+
+        asyncio.run(scenario())
+        assert order == ["a", "b"]
+        assert (controller.in_flight, controller.waiting) == (0, 0)
+
+    def test_slot_wait_timeout(self):
+        """Test de espera máxima por un cupo"""
+        from admission import AdmissionController, Overloaded
+
+        controller = AdmissionController(max_in_flight=1, max_waiting=4, wait_timeout=0.01)
+
+        async def scenario():
+            async with controller.slot():
+                with pytest.raises(Overloaded):
+                    async with controller.slot():
+                        pass
+            assert (controller.in_flight, controller.waiting) == (0, 0)
+
+        asyncio.run(scenario())
+
+    def test_ocr_rate_limited_returns_429(self, client, auth_user, clean_boletas):
+        """Test de /ocr con la cuota agotada: 429 con Retry-After sin llegar al OCR"""
+        from unittest.mock import AsyncMock
+        from admission import AdmissionController
+
+        ocr = AsyncMock(return_value="TIENDA\nTOTAL 1.000")
+        with patch("main_clean.ocr_admission", AdmissionController(rate_per_minute=1, burst=1)), \
+                patch("main_clean.ocr_pool.image_to_string", ocr):
+            first = client.post("/ocr", files={"file": ("a.jpg", b"imagen-a", "image/jpeg")})
+            second = client.post("/ocr", files={"file": ("b.jpg", b"imagen-b", "image/jpeg")})
+        assert first.status_code == 200
+        assert second.status_code == 429
+        assert int(second.headers["Retry-After"]) >= 1
+        assert ocr.await_count == 1
+
+class TestConditionalGet:
+    """Tests de ETag, 304 y cache de respuestas de /boletas y /boletas/stats"""
+
+    def _create(self, db_session, name="1.jpg", amount=100):
+        from crud import create_boleta
+        return create_boleta(db_session, {
+            "nombre_archivo": name, "user_id": "test-user-id", "merchant": "LIDER", "total_amount": amount
+        })
+
+    def test_version_bumps_on_create_and_delete(self, db_session, clean_boletas):
+        """Test de versión por usuario en altas, lotes y bajas"""
+        from crud import get_boletas_version, create_boletas_bulk, delete_boleta
+
+        versions = [get_boletas_version(db_session, "test-user-id")]
+        assert versions == [0]
+        boleta = self._create(db_session)
+        versions.append(get_boletas_version(db_session, "test-user-id"))
+        create_boletas_bulk(db_session, [
+            {"nombre_archivo": "2.jpg", "user_id": "test-user-id"},
+            {"nombre_archivo": "3.jpg", "user_id": "test-user-id"}
+        ])
+        versions.append(get_boletas_version(db_session, "test-user-id"))
+        assert delete_boleta(db_session, boleta.id, "test-user-id")
+        versions.append(get_boletas_version(db_session, "test-user-id"))
+        assert versions == sorted(set(versions))
+        assert get_boletas_version(db_session, "other-user-id") == 0
+
+    def test_version_bumps_on_direct_writes(self, db_session, clean_boletas):
+        """Test de versión con escrituras fuera de la API (p.ej. el dashboard vía Supabase)"""
+        from sqlalchemy import text as sql
+        from crud import get_boletas_version
+
+        def version_after(statement, **params):
+            before = get_boletas_version(db_session, "test-user-id")
+            db_session.execute(sql(statement), params)
+            db_session.commit()
+            return get_boletas_version(db_session, "test-user-id") > before
+
+        assert version_after(
+            "INSERT INTO boletas (nombre_archivo, merchant, fecha, user_id) "
+            "VALUES ('d.jpg', 'LIDER', '2024-01-01', 'test-user-id')"
+        )
+        assert version_after("UPDATE boletas SET merchant = 'JUMBO' WHERE nombre_archivo = 'd.jpg'")
+        # Cambiar de dueño cambia las boletas de los dos usuarios
+        other = get_boletas_version(db_session, "other-user-id")
+        assert version_after("UPDATE boletas SET user_id = 'other-user-id' WHERE nombre_archivo = 'd.jpg'")
+        assert get_boletas_version(db_session, "other-user-id") > other
+        assert version_after("UPDATE boletas SET user_id = 'test-user-id' WHERE nombre_archivo = 'd.jpg'")
+        assert version_after("DELETE FROM boletas WHERE nombre_archivo = 'd.jpg'")
+
+    def test_etag_and_not_modified(self, client, auth_user, db_session, clean_boletas):
+        """Test de If-None-Match: 304 sin cambios, 200 con un ETag nuevo tras una escritura"""
+        self._create(db_session)
+        for url in ("/boletas", "/boletas/stats"):
+            first = client.get(url)
+            assert first.status_code == 200
+            etag = first.headers["ETag"]
+
+            unchanged = client.get(url, headers={"If-None-Match": etag})
+            assert unchanged.status_code == 304
+            assert unchanged.headers["ETag"] == etag
+            assert client.get(url, headers={"If-None-Match": f'"otro", W/{etag}'}).status_code == 304
+
+        # Otros parámetros, otro ETag
+        assert client.get("/boletas?limit=5").headers["ETag"] != client.get("/boletas").headers["ETag"]
+
+        etag = client.get("/boletas/stats").headers["ETag"]
+        self._create(db_session, name="2.jpg", amount=50)
+        changed = client.get("/boletas/stats", headers={"If-None-Match": etag})
+        assert changed.status_code == 200
+        assert changed.headers["ETag"] != etag
+        assert changed.json()["total_boletas"] == 2
+
+    def test_unchanged_poll_served_from_cache(self, client, auth_user, db_session, clean_boletas):
+        """Test de cache: la segunda lectura sin cambios no consulta las boletas"""
+        self._create(db_session)
+        first = client.get("/boletas?include_text=true")
+        with patch("main_clean.list_boletas", side_effect=AssertionError("consulta")):
+            second = client.get("/boletas?include_text=true")
+        assert second.status_code == 200
+        assert second.json() == first.json()
+        assert second.headers["ETag"] == first.headers["ETag"]
+
+    def test_etag_matches(self):
+        """Test de parsing de If-None-Match"""
+        from http_cache import etag_matches
+
+        assert etag_matches('"a", "b"', '"b"')
+        assert etag_matches('W/"b"', '"b"')
+        assert etag_matches("*", '"b"')
+        assert not etag_matches(None, '"b"')
+        assert not etag_matches('"bb"', '"b"')
+
+    def test_response_cache_bounded(self):
+        """Test de LRU acotado por bytes"""
+        from http_cache import ResponseCache
+
+        cache = ResponseCache(max_bytes=1000)
+        for i in range(5):
+            cache.put(f'"{i}"', b"x" * 200)
+        assert cache.size_bytes <= 1000
+        assert cache.get('"0"') is None
+        assert cache.get('"4"') == b"x" * 200
+        cache.put('"grande"', b"x" * 2000)
+        assert cache.get('"grande"') is None
+
+class TestCompression:
+    """Tests de compresión de respuestas y serialización con orjson"""
+
+    def test_choose_encoding(self):
+        """Test de negociación de Accept-Encoding"""
+        from compression import choose_encoding
+
+        assert choose_encoding("gzip, deflate, br") == "br"
+        assert choose_encoding("gzip;q=1.0, br;q=0.5") == "gzip"
+        assert choose_encoding("br;q=0, gzip;q=0") is None
+        assert choose_encoding("*") == "br"
+        assert choose_encoding("identity") is None
+        assert choose_encoding(None) is None
+        assert choose_encoding("br, gzip", brotli_available=False) == "gzip"
+
+    @pytest.mark.parametrize("encoding", ["br", "gzip"])
+    def test_large_response_compressed(self, client, auth_user, db_session, clean_boletas, encoding):
+        """Test de /boletas con texto OCR: comprimida, ETag débil y 304 con ese ETag"""
+        if encoding == "br":
+            pytest.importorskip("brotli")
+        from crud import create_boletas_bulk
+
+        create_boletas_bulk(db_session, [
+            {"nombre_archivo": f"{i}.jpg", "user_id": "test-user-id", "text": f"LIDER {i}\nTOTAL 1.000\n" * 40}
+            for i in range(10)
+        ])
+        response = client.get("/boletas?include_text=true", headers={"Accept-Encoding": encoding})
+        assert response.status_code == 200
+        assert response.headers["content-encoding"] == encoding
+        assert int(response.headers["content-length"]) < len(response.content)
+        assert "accept-encoding" in response.headers["vary"].lower()
+        assert len(response.json()["items"]) == 10
+
+        etag = response.headers["ETag"]
+        assert etag.startswith('W/"')
+        unchanged = client.get("/boletas?include_text=true", headers={"If-None-Match": etag, "Accept-Encoding": encoding})
+        assert unchanged.status_code == 304
+
+    def test_small_response_not_compressed(self, client):
+        """Test de respuestas por debajo de COMPRESS_MIN_BYTES"""
+        response = client.get("/health", headers={"Accept-Encoding": "br, gzip"})
+        assert response.status_code == 200
+        assert "content-encoding" not in response.headers
+        assert response.headers["content-type"] == "application/json"
+
+class TestBoletaTexts:
+    """Tests del texto OCR comprimido en boleta_texts"""
+
+    def test_text_stored_compressed_outside_boletas(self, db_session, clean_boletas):
+        """Test de que el texto va comprimido a boleta_texts y no a boletas"""
+        import zlib
+        from sqlalchemy import text as sql
+        from crud import create_boleta
+        from models import Boleta
+
+        assert "text" not in Boleta.__table__.columns
+        ocr_text = "SUPERMERCADO LIDER\nLECHE 1.000\n" * 50
+        boleta = create_boleta(db_session, {"nombre_archivo": "a.jpg", "user_id": "test-user-id", "text": ocr_text})
+        assert boleta.text == ocr_text
+
+        raw, size = db_session.execute(
+            sql("SELECT text, text_size FROM boleta_texts WHERE boleta_id = :id"), {"id": boleta.id}
+        ).one()
+        assert size == len(ocr_text.encode("utf-8"))
+        assert len(raw) < size / 10
+        assert zlib.decompress(raw).decode("utf-8") == ocr_text
+
+    def test_text_loaded_lazily(self, db_session, clean_boletas):
+        """Test de que listas y estadísticas no leen boleta_texts y el detalle sí"""
+        from sqlalchemy import select
+        from crud import create_boleta, get_boleta_by_id, BOLETA_SUMMARY_COLUMNS
+        from models import Boleta
+
+        boleta = create_boleta(db_session, {"nombre_archivo": "a.jpg", "user_id": "test-user-id", "text": "hola"})
+        db_session.expire_all()
+
+        assert "boleta_texts" not in str(select(Boleta))
+        assert "boleta_texts" not in str(select(*BOLETA_SUMMARY_COLUMNS))
+        loaded = db_session.get(Boleta, boleta.id)
+        assert "text" not in loaded.__dict__
+        assert loaded.text == "hola"
+
+        db_session.expire_all()
+        detail = get_boleta_by_id(db_session, boleta.id, "test-user-id")
+        assert detail.__dict__["text"] == "hola"
+
+    def test_bulk_duplicates_and_delete(self, db_session, clean_boletas):
+        """Test de lotes sin texto, duplicadas con el texto original y borrado del texto"""
+        from sqlalchemy import text as sql
+        from crud import create_boletas_bulk, delete_boleta
+
+        first, copy, empty = create_boletas_bulk(db_session, [
+            {"nombre_archivo": "1.jpg", "user_id": "test-user-id", "image_hash": "h1", "text": "uno"},
+            {"nombre_archivo": "1b.jpg", "user_id": "test-user-id", "image_hash": "h1", "text": "otro"},
+            {"nombre_archivo": "2.jpg", "user_id": "test-user-id"},
+        ])
+        assert (first.text, copy.text, copy.duplicate, empty.text) == ("uno", "uno", "image", None)
+
+        assert delete_boleta(db_session, first.id, "test-user-id")
+        remaining = db_session.execute(sql("SELECT boleta_id FROM boleta_texts WHERE boleta_id IN (:a, :b)"),
+                                       {"a": first.id, "b": empty.id}).scalars().all()
+        assert remaining == [empty.id]
+        assert db_session.execute(sql("SELECT count(*) FROM boletas_fts WHERE rowid = :id"), {"id": first.id}).scalar() == 0
+
+    def test_migrate_legacy_text_column(self, tmp_path):
+        """Test de `python boleta_texts.py migrate` sobre boletas con la columna text anterior"""
+        from sqlalchemy import create_engine, text as sql
+        from sqlalchemy.orm import sessionmaker
+        from boleta_texts import migrate_texts
+        from models import Boleta, BoletaVersion
+        import db
+
+        engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+        db.create_schema(engine)
+        with engine.begin() as connection:
+            connection.execute(sql("ALTER TABLE boletas ADD COLUMN text TEXT"))
+            for i in range(5):
+                connection.execute(sql(
+                    "INSERT INTO boletas (nombre_archivo, text, merchant, fecha, user_id) "
+                    "VALUES (:name, :text, 'LIDER', '2024-01-01', :user_id)"
+                ), {"name": f"{i}.jpg", "text": f"texto {i}" if i else None, "user_id": "u" if i < 3 else "v"})
+            # Boletas anteriores a los triggers de versión
+            connection.execute(sql("DELETE FROM boleta_versions"))
+
+        session = sessionmaker(bind=engine)()
+        try:
+            assert migrate_texts(session, batch_size=2) == 5
+            assert migrate_texts(session) == 0
+            texts = [boleta.text for boleta in session.query(Boleta).order_by(Boleta.id)]
+            assert texts == [None, "texto 1", "texto 2", "texto 3", "texto 4"]
+            # Lotes {u}, {u, v}, {v}: cada uno invalida los ETags de sus usuarios
+            versions = dict(session.query(BoletaVersion.user_id, BoletaVersion.version))
+            assert versions == {"u": 2, "v": 2}
+        finally:
+            session.close()
+
+    def test_text_moved_by_postgres_trigger(self, db_session, clean_boletas):
+        """Test de lectura del UTF-8 sin comprimir que deja el trigger de sql/007"""
+        from sqlalchemy import text as sql
+        from sqlalchemy.dialects import postgresql
+        from crud import create_boleta, get_boleta_by_id
+        from boleta_texts import insert_statements
+
+        boleta = create_boleta(db_session, {"nombre_archivo": "a.jpg", "user_id": "test-user-id"})
+        db_session.execute(sql("UPDATE boleta_texts SET text = :raw, text_size = 11 WHERE boleta_id = :id"),
+                           {"raw": "TOTAL ñandú".encode("utf-8"), "id": boleta.id})
+        db_session.commit()
+        db_session.expire_all()
+        assert get_boleta_by_id(db_session, boleta.id, "test-user-id").text == "TOTAL ñandú"
+
+        # La API reemplaza el registro que el trigger crea al insertar la boleta
+        (statement,) = insert_statements("postgresql", [(1, "LIDER", "hola")])
+        assert "ON CONFLICT (boleta_id) DO UPDATE" in str(statement.compile(dialect=postgresql.dialect()))
+
 if __name__ == "__main__":
     pytest.main([__file__])
@@ -0,0 +1,68 @@
+from typing import Iterable
+
+from sqlalchemy import event, select
+
+from models import Boleta, BoletaVersion
+
+# Versión por usuario de sus boletas: cambia con cada alta, cambio o baja y
+# se usa como ETag de las rutas de lectura (ver http_cache.py). La
+# incrementan triggers sobre `boletas` (sql/006_boleta_versions.sql en
+# Postgres, SQLITE_VERSION_TRIGGERS en SQLite), así también cuentan las
+# escrituras que no pasan por la API, como las del dashboard con Supabase.
+
+_versions = BoletaVersion.__table__
+
+def bump_statement(dialect_name: str, user_ids: Iterable[str]):
+    """
+    INSERT ... ON CONFLICT que incrementa la versión de los usuarios.
+
+    Para cambios que no pasan por `boletas` y sus triggers (reconstrucción
+    de agregados, migración de textos).
+
+    Args:
+        dialect_name: Dialecto de la conexión ('postgresql' o 'sqlite')
+        user_ids: Usuarios cuyas boletas cambiaron
+    """
+    if dialect_name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect_name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise NotImplementedError(f"Dialecto no soportado para versiones: {dialect_name}")
+
+    rows = [{"user_id": user_id, "version": 1} for user_id in sorted(set(user_ids))]
+    stmt = insert(_versions).values(rows)
+    return stmt.on_conflict_do_update(
+        index_elements=["user_id"],
+        set_={"version": _versions.c.version + 1}
+    )
+
+def _sqlite_bump(user_id: str) -> str:
+    return (
+        f"INSERT INTO boleta_versions (user_id, version) VALUES ({user_id}, 1) "
+        "ON CONFLICT(user_id) DO UPDATE SET version = version + 1;"
+    )
+
+# Triggers por fila de SQLite (desarrollo y tests)
+SQLITE_VERSION_TRIGGERS = (
+    "CREATE TRIGGER IF NOT EXISTS boleta_versions_ai AFTER INSERT ON boletas BEGIN "
+    + _sqlite_bump("new.user_id") + " END",
+    "CREATE TRIGGER IF NOT EXISTS boleta_versions_au AFTER UPDATE ON boletas BEGIN "
+    + _sqlite_bump("new.user_id")
+    + " INSERT INTO boleta_versions (user_id, version) SELECT old.user_id, 1 WHERE old.user_id IS NOT new.user_id"
+    " ON CONFLICT(user_id) DO UPDATE SET version = version + 1; END",
+    "CREATE TRIGGER IF NOT EXISTS boleta_versions_ad AFTER DELETE ON boletas BEGIN "
+    + _sqlite_bump("old.user_id") + " END",
+)
+
+@event.listens_for(Boleta.__table__, "after_create")
+def create_sqlite_version_triggers(target, connection, **kw):
+    """Crea los triggers de versión al crear `boletas` en SQLite."""
+    if connection.dialect.name != "sqlite":
+        return
+    for statement in SQLITE_VERSION_TRIGGERS:
+        connection.exec_driver_sql(statement)
+
+def version_statement(user_id: str):
+    """Versión actual de un usuario (sin fila = 0)."""
+    return select(BoletaVersion.version).where(BoletaVersion.user_id == user_id)